@@ -1,133 +1,223 @@
-import html
+import argparse
 import logging
 import os
 import re
 import sys
 import json
-import shutil
-from typing import Optional, List, Dict
-
-import pyperclip
-import yaml
-
-from export_for_ai.folder_exporter import export_folder_content, minify_code
-from export_for_ai.tree_visualizer import get_tree_structure
-
-
-def setup_logging() -> None:
-    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
-
-
-def parse_arguments() -> Dict[str, str]:
-    args = {}
-    if len(sys.argv) == 3 and sys.argv[1] == '--config':
-        args['config_path'] = sys.argv[2]
-    elif len(sys.argv) == 2:
-        args['directory_path'] = os.path.abspath(sys.argv[1])
-    else:
-        # This is the error message you were seeing
+import time
+from dataclasses import replace
+from typing import TYPE_CHECKING, Any, Optional, List, Dict
+
+from export_for_ai.metrics import metrics
+from export_for_ai.options import (
+    DEFAULT_CLIPBOARD_MAX_BYTES,
+    ExportOptions,
+    add_export_arguments,
+    options_from_arguments,
+    options_to_dict,
+)
+from export_for_ai.repository_export import (
+    RepositoryResult,
+    export_from_watcher,
+    iter_batch_export,
+    process_single_repository,
+    setup_logging,
+    validate_directory,
+)
+
+if TYPE_CHECKING:
+    from export_for_ai.watcher import RepositoryWatcher
+
+
+def parse_arguments() -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(
+        prog="export-for-ai",
+        usage="export-for-ai <directory_path> OR export-for-ai --config <config_path>",
+    )
+    parser.add_argument("directory_path", nargs="?")
+    parser.add_argument("--config", dest="config_path")
+    parser.add_argument(
+        "--clipboard", action="store_true",
+        help="Copy the generated markdown to the clipboard (single directory mode)",
+    )
+    parser.add_argument(
+        "--clipboard-max-bytes", type=int, default=DEFAULT_CLIPBOARD_MAX_BYTES,
+        help="Skip the clipboard copy when the export is larger than this",
+    )
+    add_export_arguments(parser)
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Number of repositories exported in parallel (--config mode)",
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and re-export whenever the repositories change",
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Start the background export daemon if it is not running and export through it",
+    )
+    parser.add_argument(
+        "--no-daemon", action="store_true",
+        help="Export in this process even when the export daemon is running",
+    )
+    parser.add_argument(
+        "--profile", metavar="PATH", default=None,
+        help="Write a cProfile dump of the run to PATH (batch workers are not profiled)",
+    )
+    parsed = parser.parse_args()
+
+    if bool(parsed.directory_path) == bool(parsed.config_path):
         logging.error("Usage: export-for-ai <directory_path> OR export-for-ai --config <config_path>")
         sys.exit(1)
+
+    args = {
+        "options": options_from_arguments(parsed),
+        "max_workers": parsed.workers,
+        "watch": parsed.watch,
+        "clipboard": parsed.clipboard,
+        "clipboard_max_bytes": parsed.clipboard_max_bytes,
+        "profile": parsed.profile,
+        "daemon": parsed.daemon,
+        "no_daemon": parsed.no_daemon,
+    }
+    if parsed.config_path:
+        args['config_path'] = parsed.config_path
+    else:
+        args['directory_path'] = os.path.abspath(parsed.directory_path)
     return args
 
 
-def validate_directory(directory_path: str) -> bool:
-    if not os.path.isdir(directory_path):
-        logging.error(f"Error: '{directory_path}' is not a valid directory")
-        return False
-    return True
+def watch_repositories(
+    repositories: List[str],
+    export_destination: Optional[str] = None,
+    options: Optional[ExportOptions] = None,
+) -> None:
+    """Exports the repositories, then re-exports each one whenever it changes, until interrupted."""
 
+    from export_for_ai.watcher import WatchService
 
-def get_folder_name(directory_path: str) -> str:
-    return os.path.basename(os.path.abspath(directory_path))
+    def on_update(watcher: "RepositoryWatcher") -> None:
+        result = export_from_watcher(watcher, export_destination)
+        if result.ok:
+            logging.info(f"Updated export: {result.output_path}")
+        else:
+            logging.error(f"Failed to export '{result.repo_path}': {result.error}")
 
+    service = WatchService(options, on_update=on_update)
+    service.sync(repositories)
+    for watcher in list(service.watchers.values()):
+        on_update(watcher)
 
-def create_export_directory(directory_path: str) -> Optional[tuple[str, str]]:
-    folder_name = get_folder_name(directory_path)
-    export_dir_name = f"exported-from-{folder_name}"
-    export_dir_path = os.path.join(directory_path, export_dir_name)
-
+    logging.info("Watching for changes. Press Ctrl+C to stop.")
     try:
-        os.makedirs(export_dir_path, exist_ok=True)
-        return export_dir_path, folder_name
-    except OSError as e:
-        logging.error(f"Error creating temporary export directory: {e}")
-        return None
-
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info("Stopping watchers...")
+    finally:
+        service.stop()
 
-def export_project_md(
-    tree_structure: str, folder_contents: str, export_dir: str, folder_name: str
-) -> Optional[str]:
-    """
-    Combines tree structure and folder contents into project-....md file.
-    Returns the path to the created file.
-    """
-    try:
-        dynamic_sections = """
-# Previous step
-
-# The goal
-
-# Core Design Philosophy
-Seek a most minimal, simple, fewest LOC, lowest complexity design plans or paths to the required functionality. Preserve the robust, clutter-free design, and avoid any code, features, or decorations that do not directly contribute to the strictly essential functionality. It must be raw, and should aim to retain most or all existing functionality, unless the task is to, or requires that you, remove it. Aim to avoid creating divergent code pathways, and instead seek unified routes without branching where possible. Don't attempt to improvise, innovate, make unspecified improvements or changes, or move outside the scope of your specified task. Do not blindly follow the task instructions and analysis. Verify for yourself that the conclusions are accurate, and will not cause unanticipated side effects.
-"""
-        content = (
-            f"{dynamic_sections}"
-            "\n\n# SolutionTreeView \n```\n"
-            f"{tree_structure}\n"
-            "```\n\n"
-            "\n\n# Entire Solution Code start \n"
-            f"{folder_contents}\n"
-            "# EntireSolution Code end \n"
-        )
 
-        project_md_filename = f"project-{folder_name}.md"
-        project_md_path = os.path.join(export_dir, project_md_filename)
-        with open(project_md_path, "w", encoding="utf-8") as f:
-            f.write(content)
-        logging.info(f"Generated '{project_md_filename}' in {export_dir}")
+def main() -> None:
+    setup_logging()
+    args = parse_arguments()
+    profiler = None
+    if args['profile']:
+        import cProfile
 
-        try:
-            pyperclip.copy(content)
-            logging.info("Content for clipboard updated.")
-        except Exception as e:
-            logging.warning(f"Could not copy to clipboard: {e}")
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args['profile'])
+            logging.info(f"Profile written to {args['profile']} (inspect with python -m pstats)")
+        logging.info(metrics.summary())
 
-        return project_md_path
-    except Exception as e:
-        logging.error(f"Error exporting project.md: {e}")
-        return None
 
-def process_single_repository(directory_path: str) -> Optional[str]:
-    """Processes a single repository and returns the path to the generated markdown file."""
-    if not validate_directory(directory_path):
-        return None
+def run_with_daemon(args: Dict[str, Any], start: bool = False) -> bool:
+    """
+    Sends the export to the background daemon, which keeps repository models warm between runs.
 
-    logging.info(f"--- Processing repository: {directory_path} ---")
+    :param args: The parsed command line arguments.
+    :param start: Start the daemon if none is running; otherwise only a running one is used.
+    :return: True if the daemon ran the export, False if the caller should export in-process.
+    """
+    from export_for_ai import export_daemon
 
-    export_dir, folder_name = create_export_directory(directory_path)
-    if export_dir is None:
-        return None
+    if 'config_path' in args:
+        try:
+            with open(args['config_path'], 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # Reported by the in-process run
+            return False
+        if config.get("dedupe"):
+            # Shared content across repositories is only planned by the batch engine
+            return False
+        repositories = config.get("repositories", [])
+        export_destination = config.get("export_destination")
+        if not repositories or not export_destination or not os.path.isdir(export_destination):
+            return False
+    else:
+        repositories = [args['directory_path']]
+        export_destination = None
 
-    logging.info("Exporting directory structure...")
-    tree_structure = get_tree_structure(directory_path)
+    try:
+        if start:
+            state = export_daemon.ensure_daemon()
+        else:
+            state = export_daemon.read_state()
+            if not state:
+                return False
+        response = export_daemon.send_request(
+            "export",
+            state,
+            repositories=[os.path.abspath(path) for path in repositories],
+            export_destination=export_destination and os.path.abspath(export_destination),
+            options=options_to_dict(args['options']),
+            clipboard=args['clipboard'],
+            clipboard_max_bytes=args['clipboard_max_bytes'],
+        )
+    except (OSError, RuntimeError) as e:
+        log = logging.warning if start else logging.debug
+        log(f"Export daemon unavailable, exporting in-process: {e}")
+        return False
+    if not response.get("ok"):
+        logging.warning(f"Export daemon error, exporting in-process: {response.get('error')}")
+        return False
+    for result in response["results"]:
+        result = RepositoryResult(**result)
+        metrics.merge(result.metrics)
+        if result.ok:
+            logging.info(f"Exported '{result.repo_path}' to {result.output_path}")
+        else:
+            logging.error(f"Failed to export '{result.repo_path}': {result.error}")
+    return True
 
-    logging.info("Exporting folder contents...")
-    folder_contents = export_folder_content(directory_path)
 
-    if tree_structure and folder_contents:
-        md_file_path = export_project_md(tree_structure, folder_contents, export_dir, folder_name)
-        return md_file_path
-    
-    return None
+def run(args: Dict[str, Any]) -> None:
 
+    # A running daemon (the tray app's, or one started with --daemon) serves the export
+    # from its warm models; without one the export runs here
+    use_daemon = not (args['watch'] or args['no_daemon'] or args['profile'])
+    if use_daemon and run_with_daemon(args, start=args['daemon']):
+        return
 
-def main() -> None:
-    setup_logging()
-    args = parse_arguments()
+    if 'directory_path' in args and args['watch']:
+        if validate_directory(args['directory_path']):
+            watch_repositories([args['directory_path']], options=args['options'])
 
-    if 'directory_path' in args:
-        md_file = process_single_repository(args['directory_path'])
+    elif 'directory_path' in args:
+        md_file = process_single_repository(
+            args['directory_path'],
+            options=args['options'],
+            copy_to_clipboard=args['clipboard'],
+            clipboard_max_bytes=args['clipboard_max_bytes'],
+        )
         if md_file:
             logging.info(f"\nExport completed successfully.")
             logging.info(f"Final file path: {md_file}")
@@ -151,16 +241,21 @@ def main() -> None:
             logging.info(f"Loaded {len(repositories)} repositories from config.")
             logging.info(f"Aggregated export destination: {export_destination}")
 
-            for repo_path in repositories:
-                md_file_path = process_single_repository(repo_path)
-                if md_file_path:
-                    try:
-                        shutil.copy(md_file_path, export_destination)
-                        logging.info(f"Copied '{os.path.basename(md_file_path)}' to {export_destination}\n")
-                        shutil.rmtree(os.path.dirname(md_file_path))
-                    except (shutil.Error, IOError) as e:
-                        logging.error(f"Failed to copy '{md_file_path}' to destination: {e}\n")
-            
+            options = args['options']
+            if config.get("dedupe"):
+                options = replace(options, dedupe=True)
+
+            if args['watch']:
+                watch_repositories(repositories, export_destination, options)
+                return
+
+            max_workers = args['max_workers'] or config.get("max_workers")
+            for result in iter_batch_export(repositories, export_destination, options, max_workers):
+                if result.ok:
+                    logging.info(f"Exported '{os.path.basename(result.output_path)}' to {export_destination}\n")
+                else:
+                    logging.error(f"Failed to export '{result.repo_path}': {result.error}\n")
+
             logging.info("All repositories processed.")
 
         except FileNotFoundError:
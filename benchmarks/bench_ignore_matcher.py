@@ -0,0 +1,67 @@
+"""
+Micro-benchmark for ignore matching throughput.
+
+Compares pathspec.PathSpec.match_file with export_for_ai's IgnoreMatcher on
+synthetic repository paths, using the default ignore patterns plus a few
+user patterns.
+
+Usage: python benchmarks/bench_ignore_matcher.py [path_count]
+"""
+import os
+import random
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from pathspec import PathSpec  # noqa: E402
+from pathspec.patterns import GitWildMatchPattern  # noqa: E402
+
+from export_for_ai.ignore_parser import DEFAULT_IGNORE_PATTERNS, IgnoreMatcher  # noqa: E402
+
+USER_PATTERNS = ["node_modules/", "*.min.js", "docs/generated/", "!keep.log", "fixtures/**/*.json"]
+DIR_NAMES = ["src", "lib", "app", "core", "utils", "tests", "docs", "fixtures", "node_modules", "build", "api"]
+FILE_NAMES = ["main.py", "index.ts", "util.js", "app.min.js", "README.md", "data.json", "run.log", "image.png"]
+
+
+def generate_paths(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        depth = rng.randint(0, 6)
+        parts = [rng.choice(DIR_NAMES) for _ in range(depth)]
+        parts.append(rng.choice(FILE_NAMES))
+        paths.append("/".join(parts))
+    return paths
+
+
+def measure(label: str, match, paths: list) -> list:
+    start = time.perf_counter()
+    results = [match(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed:8.3f} s  {len(paths) / elapsed:12,.0f} paths/s")
+    return results
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    patterns = DEFAULT_IGNORE_PATTERNS + USER_PATTERNS
+    paths = generate_paths(count)
+    print(f"{count:,} paths, {len(patterns)} patterns")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        spec = PathSpec.from_lines(GitWildMatchPattern, patterns)
+        matcher = IgnoreMatcher(patterns)
+
+    expected = measure("PathSpec", spec.match_file, paths)
+    actual = measure("IgnoreMatcher", matcher.match_file, paths)
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Import-time benchmark of the command line entry points.
+
+Each entry module is imported in a fresh interpreter started with
+``python -X importtime``, several times, and the fastest cumulative import
+time is compared against a budget. The run also fails if a module that
+only some features need (clipboard, YAML config, process pool, profiler,
+web UI, pathspec, the cache database, the output writers, dedupe, git) is
+loaded at import, since that cost is paid by every CLI call. Interpreter
+startup without any import is reported alongside.
+
+Usage: python benchmarks/bench_import.py [--budget-ms 100] [--repeat 7] [module ...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_MODULES = ("app_main", "export_for_ai.main", "export_for_ai.export_daemon")
+# Loaded on demand by the features that need them
+LAZY_MODULES = (
+    "pyperclip", "yaml", "anytree", "pathspec", "multiprocessing", "cProfile",
+    "fastapi", "uvicorn", "requests", "web_ui", "export_for_ai.minifier",
+    "sqlite3", "gzip", "export_for_ai.writers", "export_for_ai.dedupe", "export_for_ai.git_diff",
+)
+DEFAULT_BUDGET_MS = 100.0
+
+
+def _environment() -> dict:
+    env = dict(os.environ)
+    paths = [os.path.join(ROOT, "src"), ROOT]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
+
+
+def interpreter_startup(repeat: int) -> float:
+    """Returns the fastest wall time, in milliseconds, of starting Python without imports."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Imports ``module`` ``repeat`` times and returns its fastest import time and loaded modules."""
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    best = None
+    loaded = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, env=_environment(), cwd=ROOT,
+        )
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+        loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+        # The importtime line of the module itself carries its cumulative time
+        for line in completed.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                micros = int(fields[1])
+                best = micros if best is None else min(best, micros)
+    lazy = sorted(
+        name for name in loaded
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    return {"import_ms": None if best is None else round(best / 1000, 1), "eager_lazy_modules": lazy}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the import time of the CLI entry points.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_MODULES))
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    result = {
+        "python": sys.version.split()[0],
+        "budget_ms": args.budget_ms,
+        "interpreter_startup_ms": round(interpreter_startup(args.repeat), 1),
+        "modules": {module: measure(module, args.repeat) for module in args.modules},
+    }
+    print(json.dumps(result, indent=2))
+
+    failed = False
+    for module, measured in result["modules"].items():
+        if "error" in measured:
+            print(f"{module}: import failed: {measured['error']}", file=sys.stderr)
+            failed = True
+            continue
+        if measured["import_ms"] is not None and measured["import_ms"] > args.budget_ms:
+            print(f"{module}: {measured['import_ms']} ms exceeds the {args.budget_ms} ms budget", file=sys.stderr)
+            failed = True
+        if measured["eager_lazy_modules"]:
+            print(f"{module}: loads {', '.join(measured['eager_lazy_modules'])} at import", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark of the export pipeline on a synthetic repository.
+
+Generates a repository with benchmarks/synthetic_repo.py (or uses an existing
+one with --repo) and times each stage separately: the directory scan,
+get_tree_structure, export_folder_content, minify_code over every text file
+and the full process_single_repository. The export cache is disabled so
+every run reads all files. Each stage runs in its own subprocess, which
+isolates its peak RSS and keeps one stage from warming another's state
+(the OS page cache is shared and warmed by a first untimed pass).
+
+Results are printed as JSON, with the commit, interpreter and repository
+parameters, so runs on different commits can be compared; --compare prints
+the speedup of each stage against an earlier result file.
+
+Usage: python benchmarks/bench_pipeline.py [--files N] [--output result.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_repo import RepoSpec, generate_repo  # noqa: E402
+
+STAGES = ("scan", "tree", "folder_content", "minify", "full")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stage_runner(stage: str, repo: str, output_dir: str):
+    """Returns a callable running one stage, with its untimed setup already done."""
+    import app_main
+    from export_for_ai.folder_exporter import TEXT, export_folder_content, minify_code, read_exported_file
+    from export_for_ai.options import ExportOptions
+    from export_for_ai.scanner import scan_directory
+    from export_for_ai.tree_visualizer import get_tree_structure
+
+    options = replace(ExportOptions(), use_cache=False)
+    if stage == "scan":
+        return lambda: scan_directory(repo, options=options)
+    if stage == "tree":
+        return lambda: get_tree_structure(repo, options=options)
+    if stage == "folder_content":
+        return lambda: export_folder_content(repo, options=options)
+    if stage == "minify":
+        manifest = scan_directory(repo, options=options)
+        records = [read_exported_file(repo, entry, options) for entry in manifest.files]
+        texts = [(record.text(), record.rel_path) for record in records if record.kind == TEXT]
+        return lambda: [minify_code(content, path) for content, path in texts]
+    if stage == "full":
+        return lambda: app_main.process_single_repository(
+            repo, options=options, export_destination=output_dir
+        )
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_child(stage: str, repo: str, repeat: int) -> None:
+    import logging
+    logging.disable(logging.CRITICAL)
+    output_dir = tempfile.mkdtemp(prefix="efa-bench-out-")
+    try:
+        run = stage_runner(stage, repo, output_dir)
+        baseline_rss = peak_rss_bytes()
+        run()  # Warm-up: page cache and lazily compiled patterns
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps({
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }))
+
+
+def run_stage(stage: str, repo: str, repeat: int) -> dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", stage, "--repo", repo, "--repeat", str(repeat)],
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def repo_size(repo: str) -> dict:
+    files = 0
+    size = 0
+    for root, _, names in os.walk(repo):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return {"files": files, "bytes": size}
+
+
+def compare(result: dict, baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline.get('commit')} ({baseline_path}):", file=sys.stderr)
+    for stage, current in result["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or "median" not in previous or "median" not in current:
+            continue
+        speedup = previous["median"] / current["median"] if current["median"] else float("inf")
+        print(
+            f"  {stage:<16} {previous['median']:8.3f}s -> {current['median']:8.3f}s  x{speedup:.2f}",
+            file=sys.stderr,
+        )
+
+
+def main() -> None:
+    defaults = RepoSpec()
+    parser = argparse.ArgumentParser(description="Benchmark the export pipeline stage by stage.")
+    parser.add_argument("--repo", help="Existing repository to benchmark instead of a generated one")
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--median-bytes", type=int, default=defaults.median_bytes)
+    parser.add_argument("--size-sigma", type=float, default=defaults.size_sigma)
+    parser.add_argument("--binary-ratio", type=float, default=defaults.binary_ratio)
+    parser.add_argument("--ignore-density", type=float, default=defaults.ignore_density)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier result file to compare against")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.repo, args.repeat)
+        return
+
+    spec = RepoSpec(
+        files=args.files,
+        depth=args.depth,
+        median_bytes=args.median_bytes,
+        size_sigma=args.size_sigma,
+        binary_ratio=args.binary_ratio,
+        ignore_density=args.ignore_density,
+        seed=args.seed,
+    )
+    generated = None
+    repo = args.repo
+    if repo is None:
+        generated = tempfile.mkdtemp(prefix="efa-bench-repo-")
+        repo = os.path.join(generated, "repo")
+        generate_repo(repo, spec)
+    try:
+        result = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repo": {
+                "path": args.repo,
+                "spec": None if args.repo else spec._asdict(),
+                **repo_size(repo),
+            },
+            "repeat": args.repeat,
+            "stages": {},
+        }
+        for stage in args.stages:
+            result["stages"][stage] = run_stage(stage, repo, args.repeat)
+    finally:
+        if generated:
+            shutil.rmtree(generated, ignore_errors=True)
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Generator for synthetic repositories used by the pipeline benchmarks.
+
+The tree shape, file sizes, share of binary files and density of ignored
+content are all parameters, and the same seed always produces the same
+repository, so runs on different commits export identical input.
+
+Usage: python benchmarks/synthetic_repo.py <target_dir> [--files N] [--seed N]
+"""
+import argparse
+import os
+import random
+from typing import NamedTuple
+
+DIR_NAMES = ["src", "lib", "core", "api", "utils", "models", "views", "tests", "docs", "scripts", "config"]
+TEXT_EXTENSIONS = [".py", ".js", ".ts", ".md", ".json", ".yaml", ".css", ".go", ".txt"]
+BINARY_EXTENSIONS = [".png", ".bin", ".dat", ".pkl"]
+# Directories and files generated for the ignore rules to remove
+IGNORED_DIRS = ["node_modules", "build", "dist", ".venv", "coverage", "generated"]
+IGNORED_FILES = ["debug.log", "cache.tmp", "bundle.min.js", "trace.log"]
+USER_PATTERNS = ["generated/", "*.min.js", "coverage/", "docs/**/*.tmp", "!keep.log"]
+
+PYTHON_LINES = [
+    "import os",
+    "# Configuration for the handler",
+    "def handle(request, retries=3):",
+    '    """Handle one request and return its response."""',
+    "    url = \"https://example.com/api#section\"  # endpoint",
+    "    for attempt in range(retries):",
+    "        response = send(url, request, attempt)",
+    "        if response.ok:",
+    "            return response",
+    "    raise RuntimeError(f\"failed after {retries} attempts\")",
+    "",
+]
+JS_LINES = [
+    "// Render the component",
+    "export function render(props) {",
+    "    const url = \"https://example.com/#/\" + props.id; // hash routing",
+    "    /* cached lookup */",
+    "    return `<a href=\"${url}\">${props.label}</a>`;",
+    "}",
+    "",
+]
+
+
+class RepoSpec(NamedTuple):
+    """Parameters of a synthetic repository."""
+
+    files: int = 2000
+    # Maximum directory depth below the root
+    depth: int = 6
+    # Median text file size in bytes; sizes follow a log-normal distribution
+    median_bytes: int = 4096
+    # Spread of the log-normal size distribution (sigma)
+    size_sigma: float = 1.2
+    max_bytes: int = 2 * 1024 * 1024
+    # Share of files with binary content
+    binary_ratio: float = 0.05
+    # Share of files placed in ignored directories or matching ignore patterns
+    ignore_density: float = 0.2
+    seed: int = 42
+
+
+class RepoStats(NamedTuple):
+    files: int
+    bytes: int
+    ignored_files: int
+    binary_files: int
+
+
+def _text(rng: random.Random, ext: str, size: int) -> str:
+    lines = PYTHON_LINES if ext == ".py" else JS_LINES
+    parts = []
+    total = 0
+    while total < size:
+        line = rng.choice(lines)
+        parts.append(line)
+        total += len(line) + 1
+    return "\n".join(parts)[:size]
+
+
+def _directory(rng: random.Random, depth: int) -> str:
+    return "/".join(rng.choice(DIR_NAMES) for _ in range(rng.randint(0, depth)))
+
+
+def generate_repo(root: str, spec: RepoSpec = RepoSpec()) -> RepoStats:
+    """
+    Writes a synthetic repository into ``root``.
+
+    :param root: Target directory; created if needed.
+    :param spec: RepoSpec with the shape of the repository.
+    :return: RepoStats describing what was written.
+    """
+    rng = random.Random(spec.seed)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".exportignore"), "w", encoding="utf-8") as f:
+        f.write("\n".join(USER_PATTERNS) + "\n")
+    with open(os.path.join(root, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("*.log\n*.tmp\n")
+
+    total_bytes = 0
+    ignored = 0
+    binary = 0
+    for index in range(spec.files):
+        directory = _directory(rng, spec.depth)
+        if rng.random() < spec.ignore_density:
+            ignored += 1
+            if rng.random() < 0.5:
+                directory = os.path.join(directory, rng.choice(IGNORED_DIRS))
+                name = f"module_{index}.js"
+            else:
+                name = f"{index}_{rng.choice(IGNORED_FILES)}"
+        elif rng.random() < spec.binary_ratio:
+            binary += 1
+            name = f"asset_{index}{rng.choice(BINARY_EXTENSIONS)}"
+        else:
+            name = f"file_{index}{rng.choice(TEXT_EXTENSIONS)}"
+
+        size = min(spec.max_bytes, int(rng.lognormvariate(0, spec.size_sigma) * spec.median_bytes))
+        path = os.path.join(root, directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if name.endswith(tuple(BINARY_EXTENSIONS)):
+            with open(path, "wb") as f:
+                f.write(rng.randbytes(size))
+        else:
+            with open(path, "w", encoding="utf-8", newline="\n") as f:
+                f.write(_text(rng, os.path.splitext(name)[1], size))
+        total_bytes += size
+    return RepoStats(spec.files, total_bytes, ignored, binary)
+
+
+def main() -> None:
+    defaults = RepoSpec()
+    parser = argparse.ArgumentParser(description="Generate a synthetic repository for the pipeline benchmarks.")
+    parser.add_argument("target_dir", help="Directory to write the repository into; created if needed")
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--median-bytes", type=int, default=defaults.median_bytes)
+    parser.add_argument("--size-sigma", type=float, default=defaults.size_sigma)
+    parser.add_argument("--max-bytes", type=int, default=defaults.max_bytes)
+    parser.add_argument("--binary-ratio", type=float, default=defaults.binary_ratio)
+    parser.add_argument("--ignore-density", type=float, default=defaults.ignore_density)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    spec = RepoSpec(
+        files=args.files,
+        depth=args.depth,
+        median_bytes=args.median_bytes,
+        size_sigma=args.size_sigma,
+        max_bytes=args.max_bytes,
+        binary_ratio=args.binary_ratio,
+        ignore_density=args.ignore_density,
+        seed=args.seed,
+    )
+    print(generate_repo(args.target_dir, spec))
+
+
+if __name__ == "__main__":
+    main()
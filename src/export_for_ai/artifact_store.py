@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import threading
+from typing import Iterator, Optional, Tuple
+
+
+def _temp_name(path: str) -> str:
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def _ref_name(destination: str) -> str:
+    return hashlib.sha1(os.path.abspath(destination).encode("utf-8")).hexdigest()
+
+
+def _make_read_only(path: str) -> None:
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _replace(source: str, destination: str) -> None:
+    try:
+        os.replace(source, destination)
+    except PermissionError:
+        # Windows refuses to replace a read-only file
+        if os.name != "nt" or not os.path.exists(destination):
+            raise
+        os.chmod(destination, stat.S_IREAD | stat.S_IWRITE)
+        os.replace(source, destination)
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of export outputs.
+
+    Each published output is kept under ``objects/`` by its SHA-256 digest,
+    hard-linked to the destination file where the filesystem allows it, so
+    identical outputs share one copy on disk. ``refs/`` remembers the digest,
+    size and mtime last published to each destination; an output whose digest
+    matches the ref of an unmodified destination is discarded instead of
+    rewriting the file.
+
+    Objects are read-only, and so are the outputs linked to them, so an
+    in-place edit of one output cannot change the stored object or the other
+    outputs sharing it. An object is removed once no ref names it any more:
+    publish releases the object a destination held before, and ``prune``
+    also drops refs of destinations that were deleted or modified.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    @staticmethod
+    def _read_ref_file(ref_path: str) -> Tuple[str, int, int, Optional[str]]:
+        """Returns the digest, size, mtime and destination of a ref; refs of older versions lack the destination."""
+        with open(ref_path, "r", encoding="utf-8") as f:
+            fields = f.read().rstrip("\n").split(" ", 3)
+        return fields[0], int(fields[1]), int(fields[2]), fields[3] if len(fields) > 3 else None
+
+    def read_ref(self, destination: str) -> Optional[str]:
+        """Returns the digest last published to an unmodified destination, or None."""
+        try:
+            digest, size, mtime_ns, _ = self._read_ref_file(os.path.join(self.refs_dir, _ref_name(destination)))
+            stat_result = os.stat(destination)
+        except (OSError, ValueError, IndexError):
+            return None
+        if stat_result.st_size != size or stat_result.st_mtime_ns != mtime_ns:
+            return None
+        return digest
+
+    def _write_ref(self, destination: str, digest: str) -> None:
+        stat_result = os.stat(destination)
+        ref_path = os.path.join(self.refs_dir, _ref_name(destination))
+        temp_path = _temp_name(ref_path)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(f"{digest} {stat_result.st_size} {stat_result.st_mtime_ns} {os.path.abspath(destination)}\n")
+        os.replace(temp_path, ref_path)
+
+    def _iter_refs(self) -> Iterator[Tuple[str, str, Optional[str]]]:
+        """Yields the path, digest and destination of every readable ref."""
+        for name in os.listdir(self.refs_dir):
+            if name.endswith(".tmp"):
+                continue
+            ref_path = os.path.join(self.refs_dir, name)
+            try:
+                digest, _, _, destination = self._read_ref_file(ref_path)
+            except (OSError, ValueError, IndexError):
+                continue
+            yield ref_path, digest, destination
+
+    def release(self, digest: str) -> bool:
+        """
+        Removes the object of ``digest`` unless a ref still names it.
+
+        Outputs linked to the object keep their content; only the store's
+        copy is dropped.
+
+        :return: True if the object was removed.
+        """
+        if any(ref_digest == digest for _, ref_digest, _ in self._iter_refs()):
+            return False
+        try:
+            os.unlink(self.object_path(digest))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def prune(self) -> int:
+        """
+        Drops the refs of destinations that no longer hold their output, then
+        every object no ref names.
+
+        :return: The number of objects removed.
+        """
+        referenced = set()
+        for ref_path, digest, destination in self._iter_refs():
+            if destination is not None and self.read_ref(destination) != digest:
+                try:
+                    os.unlink(ref_path)
+                except OSError:
+                    pass
+                continue
+            referenced.add(digest)
+        removed = 0
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                # Temporary copies in progress carry a suffix after the digest
+                if "." in name or name in referenced:
+                    continue
+                try:
+                    os.unlink(os.path.join(prefix_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logging.info(f"Artifact store: removed {removed} unreferenced objects")
+        return removed
+
+    def _previous_digest(self, destination: str) -> Optional[str]:
+        try:
+            return self._read_ref_file(os.path.join(self.refs_dir, _ref_name(destination)))[0]
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _store_object(self, temp_path: str, digest: str) -> str:
+        """Stores the output under its digest and returns the file to move into place."""
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            # Identical output published elsewhere: share the stored copy
+            shared_path = temp_path + ".shared"
+            try:
+                os.link(object_path, shared_path)
+            except OSError:
+                return temp_path
+            os.unlink(temp_path)
+            return shared_path
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # Read-only before it becomes visible under objects/; a hard-linked
+        # output shares the mode
+        _make_read_only(temp_path)
+        try:
+            os.link(temp_path, object_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Another filesystem, or no hard links: keep a copy instead
+            copy_path = _temp_name(object_path)
+            shutil.copyfile(temp_path, copy_path)
+            _make_read_only(copy_path)
+            os.replace(copy_path, object_path)
+        return temp_path
+
+    def publish(self, temp_path: str, destination: str, digest: str) -> bool:
+        """
+        Moves a finished output into place unless the destination already holds it.
+
+        :param temp_path: The fully written output, next to the destination.
+        :param destination: The final output path.
+        :param digest: SHA-256 hex digest of the output.
+        :return: True if the destination was written, False if it was already up to date.
+        """
+        if self.read_ref(destination) == digest:
+            os.unlink(temp_path)
+            logging.info(f"Output unchanged, kept {destination}")
+            return False
+        previous = self._previous_digest(destination)
+        _replace(self._store_object(temp_path, digest), destination)
+        self._write_ref(destination, digest)
+        if previous is not None and previous != digest and not self.release(previous) and os.name == "nt":
+            # _replace may have made the shared object writable to replace the destination
+            try:
+                _make_read_only(self.object_path(previous))
+            except OSError:
+                pass
+        return True
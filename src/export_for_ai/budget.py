@@ -0,0 +1,146 @@
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from export_for_ai.file_types import get_extension
+from export_for_ai.scanner import ManifestEntry
+
+PRIORITY_TREE = "tree"
+PRIORITY_SMALLEST = "smallest"
+PRIORITIES = (PRIORITY_TREE, PRIORITY_SMALLEST)
+
+# Average bytes per token for source code and prose with common tokenizers
+BYTES_PER_TOKEN = 4
+# A file cut to fewer bytes than this at the end of the budget is dropped instead
+MIN_TRUNCATED_BYTES = 256
+
+
+def estimate_tokens(size: int) -> int:
+    """
+    Approximates the number of tokens for a text of the given size in bytes.
+
+    :param size: Size of the text in bytes (or characters).
+    :return: Estimated token count.
+    """
+    return (size + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+
+class BudgetPlan:
+    """
+    The files selected for export under the configured budgets.
+
+    ``entries`` keeps the original tree order. ``limits`` maps a relative path
+    to the number of bytes that may be read from it; files without a limit are
+    read in full.
+    """
+
+    def __init__(self, entries: List[ManifestEntry]):
+        self.entries = entries
+        self.limits: Dict[str, int] = {}
+        self.truncated: List[ManifestEntry] = []
+        self.dropped: List[ManifestEntry] = []
+        self.total_bytes = 0
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.total_bytes)
+
+    def report(self) -> str:
+        """Renders the list of truncated and dropped files for the export."""
+        if not self.truncated and not self.dropped:
+            return ""
+        lines = [
+            "# Export budget report",
+            f"Included ~{self.total_bytes} bytes (~{self.estimated_tokens} tokens).",
+        ]
+        for entry in self.truncated:
+            lines.append(
+                f"- Truncated: {entry.rel_path} ({self.limits[entry.rel_path]} of {entry.size} bytes)"
+            )
+        for entry in self.dropped:
+            lines.append(f"- Dropped: {entry.rel_path} ({entry.size} bytes)")
+        return "\n".join(lines) + "\n\n"
+
+
+def order_by_priority(
+        entries: List[ManifestEntry], priority: str, prefer: Sequence[str] = ()
+) -> List[ManifestEntry]:
+    """
+    Orders entries in the sequence the budget is spent on them.
+
+    Entries matching ``prefer`` patterns come first, in pattern order; each
+    group is then ordered by ``priority``.
+    """
+    if priority == PRIORITY_SMALLEST:
+        ordered = sorted(entries, key=lambda e: (e.size, e.rel_path))
+    else:
+        ordered = list(entries)
+    if not prefer:
+        return ordered
+
+    # Imported here: pathspec is slow to import and only needed for --prefer
+    from pathspec import PathSpec
+    from pathspec.patterns import GitWildMatchPattern
+
+    specs = [PathSpec.from_lines(GitWildMatchPattern, [pattern]) for pattern in prefer]
+
+    def rank(entry: ManifestEntry) -> int:
+        for index, spec in enumerate(specs):
+            if spec.match_file(entry.rel_path):
+                return index
+        return len(specs)
+
+    return sorted(ordered, key=rank)
+
+
+def plan_budget(entries: List[ManifestEntry], options) -> Optional[BudgetPlan]:
+    """
+    Selects and limits files so the export fits the configured budgets.
+
+    Sizes come from the manifest, so planning happens before any file is read.
+    Files with a binary extension cost nothing since only a marker is emitted.
+
+    :param entries: The file entries of the manifest, in tree order.
+    :param options: ExportOptions with the budget settings.
+    :return: A BudgetPlan, or None when no budget is configured.
+    """
+    total_limit = options.max_total_bytes
+    if options.max_total_tokens is not None:
+        token_limit = options.max_total_tokens * BYTES_PER_TOKEN
+        total_limit = token_limit if total_limit is None else min(total_limit, token_limit)
+    if options.max_file_bytes is None and total_limit is None:
+        return None
+
+    plan = BudgetPlan(entries)
+    keep = set()
+    remaining = total_limit
+    for entry in order_by_priority(entries, options.budget_priority, options.budget_prefer):
+        if get_extension(entry.name) in options.binary_extensions:
+            keep.add(entry.rel_path)
+            continue
+        cost = entry.size
+        if options.max_file_bytes is not None:
+            cost = min(cost, options.max_file_bytes)
+        if remaining is not None and cost > remaining:
+            if remaining < MIN_TRUNCATED_BYTES:
+                plan.dropped.append(entry)
+                continue
+            cost = remaining
+        if cost < entry.size:
+            plan.limits[entry.rel_path] = cost
+            plan.truncated.append(entry)
+        keep.add(entry.rel_path)
+        plan.total_bytes += cost
+        if remaining is not None:
+            remaining -= cost
+
+    plan.entries = [entry for entry in entries if entry.rel_path in keep]
+    if plan.truncated or plan.dropped:
+        logging.info(
+            f"Budget: {len(plan.truncated)} files truncated, {len(plan.dropped)} dropped, "
+            f"~{plan.estimated_tokens} tokens included"
+        )
+        for entry in plan.truncated:
+            logging.debug(f"Truncated to budget: {entry.rel_path}")
+        for entry in plan.dropped:
+            logging.debug(f"Dropped by budget: {entry.rel_path}")
+    return plan
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple
+
+from export_for_ai.file_types import get_extension, prefix_is_binary
+from export_for_ai.folder_exporter import EMPTY, TEXT, minify_record, read_exported_file
+from export_for_ai.metrics import metrics
+from export_for_ai.options import FORMAT_JSONL, ExportOptions
+from export_for_ai.scanner import ManifestEntry
+from export_for_ai.writers import write_chunk
+
+# Smaller files are always exported in full; a reference would save next to nothing
+MIN_DEDUPE_BYTES = 256
+SHARED_CONTENT_NAME = "shared-content"
+_HASH_CHUNK = 1024 * 1024
+
+# (repository path, manifest entry) of one file in a run
+Location = Tuple[str, ManifestEntry]
+
+
+class DedupePlan:
+    """
+    Identical file bodies found across the repositories of one run.
+
+    ``references`` maps a repository path to the files of it that are
+    exported as a reference instead of their content, with the reference
+    text. A body found in several repositories is listed once in ``shared``
+    under an id (``S1``, ``S2``, ...) and every copy refers to it; a body
+    repeated only within one repository is kept at its first occurrence in
+    tree order and the later copies refer to that path.
+    """
+
+    def __init__(self):
+        self.references: Dict[str, Dict[str, str]] = {}
+        # (shared id, every location holding the body; the first is read)
+        self.shared: List[Tuple[str, List[Location]]] = []
+        self.saved_bytes = 0
+
+    def add_reference(self, location: Location, text: str) -> None:
+        repo_path, entry = location
+        self.references.setdefault(repo_path, {})[entry.rel_path] = text
+        self.saved_bytes += entry.size
+
+
+def _content_hash(file_path: str, sniff_bytes: int) -> Optional[str]:
+    """Hashes a file's bytes, or returns None for binary or unreadable files."""
+    digest = hashlib.sha1()
+    try:
+        with open(file_path, "rb") as f:
+            chunk = f.read(_HASH_CHUNK)
+            if prefix_is_binary(chunk[:sniff_bytes]):
+                return None
+            while chunk:
+                digest.update(chunk)
+                chunk = f.read(_HASH_CHUNK)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _candidates(
+        repositories: Sequence[str], file_lists: Sequence[List[ManifestEntry]], options: ExportOptions
+) -> List[Location]:
+    """Returns the files sharing their size with another file; only those can be duplicates."""
+    by_size: Dict[int, List[Location]] = defaultdict(list)
+    for repo_path, entries in zip(repositories, file_lists):
+        for entry in entries:
+            if entry.size < MIN_DEDUPE_BYTES or get_extension(entry.name) in options.binary_extensions:
+                continue
+            by_size[entry.size].append((repo_path, entry))
+    return [location for group in by_size.values() if len(group) > 1 for location in group]
+
+
+def plan_dedupe(
+        repositories: Sequence[str],
+        file_lists: Sequence[List[ManifestEntry]],
+        options: ExportOptions,
+        shared_name: Optional[str] = None,
+) -> DedupePlan:
+    """
+    Finds files with identical contents within and across repositories.
+
+    Files are grouped by their manifest size first and only files sharing a
+    size are hashed, on ``options.jobs`` threads, so a run without
+    duplicates reads almost nothing. Binary files and files smaller than
+    MIN_DEDUPE_BYTES are never deduplicated.
+
+    :param repositories: Repository paths, in the order of the run.
+    :param file_lists: The file entries of each repository's manifest, in tree order.
+    :param options: ExportOptions with the binary detection settings.
+    :param shared_name: File name cross-repository references point to; without
+        it only duplicates within one repository are deduplicated.
+    :return: The DedupePlan of the run.
+    """
+    plan = DedupePlan()
+    candidates = _candidates(repositories, file_lists, options)
+    if not candidates:
+        return plan
+
+    def content_hash(location: Location) -> Optional[str]:
+        repo_path, entry = location
+        return _content_hash(os.path.join(repo_path, entry.rel_path), options.sniff_bytes)
+
+    with metrics.stage("dedupe_hash"):
+        with ThreadPoolExecutor(max_workers=max(1, options.jobs)) as executor:
+            hashes = list(executor.map(content_hash, candidates))
+    metrics.count("files_hashed", len(candidates))
+
+    groups: Dict[str, List[Location]] = defaultdict(list)
+    for location, digest in zip(candidates, hashes):
+        if digest is not None:
+            groups[digest].append(location)
+
+    order = {repo_path: index for index, repo_path in enumerate(repositories)}
+    positions = {
+        (repo_path, entry.rel_path): index
+        for repo_path, entries in zip(repositories, file_lists)
+        for index, entry in enumerate(entries)
+    }
+
+    def run_order(location: Location) -> Tuple[int, int]:
+        return order[location[0]], positions[(location[0], location[1].rel_path)]
+
+    duplicates = [sorted(group, key=run_order) for group in groups.values() if len(group) > 1]
+    duplicates.sort(key=lambda group: run_order(group[0]))
+    for locations in duplicates:
+        if shared_name and len({repo_path for repo_path, _ in locations}) > 1:
+            shared_id = f"S{len(plan.shared) + 1}"
+            plan.shared.append((shared_id, locations))
+            for location in locations:
+                plan.add_reference(location, f"Same content as {shared_id} in {shared_name}")
+            continue
+        # Within one repository the first copy stays in place
+        by_repo: Dict[str, List[Location]] = defaultdict(list)
+        for location in locations:
+            by_repo[location[0]].append(location)
+        for copies in by_repo.values():
+            for location in copies[1:]:
+                plan.add_reference(location, f"Same content as {copies[0][1].rel_path}")
+
+    files = sum(len(references) for references in plan.references.values())
+    metrics.count("files_deduplicated", files)
+    if files:
+        logging.info(
+            f"Dedupe: {files} duplicate files ({plan.saved_bytes} bytes), "
+            f"{len(plan.shared)} bodies shared across repositories"
+        )
+    return plan
+
+
+def find_duplicates(path: str, entries: List[ManifestEntry], options: ExportOptions) -> Dict[str, str]:
+    """Returns the references of the files of one repository repeating an earlier file's content."""
+    return plan_dedupe([path], [entries], options).references.get(path, {})
+
+
+def write_shared_content(handle: TextIO, plan: DedupePlan, options: ExportOptions) -> None:
+    """
+    Writes each body shared across repositories once, under its id.
+
+    Bodies are read from their first location like any exported file, so
+    ``max_file_bytes`` and ``minify`` apply to them as well. The layout
+    follows ``options.output_format``: markdown sections, or one JSON record
+    per body with the id as ``path`` and the copies in ``files``.
+    """
+    for shared_id, locations in plan.shared:
+        repo_path, entry = locations[0]
+        limit = options.max_file_bytes
+        if limit is not None and entry.size <= limit:
+            limit = None
+        record = read_exported_file(repo_path, entry, options, limit)
+        if options.minify:
+            record = minify_record(record)
+        files = [
+            f"{os.path.basename(os.path.abspath(location_repo))}/{location_entry.rel_path}"
+            for location_repo, location_entry in locations
+        ]
+        if options.output_format == FORMAT_JSONL:
+            handle.write(json.dumps({
+                "path": shared_id,
+                "size": entry.size,
+                "kind": record.kind,
+                "files": files,
+                "content": record.text(),
+            }, ensure_ascii=False))
+            handle.write("\n")
+            continue
+        handle.write(f"# Shared: {shared_id}\nUsed by: {', '.join(files)}\n")
+        if record.kind == TEXT:
+            handle.write("```\n")
+            write_chunk(handle, record.body if record.body is not None else record.content)
+            handle.write("\n```\n\n")
+        elif record.kind == EMPTY:
+            handle.write("`File is empty`\n\n")
+        else:
+            handle.write("`Binary or unreadable file`\n\n")
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from export_for_ai.options import DEFAULT_CACHE_MAX_BYTES
+
+# Writes are committed in batches of this size so concurrent exports never
+# wait long for the database write lock
+_COMMIT_EVERY = 256
+
+
+def default_cache_dir() -> str:
+    """Returns the per-user directory that holds export caches."""
+    override = os.environ.get("EXPORT_FOR_AI_CACHE_DIR")
+    if override:
+        return override
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "export-for-ai")
+
+
+def cache_path_for(repo_path: str, cache_dir: Optional[str] = None) -> str:
+    """Returns the SQLite file used to cache one repository."""
+    repo_path = os.path.abspath(repo_path)
+    digest = hashlib.sha1(repo_path.encode("utf-8")).hexdigest()[:16]
+    name = f"{os.path.basename(repo_path) or 'root'}-{digest}.sqlite"
+    return os.path.join(cache_dir or default_cache_dir(), name)
+
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExportCache:
+    """
+    Persistent cache of processed file blocks for one repository.
+
+    Entries are keyed by relative path, mtime and size, plus the render key of
+    the options used to produce them. When hashing is enabled, an entry whose
+    mtime changed but whose content hash did not is still reused. The cache is
+    trimmed to ``max_bytes`` by evicting the least recently used entries.
+
+    The database runs in WAL mode and writes are committed in small batches,
+    so several exports of the same repository can share it. A lookup or a
+    write that fails, for example on a lock held too long by another
+    process, counts as a cache miss instead of failing the export.
+    """
+
+    def __init__(
+            self,
+            repo_path: str,
+            render_key: str,
+            cache_dir: Optional[str] = None,
+            max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+            use_hash: bool = False,
+    ):
+        self.repo_path = repo_path
+        self.render_key = render_key
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.db_path = cache_path_for(repo_path, cache_dir)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Loaded with the first cache; sqlite3 is slow to import
+        import sqlite3
+
+        self.errors = sqlite3.Error
+        self.pending = 0
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blocks (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT,
+                render_key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                content TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.now = time.time()
+
+    def get(self, rel_path: str, mtime_ns: int, size: int) -> Optional[tuple]:
+        """
+        Looks up a cached block.
+
+        :return: A (kind, content) tuple on a hit, None on a miss.
+        """
+        try:
+            row = self.connection.execute(
+                "SELECT mtime_ns, size, digest, kind, content FROM blocks "
+                "WHERE path = ? AND render_key = ?",
+                (rel_path, self.render_key),
+            ).fetchone()
+        except self.errors as e:
+            logging.debug(f"Cache lookup failed for {rel_path}: {e}")
+            row = None
+        if row is not None and row[1] == size:
+            if row[0] == mtime_ns or self._same_content(rel_path, row[2]):
+                self._write(
+                    "UPDATE blocks SET mtime_ns = ?, last_used = ? WHERE path = ?",
+                    (mtime_ns, self.now, rel_path),
+                )
+                self.hits += 1
+                return row[3], row[4]
+        self.misses += 1
+        return None
+
+    def put(self, rel_path: str, mtime_ns: int, size: int, kind: str, content: str) -> None:
+        digest = None
+        if self.use_hash:
+            try:
+                digest = hash_file(os.path.join(self.repo_path, rel_path))
+            except OSError:
+                return
+        self._write(
+            "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (rel_path, mtime_ns, size, digest, self.render_key, kind, content, self.now),
+        )
+
+    def _write(self, statement: str, parameters: tuple) -> None:
+        """Runs one write, committing every _COMMIT_EVERY writes; failures are logged and dropped."""
+        try:
+            self.connection.execute(statement, parameters)
+            self.pending += 1
+            if self.pending >= _COMMIT_EVERY:
+                self.connection.commit()
+                self.pending = 0
+        except self.errors as e:
+            logging.debug(f"Cache write skipped: {e}")
+            self.connection.rollback()
+            self.pending = 0
+
+    def _same_content(self, rel_path: str, digest: Optional[str]) -> bool:
+        if not self.use_hash or digest is None:
+            return False
+        try:
+            return hash_file(os.path.join(self.repo_path, rel_path)) == digest
+        except OSError:
+            return False
+
+    def evict(self) -> int:
+        """Drops least recently used entries until the cache fits max_bytes."""
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM blocks"
+        ).fetchone()[0]
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        rows = self.connection.execute(
+            "SELECT path, LENGTH(content) FROM blocks ORDER BY last_used ASC"
+        ).fetchall()
+        stale = []
+        for path, length in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((path,))
+            total -= length
+        self.connection.executemany("DELETE FROM blocks WHERE path = ?", stale)
+        removed = len(stale)
+        logging.debug(f"Evicted {removed} cache entries from {self.db_path}")
+        return removed
+
+    def close(self) -> None:
+        """Commits pending updates, applies eviction and closes the database."""
+        try:
+            self.evict()
+            self.connection.commit()
+        except self.errors as e:
+            logging.warning(f"Could not update export cache {self.db_path}: {e}")
+        finally:
+            self.connection.close()
+
+
+def open_cache(repo_path: str, options) -> Optional[ExportCache]:
+    """Opens the repository cache described by ExportOptions, or None if disabled."""
+    if not options.use_cache:
+        return None
+    import sqlite3
+
+    try:
+        return ExportCache(
+            repo_path,
+            options.render_key(),
+            cache_dir=options.cache_dir,
+            max_bytes=options.cache_max_bytes,
+            use_hash=options.cache_hash,
+        )
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Export cache unavailable, continuing without it: {e}")
+        return None
+
+
+class MemoryCache:
+    """
+    In-memory counterpart of ExportCache, used by long-lived watchers.
+
+    It has the same get/put interface, so the exporter treats both alike.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, rel_path: str, mtime_ns: int, size: int) -> Optional[tuple]:
+        cached = self.entries.get(rel_path)
+        if cached is not None and cached[0] == mtime_ns and cached[1] == size:
+            self.hits += 1
+            return cached[2], cached[3]
+        self.misses += 1
+        return None
+
+    def put(self, rel_path: str, mtime_ns: int, size: int, kind: str, content: str) -> None:
+        self.entries[rel_path] = (mtime_ns, size, kind, content)
+
+    def retain(self, rel_paths) -> None:
+        """Drops entries for files that are no longer part of the export."""
+        rel_paths = set(rel_paths)
+        for rel_path in [path for path in self.entries if path not in rel_paths]:
+            del self.entries[rel_path]
+
+    def discard(self, rel_paths) -> None:
+        """Drops entries for the given files, if present."""
+        for rel_path in rel_paths:
+            self.entries.pop(rel_path, None)
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,367 @@
+"""
+Long-lived export daemon.
+
+The daemon keeps one WatchService per set of options that change the
+repository models (ignore rules, binary detection, size limits, minify), so
+the manifests, compiled ignore rules and rendered file blocks of every
+repository it has exported stay warm between requests; an export of an
+unchanged repository reads no files. The other options, such as the query,
+diff base, budgets and output format, are applied per request to the
+shared models. Services unused for SERVICE_IDLE_TIMEOUT are stopped. Clients talk to it over a localhost
+TCP socket, one JSON request and one JSON response per line, authenticated
+by a random token. The port and token are kept in daemon.json in the
+export cache directory, readable only by the current user.
+
+Usage: python -m export_for_ai.export_daemon serve|status|stop [--idle-timeout SECONDS]
+"""
+import argparse
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from export_for_ai.export_cache import default_cache_dir
+from export_for_ai.metrics import metrics
+from export_for_ai.options import DEFAULT_CLIPBOARD_MAX_BYTES, ExportOptions, options_from_dict
+from export_for_ai.repository_export import RepositoryResult, export_from_watcher
+from export_for_ai.watcher import WatchService
+
+STATE_FILE = "daemon.json"
+LOG_FILE = "daemon.log"
+# A daemon started on demand exits after this long without requests
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+# Watchers of a set of model options unused this long are stopped
+SERVICE_IDLE_TIMEOUT = 10 * 60
+REQUEST_TIMEOUT = 600.0
+READY_LINE = "ready"
+
+
+def state_path() -> str:
+    return os.path.join(default_cache_dir(), STATE_FILE)
+
+
+def read_state() -> Optional[Dict[str, Any]]:
+    """Returns the port, token and pid of the last started daemon, or None."""
+    try:
+        with open(state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state: Dict[str, Any]) -> None:
+    path = state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    # The token authenticates clients, so only the owner may read it
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+def _remove_state(pid: int) -> None:
+    state = read_state()
+    if state and state.get("pid") == pid:
+        try:
+            os.unlink(state_path())
+        except OSError:
+            pass
+
+
+class ExportDaemon:
+    """
+    Serves export requests from warm in-memory repository models.
+
+    Repositories are watched from their first export on, so later exports
+    only re-read files that changed in between. ``export`` can also be
+    called in-process, which is how the systray app shares the daemon with
+    its hotkey.
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = None):
+        self.idle_timeout = idle_timeout
+        self.token = secrets.token_hex(16)
+        self.services: Dict[str, WatchService] = {}
+        # Monotonic time each service was last used, keyed like services
+        self.service_used: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.last_request = time.monotonic()
+        self.requests = 0
+        self.active = 0
+        self.server: Optional[socketserver.ThreadingTCPServer] = None
+        self.stopped = threading.Event()
+
+    def service(self, options: ExportOptions) -> WatchService:
+        """Returns the service holding the models for ``options``, stopping idle ones."""
+        key = options.model_key()
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                other for other, used in self.service_used.items()
+                if other != key and now - used > SERVICE_IDLE_TIMEOUT
+            ]
+            stale = [self.services.pop(other) for other in idle]
+            for other in idle:
+                del self.service_used[other]
+            service = self.services.get(key)
+            if service is None:
+                service = self.services[key] = WatchService(options.model_options())
+            self.service_used[key] = now
+        for other in stale:
+            other.stop()
+        if stale:
+            logging.info(f"Stopped {len(stale)} idle watch services")
+        return service
+
+    def warm(self, repositories: List[str], options: Optional[ExportOptions] = None) -> None:
+        """Builds the models of repositories ahead of their first export."""
+        self.service(options or ExportOptions()).add(repositories)
+
+    def export(
+            self,
+            repositories: List[str],
+            export_destination: Optional[str] = None,
+            options: Optional[ExportOptions] = None,
+            copy_to_clipboard: bool = False,
+            clipboard_max_bytes: int = DEFAULT_CLIPBOARD_MAX_BYTES,
+    ) -> List[RepositoryResult]:
+        """
+        Exports repositories from their watched models.
+
+        :param repositories: Repository directories to export.
+        :param export_destination: Directory receiving the outputs, or None to
+            write each into its repository's exported-from folder.
+        :param options: ExportOptions; each distinct set of MODEL_FIELDS gets its own models.
+        :param copy_to_clipboard: Copy the markdown of the last repository.
+        :param clipboard_max_bytes: Skip the clipboard copy above this size.
+        :return: One RepositoryResult per repository, in order.
+        """
+        with self.lock:
+            self.active += 1
+        try:
+            return self._export(
+                repositories, export_destination, options, copy_to_clipboard, clipboard_max_bytes
+            )
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.last_request = time.monotonic()
+
+    def _export(self, repositories, export_destination, options, copy_to_clipboard, clipboard_max_bytes):
+        options = options or ExportOptions()
+        service = self.service(options)
+        service.add(repositories)
+        results = []
+        for repo_path in repositories:
+            watcher = service.get(repo_path)
+            if watcher is None:
+                results.append(RepositoryResult(repo_path, error="Not a directory"))
+                continue
+            before = metrics.snapshot()
+            try:
+                result = export_from_watcher(
+                    watcher, export_destination, copy_to_clipboard, clipboard_max_bytes, options
+                )
+            except Exception as e:
+                result = RepositoryResult(repo_path, error=str(e))
+            results.append(result._replace(metrics=metrics.diff(before)))
+        # A long export must not make its own service look idle
+        with self.lock:
+            if options.model_key() in self.service_used:
+                self.service_used[options.model_key()] = time.monotonic()
+        return results
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            services = list(self.services.values())
+        return {
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "active_exports": self.active,
+            "watch_services": len(services),
+            "idle_seconds": round(time.monotonic() - self.last_request, 1),
+            "repositories": sorted(path for service in services for path in service.watchers),
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answers one decoded client request."""
+        if not secrets.compare_digest(str(request.get("token", "")), self.token):
+            return {"ok": False, "error": "Invalid token"}
+        with self.lock:
+            self.requests += 1
+            self.last_request = time.monotonic()
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command == "status":
+            return {"ok": True, **self.status()}
+        if command == "stop":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+        if command == "export":
+            results = self.export(
+                request.get("repositories", []),
+                request.get("export_destination"),
+                options_from_dict(request.get("options") or {}),
+                bool(request.get("clipboard")),
+                request.get("clipboard_max_bytes", DEFAULT_CLIPBOARD_MAX_BYTES),
+            )
+            return {"ok": True, "results": [result._asdict() for result in results]}
+        return {"ok": False, "error": f"Unknown command: {command}"}
+
+    def start(self) -> Dict[str, Any]:
+        """Starts listening on a free localhost port and publishes it in the state file."""
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    response = daemon.handle(json.loads(line))
+                except Exception as e:
+                    logging.error(f"Daemon request failed: {e}")
+                    response = {"ok": False, "error": str(e)}
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        state = {"port": self.server.server_address[1], "token": self.token, "pid": os.getpid()}
+        _write_state(state)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.idle_timeout:
+            threading.Thread(target=self._exit_when_idle, daemon=True).start()
+        logging.info(f"Export daemon listening on 127.0.0.1:{state['port']}")
+        return state
+
+    def shutdown(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        with self.lock:
+            for service in self.services.values():
+                service.stop()
+            self.services.clear()
+            self.service_used.clear()
+        _remove_state(os.getpid())
+        logging.info("Export daemon stopped.")
+        self.stopped.set()
+
+    def wait(self) -> None:
+        """Blocks until the daemon is stopped."""
+        while not self.stopped.wait(0.5):
+            pass
+
+    def _exit_when_idle(self) -> None:
+        while not self.stopped.wait(min(self.idle_timeout, 30)):
+            if not self.active and time.monotonic() - self.last_request > self.idle_timeout:
+                logging.info("Export daemon idle, exiting.")
+                self.shutdown()
+
+
+def send_request(
+        command: str, state: Optional[Dict[str, Any]] = None, timeout: float = REQUEST_TIMEOUT, **payload
+) -> Dict[str, Any]:
+    """
+    Sends one request to the running daemon and returns its response.
+
+    :raises OSError: If no daemon is listening.
+    """
+    state = state or read_state()
+    if not state:
+        raise ConnectionRefusedError("No export daemon is running")
+    request = {"command": command, "token": state["token"], **payload}
+    with socket.create_connection(("127.0.0.1", state["port"]), timeout=timeout) as connection:
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Export daemon closed the connection")
+    return json.loads(line)
+
+
+def _spawn_daemon(idle_timeout: float) -> None:
+    command = [sys.executable, "-m", "export_for_ai.export_daemon", "serve", "--idle-timeout", str(idle_timeout)]
+    # The package may be importable only through the client's sys.path, e.g. from a checkout
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path = os.environ.get("PYTHONPATH")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (package_root, python_path))))
+    kwargs: Dict[str, Any] = {"env": env}
+    if sys.platform == "win32":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    process = subprocess.Popen(
+        command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **kwargs
+    )
+    # The daemon prints one line once it is listening, or exits on failure
+    ready = process.stdout.readline().decode("utf-8", "replace").strip()
+    process.stdout.close()
+    if ready != READY_LINE:
+        raise RuntimeError(f"Export daemon failed to start, see {os.path.join(default_cache_dir(), LOG_FILE)}")
+
+
+def ensure_daemon(idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> Dict[str, Any]:
+    """Returns the state of a running daemon, starting one in the background if needed."""
+    state = read_state()
+    if state:
+        try:
+            if send_request("ping", state, timeout=2).get("ok"):
+                return state
+        except OSError:
+            pass
+    _spawn_daemon(idle_timeout)
+    return read_state()
+
+
+def serve(idle_timeout: Optional[float]) -> None:
+    os.makedirs(default_cache_dir(), exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(default_cache_dir(), LOG_FILE),
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s: %(message)s",
+    )
+    daemon = ExportDaemon(idle_timeout)
+    daemon.start()
+    # Signal readiness to the spawning client, then detach from its pipe
+    print(READY_LINE, flush=True)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    try:
+        daemon.wait()
+    except KeyboardInterrupt:
+        daemon.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="export_for_ai.export_daemon", description="Long-lived export daemon.")
+    parser.add_argument("command", choices=("serve", "status", "stop"))
+    parser.add_argument(
+        "--idle-timeout", type=float, default=None,
+        help="Exit after this many seconds without requests (serve)",
+    )
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.idle_timeout)
+        return
+    try:
+        response = send_request(args.command, timeout=5)
+    except OSError:
+        print("Export daemon is not running.")
+        sys.exit(1)
+    print(json.dumps(response, indent=2))
+
+
+if __name__ == "__main__":
+    main()
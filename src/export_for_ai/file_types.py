@@ -0,0 +1,119 @@
+import codecs
+import os
+from typing import Iterable
+
+# Never opened: treated as binary from the extension alone
+BINARY_EXTENSIONS = frozenset({
+    # Images and media
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.icns', '.tif', '.tiff',
+    '.webp', '.psd', '.heic', '.mp3', '.mp4', '.m4a', '.wav', '.flac', '.ogg',
+    '.avi', '.mov', '.mkv', '.webm',
+    # Archives and packages
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar', '.tar', '.jar',
+    '.war', '.whl', '.egg', '.deb', '.rpm', '.dmg', '.iso', '.msi', '.nupkg',
+    # Compiled code and libraries
+    '.exe', '.dll', '.so', '.dylib', '.o', '.obj', '.a', '.lib', '.pdb', '.class',
+    '.pyc', '.pyo', '.pyd', '.wasm', '.rlib',
+    # Documents and fonts
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.woff', '.woff2',
+    '.ttf', '.otf', '.eot',
+    # Data files and model weights
+    '.bin', '.dat', '.db', '.sqlite', '.sqlite3', '.parquet', '.feather', '.avro',
+    '.orc', '.npy', '.npz', '.pkl', '.pickle', '.pt', '.pth', '.onnx', '.h5',
+    '.hdf5', '.ckpt', '.safetensors', '.tflite',
+})
+
+# Always read in full without sniffing first
+TEXT_EXTENSIONS = frozenset({
+    '.py', '.pyi', '.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.json', '.md',
+    '.rst', '.txt', '.yaml', '.yml', '.toml', '.ini', '.cfg', '.conf', '.html',
+    '.htm', '.css', '.scss', '.less', '.xml', '.sql', '.sh', '.bash', '.ps1',
+    '.bat', '.cmd', '.c', '.h', '.cc', '.cpp', '.hpp', '.cs', '.java', '.kt',
+    '.kts', '.go', '.rs', '.rb', '.php', '.swift', '.scala', '.vue', '.svelte',
+    '.dockerfile', '.tf', '.hcl', '.gradle', '.proto', '.graphql', '.env',
+})
+
+SNIFF_BYTES = 8192
+
+# Language names for per-file export records, by extension or file name
+LANGUAGES = {
+    '.py': 'python', '.pyi': 'python', '.js': 'javascript', '.jsx': 'javascript',
+    '.mjs': 'javascript', '.cjs': 'javascript', '.ts': 'typescript', '.tsx': 'typescript',
+    '.json': 'json', '.md': 'markdown', '.rst': 'rst', '.txt': 'text', '.yaml': 'yaml',
+    '.yml': 'yaml', '.toml': 'toml', '.ini': 'ini', '.cfg': 'ini', '.html': 'html',
+    '.htm': 'html', '.css': 'css', '.scss': 'scss', '.less': 'less', '.xml': 'xml',
+    '.sql': 'sql', '.sh': 'shell', '.bash': 'shell', '.zsh': 'shell', '.ps1': 'powershell',
+    '.bat': 'batch', '.cmd': 'batch', '.c': 'c', '.h': 'c', '.cc': 'cpp', '.cpp': 'cpp',
+    '.hpp': 'cpp', '.cs': 'csharp', '.java': 'java', '.kt': 'kotlin', '.kts': 'kotlin',
+    '.go': 'go', '.rs': 'rust', '.rb': 'ruby', '.php': 'php', '.swift': 'swift',
+    '.scala': 'scala', '.vue': 'vue', '.svelte': 'svelte', '.dart': 'dart', '.r': 'r',
+    '.tf': 'hcl', '.hcl': 'hcl', '.gradle': 'groovy', '.proto': 'protobuf',
+    '.graphql': 'graphql', '.dockerfile': 'dockerfile', 'dockerfile': 'dockerfile',
+    'makefile': 'makefile',
+}
+
+
+def normalize_extensions(extensions: Iterable[str]) -> frozenset:
+    """Lower-cases extensions and makes sure each starts with a dot."""
+    return frozenset(
+        ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
+        for ext in extensions if ext
+    )
+
+
+def get_extension(name: str) -> str:
+    return os.path.splitext(name)[1].lower()
+
+
+def get_language(path: str) -> str:
+    """Names the language of a file from its extension or name, or returns an empty string."""
+    name = os.path.basename(path).lower()
+    return LANGUAGES.get(get_extension(name)) or LANGUAGES.get(name, '')
+
+
+def sniff_is_binary(file_path: str, sniff_bytes: int = SNIFF_BYTES) -> bool:
+    """
+    Classifies a file as binary from a small prefix of its content.
+
+    A prefix containing NUL bytes, or one that is not valid UTF-8, marks the
+    file as binary. A multi-byte sequence cut off at the end of the prefix is
+    not counted as invalid.
+
+    :param file_path: The file to inspect.
+    :param sniff_bytes: Number of bytes read from the start of the file.
+    :return: True if the file looks binary, False otherwise.
+    """
+    with open(file_path, 'rb') as f:
+        prefix = f.read(sniff_bytes)
+    return prefix_is_binary(prefix)
+
+
+def prefix_is_binary(prefix: bytes) -> bool:
+    """Classifies content as binary from its first bytes, as sniff_is_binary does for files."""
+    if b'\0' in prefix:
+        return True
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def is_binary_file(
+        file_path: str,
+        binary_extensions: frozenset = BINARY_EXTENSIONS,
+        text_extensions: frozenset = TEXT_EXTENSIONS,
+        sniff_bytes: int = SNIFF_BYTES,
+) -> bool:
+    """
+    Decides whether a file should be skipped as binary before reading it fully.
+
+    Extensions on the denylist are binary without opening the file, extensions
+    on the allowlist are text without sniffing, and everything else is sniffed.
+    """
+    ext = get_extension(file_path)
+    if ext in binary_extensions:
+        return True
+    if ext in text_extensions:
+        return False
+    return sniff_is_binary(file_path, sniff_bytes)
@@ -1,65 +1,498 @@
+import codecs
+import copy
+import io
 import logging
+import mmap
 import os
-import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-from .ignore_parser import parse_ignore_file, should_include_item
+from .budget import plan_budget
+from .file_types import is_binary_file
+from .metrics import metrics
+from .options import ExportOptions
+from .progress import ExportProgress
+from .scanner import Manifest, ManifestEntry, ensure_manifest
 
+if TYPE_CHECKING:
+    from .export_cache import ExportCache
 
-def minify_code(content):
-    # Remove single-line comments
-    content = re.sub(r"#.*", "", content)
-    # Remove multi-line comments
-    content = re.sub(r"\'\'\'[\s\S]*?\'\'\'|\"\"\"[\s\S]*?\"\"\"", "", content)
-    # Remove excessive whitespace
-    content = "\n".join(line.strip() for line in content.splitlines() if line.strip())
-    return content
+
+def minify_code(content, path=None):
+    """
+    Strips comments and blank lines from one file's content.
+
+    The language is taken from the path's extension; without a path only
+    blank lines and trailing whitespace are removed.
+    """
+    # The minifier compiles its lexers at import; load it only for --minify
+    from .minifier import minify_source
+
+    return minify_source(content, path)
+
+
+TEXT = "text"
+EMPTY = "empty"
+BINARY = "binary"
+ERROR = "error"
+# A file whose content is exported elsewhere; content is the reference
+DUPLICATE = "duplicate"
+
+# Text files this large are validated through a memory map and copied into
+# the output as bytes instead of being decoded
+PASSTHROUGH_MIN_BYTES = 1024 * 1024
+_MAP_CHUNK = 1024 * 1024
+
+
+class MappedFile:
+    """
+    The body of a large UTF-8 text file, left on disk until it is written.
+
+    Writers copy the mapped bytes straight into their output; ``read_text``
+    decodes the file for consumers that need a str.
+    """
+
+    __slots__ = ("path", "size", "chars")
+
+    def __init__(self, path: str, size: int, chars: int):
+        self.path = path
+        self.size = size
+        self.chars = chars
+
+    def __len__(self) -> int:
+        # The length of the decoded text, like len() of a content str
+        return self.chars
+
+    @contextmanager
+    def view(self) -> Iterator[memoryview]:
+        """Maps the file read-only for the duration of the block."""
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+    def read_text(self) -> str:
+        with open(self.path, "rb") as f:
+            return decode_text(f.read())
+
+
+class ExportedFile(NamedTuple):
+    """
+    A processed file ready to be rendered; content is the message for errors.
+
+    Large text files carry their content as ``body``, see read_exported_file.
+    """
+
+    rel_path: str
+    kind: str
+    content: str = ""
+    body: Optional[MappedFile] = None
+
+    def text(self) -> str:
+        """Returns the content, decoding a mapped body."""
+        return self.body.read_text() if self.body is not None else self.content
+
+
+def read_text_prefix(file_path: str, limit: int) -> str:
+    """
+    Reads at most ``limit`` bytes of a UTF-8 file with universal newlines, as decode_text does.
+
+    A character cut off at the end is dropped, and so is a trailing carriage
+    return, which may be the first half of a CRLF.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read(limit)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    return decoder.decode(data, final=False)
+
+
+def decode_text(data: bytes) -> str:
+    """Decodes UTF-8 file content with universal newlines, as text mode reads do."""
+    text = data.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def validate_mapped_text(file_path: str) -> Optional[Tuple[int, bool]]:
+    """
+    Checks that a file is UTF-8 without decoding it into one str.
+
+    The file is memory mapped and scanned in chunks; ASCII chunks only go
+    through bytes.isascii, the others through an incremental decoder whose
+    output is only measured.
+
+    :return: The file's length in characters and whether it has
+        non-whitespace content, or None when it must be read in full: it
+        holds carriage returns, which need newline translation, or it is
+        not valid UTF-8.
+    """
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if mapped.find(b"\r") != -1:
+            return None
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chars = 0
+        has_content = False
+        try:
+            for offset in range(0, len(mapped), _MAP_CHUNK):
+                chunk = mapped[offset:offset + _MAP_CHUNK]
+                # A sequence cut at the previous chunk's end must be completed by this one
+                if chunk.isascii() and not decoder.getstate()[0]:
+                    chars += len(chunk)
+                else:
+                    chars += len(decoder.decode(chunk))
+                has_content = has_content or bool(chunk.strip())
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return None
+    return chars, has_content
+
+
+def read_exported_file(
+        path, entry: ManifestEntry, options: ExportOptions, limit: Optional[int] = None
+) -> ExportedFile:
+    """
+    Read and classify one file.
+
+    Binary files are detected from their extension or a small content prefix
+    before the full read, so large binaries are never loaded. Text files of
+    PASSTHROUGH_MIN_BYTES or more are only validated, unless they are
+    minified; their record holds a MappedFile body instead of content.
+
+    :param path: The root directory being exported.
+    :param entry: The manifest entry of the file.
+    :param options: ExportOptions with the binary detection settings.
+    :param limit: Optional number of bytes to read; the content is marked as truncated.
+    :return: The ExportedFile for the entry.
+    """
+    rel_file_path = entry.rel_path
+    file_path = os.path.join(path, rel_file_path)
+    perf_counter = time.perf_counter
+    try:
+        start = perf_counter()
+        binary = entry.size and is_binary_file(
+            file_path,
+            options.binary_extensions,
+            options.text_extensions,
+            options.sniff_bytes,
+        )
+        metrics.add_time("sniff", perf_counter() - start)
+        if binary:
+            logging.debug(f"Skipping binary file: {rel_file_path}")
+            metrics.count("files_binary")
+            return ExportedFile(rel_file_path, BINARY)
+        if limit is None and entry.size >= PASSTHROUGH_MIN_BYTES and not options.minify:
+            start = perf_counter()
+            validated = validate_mapped_text(file_path)
+            metrics.add_time("validate", perf_counter() - start)
+            if validated is not None:
+                chars, has_content = validated
+                metrics.count("files_mapped")
+                metrics.count("bytes_mapped", entry.size)
+                if not has_content:
+                    return ExportedFile(rel_file_path, EMPTY)
+                return ExportedFile(rel_file_path, TEXT, body=MappedFile(file_path, entry.size, chars))
+        start = perf_counter()
+        if limit is not None:
+            file_content = read_text_prefix(file_path, limit)
+            metrics.add_time("read", perf_counter() - start)
+            metrics.count("bytes_read", min(limit, entry.size))
+            file_content += f"\n... [truncated: {limit} of {entry.size} bytes shown]"
+        else:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            read_done = perf_counter()
+            metrics.add_time("read", read_done - start)
+            metrics.count("bytes_read", len(data))
+            file_content = decode_text(data)
+            metrics.add_time("decode", perf_counter() - read_done)
+        metrics.count("files_read")
+    except UnicodeDecodeError as e:
+        # Handle binary files or files with encoding issues
+        logging.error(f"Error reading {rel_file_path}: {e}")
+        metrics.count("files_binary")
+        return ExportedFile(rel_file_path, BINARY)
+    except Exception as e:
+        metrics.count("files_error")
+        return ExportedFile(rel_file_path, ERROR, str(e))
+
+    if file_content.strip():
+        return ExportedFile(rel_file_path, TEXT, file_content)
+    return ExportedFile(rel_file_path, EMPTY)
+
+
+def render_file_block(record: ExportedFile) -> List[Union[str, MappedFile]]:
+    """
+    Render the markdown block of one exported file.
+
+    :return: The chunks making up the file's block; a mapped body is passed on as is.
+    """
+    if record.kind == TEXT:
+        body = record.body if record.body is not None else record.content
+        return [f"# File: {record.rel_path}\n```\n", body, "\n```\n\n"]
+    if record.kind == EMPTY:
+        return [f"# File: {record.rel_path}\n`File is empty`\n\n"]
+    if record.kind == BINARY:
+        return [f"# File: {record.rel_path}\n`Binary or unreadable file`\n\n"]
+    if record.kind == DUPLICATE:
+        return [f"# File: {record.rel_path}\n`{record.content}`\n\n"]
+    return [f"Error reading {record.rel_path}: {record.content}\n\n"]
+
+
+def minify_record(record: ExportedFile) -> ExportedFile:
+    """Minifies the content of a text record; other records are returned unchanged."""
+    if record.kind != TEXT:
+        return record
+    with metrics.stage("minify"):
+        return record._replace(content=minify_code(record.text(), record.rel_path), body=None)
+
+
+def iter_exported_files(
+        path,
+        entries: List[ManifestEntry],
+        options: ExportOptions,
+        cache: Optional["ExportCache"] = None,
+        limits: Optional[Dict[str, int]] = None,
+        progress: Optional[ExportProgress] = None,
+        reader: Optional[Callable[[ManifestEntry, Optional[int]], ExportedFile]] = None,
+) -> Iterator[ExportedFile]:
+    """
+    Read files on a bounded thread pool, yielding them in entry order.
+
+    Entries found in the cache are not read at all. At most ``jobs * 2``
+    files are read ahead of the consumer, which keeps memory bounded while
+    the pool hides per-file I/O latency. ``limits`` maps relative paths to
+    the number of bytes to read from them. With ``progress``, every yielded
+    file is reported to it, and once it is cancelled the reads still queued
+    are dropped and ExportCancelled is raised. ``reader`` replaces reading
+    the files from disk, e.g. with blobs read from git.
+    """
+    jobs = options.jobs
+    limits = limits or {}
+
+    def cacheable(entry: ManifestEntry) -> bool:
+        # Only the per-file limit is part of the render key; a file cut by the
+        # total budget depends on the rest of the run
+        return limits.get(entry.rel_path, options.max_file_bytes) == options.max_file_bytes
+
+    def read(entry: ManifestEntry) -> ExportedFile:
+        if progress is not None:
+            progress.check()
+        if reader is not None:
+            return reader(entry, limits.get(entry.rel_path))
+        return read_exported_file(path, entry, options, limits.get(entry.rel_path))
+
+    def lookup(entry: ManifestEntry) -> Optional[ExportedFile]:
+        if cache is None or not cacheable(entry):
+            return None
+        hit = cache.get(entry.rel_path, entry.mtime_ns, entry.size)
+        if hit is None:
+            return None
+        metrics.count("files_cached")
+        return ExportedFile(entry.rel_path, *hit)
+
+    def store(entry: ManifestEntry, record: ExportedFile) -> None:
+        # Mapped bodies stay on disk; re-validating them is cheaper than caching them
+        if cache is not None and record.kind != ERROR and record.body is None and cacheable(entry):
+            cache.put(entry.rel_path, entry.mtime_ns, entry.size, record.kind, record.content)
+
+    def done(entry: ManifestEntry) -> None:
+        if progress is not None:
+            progress.check()
+            progress.advance(entry.rel_path, entry.size)
+
+    if jobs <= 1 or len(entries) <= 1:
+        for entry in entries:
+            record = lookup(entry)
+            if record is None:
+                record = read(entry)
+                store(entry, record)
+            done(entry)
+            yield record
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Each slot holds (entry, cached record or future of a fresh read)
+        pending = deque()
+        remaining = iter(entries)
+
+        def schedule(count: int) -> None:
+            for entry in islice(remaining, count):
+                record = lookup(entry)
+                if record is None:
+                    record = executor.submit(read, entry)
+                pending.append((entry, record))
+
+        schedule(jobs * 2)
+        try:
+            while pending:
+                entry, record = pending.popleft()
+                if not isinstance(record, ExportedFile):
+                    record = record.result()
+                    store(entry, record)
+                done(entry)
+                schedule(1)
+                yield record
+        finally:
+            # Reads not started yet are dropped when the export is cancelled
+            # or the consumer stops early
+            for _, record in pending:
+                if not isinstance(record, ExportedFile):
+                    record.cancel()
+
+
+class FolderExport:
+    """
+    The files of one folder export, planned against the budgets.
+
+    Iterating yields each included manifest entry with its processed record,
+    in tree order, read as described in iter_exported_files; a FolderExport
+    can be iterated once. Writers use the records directly, for example to
+    split the export at file boundaries or to emit one JSON record per file.
+    ``report`` renders the budget report closing the export. ``reader``
+    supplies the records of files that are not read from disk. With
+    ``options.query`` only the ``options.top_k`` files ranked highest by the
+    repository's search index are exported. ``duplicates`` maps relative
+    paths to the reference exported instead of their content; those files
+    are neither read nor counted against the budgets. With ``options.dedupe``
+    and no ``duplicates``, files repeating an earlier file of the folder are
+    found by content hash.
+    """
+
+    def __init__(
+            self,
+            path,
+            manifest: Optional[Manifest] = None,
+            options: Optional[ExportOptions] = None,
+            cache: Optional["ExportCache"] = None,
+            progress: Optional[ExportProgress] = None,
+            reader: Optional[Callable[[ManifestEntry, Optional[int]], ExportedFile]] = None,
+            duplicates: Optional[Dict[str, str]] = None,
+    ):
+        self.path = path
+        self.reader = reader
+        self.options = options or ExportOptions()
+        self.manifest = ensure_manifest(path, manifest, self.options)
+        self.cache = cache
+        self.progress = progress
+        files = self.manifest.files
+        self.query_result = None
+        if self.options.query:
+            # Loaded only for --query; the index lives next to the export cache
+            from .search_index import select_relevant
+
+            files, self.query_result = select_relevant(path, files, self.options)
+        if duplicates is None and self.options.dedupe and reader is None:
+            # Loaded only for --dedupe
+            from .dedupe import find_duplicates
+
+            duplicates = find_duplicates(path, files, self.options)
+        self.duplicates = duplicates or {}
+        self.plan = plan_budget([entry for entry in files if entry.rel_path not in self.duplicates], self.options)
+        if self.plan:
+            kept = {entry.rel_path for entry in self.plan.entries}
+            files = [entry for entry in files if entry.rel_path in kept or entry.rel_path in self.duplicates]
+        self.entries = files
+        self.read_entries = [entry for entry in files if entry.rel_path not in self.duplicates]
+        if progress is not None:
+            progress.add_total(len(self.entries), sum(entry.size for entry in self.read_entries))
+
+    def __iter__(self) -> Iterator[Tuple[ManifestEntry, ExportedFile]]:
+        limits = self.plan.limits if self.plan else None
+        records = iter_exported_files(
+            self.path, self.read_entries, self.options, self.cache, limits, self.progress, self.reader
+        )
+        for entry in self.entries:
+            reference = self.duplicates.get(entry.rel_path)
+            if reference is not None:
+                if self.progress is not None:
+                    self.progress.check()
+                    self.progress.advance(entry.rel_path, 0)
+                yield entry, ExportedFile(entry.rel_path, DUPLICATE, reference)
+                continue
+            record = next(records)
+            if self.options.minify:
+                record = minify_record(record)
+            yield entry, record
+
+    def with_options(self, options: ExportOptions) -> "FolderExport":
+        """
+        Returns an export of the same files rendered with other options.
+
+        The query selection, duplicates and budget plan of this export are
+        reused as they are, so options that select files have no effect here.
+        """
+        other = copy.copy(self)
+        other.options = options
+        return other
+
+    def report(self) -> str:
+        report = self.plan.report() if self.plan else ""
+        if self.query_result is not None:
+            report = self.query_result.report() + report
+        return report
+
+    def iter_chunks(self, passthrough: bool = False) -> Iterator[Union[str, MappedFile]]:
+        """
+        Yields the rendered markdown of every file, then the budget report.
+
+        :param passthrough: Yield the MappedFile bodies of large files instead
+            of decoding them, for writers that copy them with write_chunk.
+        """
+        for _, record in self:
+            for chunk in render_file_block(record):
+                yield chunk if passthrough or isinstance(chunk, str) else chunk.read_text()
+        report = self.report()
+        if report:
+            yield report
+
+
+def iter_folder_content(
+        path,
+        manifest: Optional[Manifest] = None,
+        options: Optional[ExportOptions] = None,
+        cache: Optional["ExportCache"] = None,
+        progress: Optional[ExportProgress] = None,
+) -> Iterator[str]:
+    """
+    Yield the exported content of all included files chunk by chunk.
+
+    Only a bounded window of file bodies is held in memory at a time, so
+    callers can stream the export straight to a file handle. Files appear in
+    the same order as in the tree. When budgets are configured, files are
+    truncated or dropped and a report listing them closes the content. With
+    ``options.minify`` each file is minified after the cache lookup, so the
+    cache holds the original content for both variants.
+
+    :param path: The root directory to export.
+    :param manifest: Optional pre-scanned manifest; the directory is scanned when omitted.
+    :param options: Optional ExportOptions; defaults are used when omitted.
+    :param cache: Optional ExportCache used to skip unchanged files.
+    :param progress: Optional ExportProgress receiving per-file progress and checked for cancellation.
+    :return: An iterator over content chunks.
+    """
+    yield from FolderExport(path, manifest, options, cache, progress).iter_chunks()
 
 
-def export_folder_content(path):
+def export_folder_content(
+        path,
+        manifest: Optional[Manifest] = None,
+        options: Optional[ExportOptions] = None,
+        cache: Optional["ExportCache"] = None,
+):
     """
     Export the content of all included files in the folder.
 
     :param path: The root directory to export.
+    :param manifest: Optional pre-scanned manifest; the directory is scanned when omitted.
+    :param options: Optional ExportOptions; defaults are used when omitted.
+    :param cache: Optional ExportCache used to skip unchanged files.
     :return: A string containing the exported content.
     """
-    spec = parse_ignore_file(path)
-    content = []
-    for root, dirs, files in os.walk(path):
-        # Compute relative path from the root directory
-        rel_root = os.path.relpath(root, path)
-        if rel_root == ".":
-            rel_root = ""
-
-        # Modify dirs in-place to skip ignored directories
-        dirs[:] = [
-            d for d in dirs if should_include_item(os.path.join(rel_root, d), spec)
-        ]
-
-        for dir_name in dirs:
-            logging.debug(f"Including directory: {os.path.join(rel_root, dir_name)}")
-
-        for file in files:
-            rel_file_path = os.path.join(rel_root, file) if rel_root else file
-            if should_include_item(rel_file_path, spec):
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        file_content = f.read()
-                        if file_content.strip():
-                            content.append(f"# File: {rel_file_path}\n")
-                            content.append("```\n")
-                            content.append(file_content)
-                            content.append("\n```\n\n")
-                        else:
-                            content.append(f"# File: {rel_file_path}\n")
-                            content.append("`File is empty`\n\n")
-                except UnicodeDecodeError as e:
-                    # Handle binary files or files with encoding issues
-                    logging.error(f"Error reading {rel_file_path}: {e}")
-                    content.append(f"# File: {rel_file_path}\n")
-                    content.append("`Binary or unreadable file`\n\n")
-                except Exception as e:
-                    content.append(f"Error reading {rel_file_path}: {str(e)}\n\n")
-            else:
-                logging.debug(f"Skipping file: {rel_file_path}")
-    return "".join(content)
+    return "".join(iter_folder_content(path, manifest, options, cache))
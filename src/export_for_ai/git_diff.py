@@ -0,0 +1,369 @@
+import codecs
+import logging
+import os
+import posixpath
+import re
+import subprocess
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from export_for_ai.file_types import get_extension, prefix_is_binary
+from export_for_ai.folder_exporter import BINARY, EMPTY, TEXT, ExportedFile, decode_text
+from export_for_ai.ignore_parser import IgnoreChain, load_nested_ignore, parse_ignore_file
+from export_for_ai.metrics import metrics
+from export_for_ai.options import ExportOptions
+from export_for_ai.scanner import Manifest, ManifestEntry
+
+# Git file modes that are not regular files: symlinks and submodules
+SKIPPED_MODES = ("120000", "160000")
+
+_PYTHON_IMPORT = re.compile(r'^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+\(?([\w., \t]*)|import[ \t]+([\w.]+))', re.MULTILINE)
+_JS_IMPORT = re.compile(
+    r'''(?:\bfrom\s*|\bimport\s*\(?\s*|\brequire\(\s*)['"](\.{1,2}/[^'"]+)['"]'''
+)
+_C_INCLUDE = re.compile(r'^\s*#\s*include\s+"([^"]+)"', re.MULTILINE)
+_JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue', '.svelte')
+_JS_RESOLVE = ('', '.ts', '.tsx', '.js', '.jsx', '.mjs', '/index.ts', '/index.tsx', '/index.js')
+_C_EXTENSIONS = ('.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.hh', '.m', '.mm')
+
+
+class GitError(RuntimeError):
+    """Raised when a git command needed for a diff export fails."""
+
+
+class ChangedFile(NamedTuple):
+    """One file changed between the merge base and HEAD; paths use forward slashes."""
+
+    path: str
+    # Git status letter: A(dded), M(odified), D(eleted), R(enamed), T(ype change)
+    status: str
+    # Blob of the new version, None for deletions
+    blob: Optional[str]
+    old_path: Optional[str] = None
+
+
+def _git(path: str, *args: str) -> bytes:
+    try:
+        completed = subprocess.run(
+            ["git", "-C", path, *args], capture_output=True, check=True
+        )
+    except FileNotFoundError:
+        raise GitError("git is not installed")
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise GitError(message[-1] if message else f"git {args[0]} failed")
+    return completed.stdout
+
+
+def list_changes(path: str, base: str, head: str) -> List[ChangedFile]:
+    """
+    Lists the files changed between two commits below ``path``, with their new blobs.
+
+    :param path: Directory inside the work tree; paths are relative to it.
+    :param base: The old commit.
+    :param head: The new commit.
+    :return: ChangedFile entries in path order.
+    """
+    output = _git(path, "diff", "--raw", "-z", "--no-abbrev", "--find-renames", "--relative", base, head)
+    fields = output.split(b"\0")
+    changes = []
+    index = 0
+    while index < len(fields) - 1:
+        # ":<old mode> <new mode> <old blob> <new blob> <status>" then one or two paths
+        old_mode, new_mode, _, new_blob, status = fields[index].decode("ascii").lstrip(":").split()
+        index += 1
+        old_path = None
+        if status[0] in "RC":
+            old_path = fields[index].decode("utf-8", "surrogateescape")
+            index += 1
+        file_path = fields[index].decode("utf-8", "surrogateescape")
+        index += 1
+        if new_mode in SKIPPED_MODES or (status == "D" and old_mode in SKIPPED_MODES):
+            continue
+        blob = None if status == "D" else new_blob
+        changes.append(ChangedFile(file_path, status[0], blob, old_path))
+    return sorted(changes, key=lambda change: change.path)
+
+
+def list_tree(path: str, commit: str) -> Dict[str, Tuple[str, int]]:
+    """Maps every regular file of ``commit`` below ``path`` to its (blob, size)."""
+    files = {}
+    for record in _git(path, "ls-tree", "-r", "-l", "-z", commit).split(b"\0"):
+        if not record:
+            continue
+        info, file_path = record.split(b"\t", 1)
+        mode, kind, blob, size = info.decode("ascii").split()
+        if kind == "blob" and mode not in SKIPPED_MODES:
+            files[file_path.decode("utf-8", "surrogateescape")] = (blob, int(size))
+    return files
+
+
+def read_blobs(path: str, blobs: Iterable[str]) -> Dict[str, bytes]:
+    """
+    Reads blobs straight from the object database with one ``git cat-file --batch``.
+
+    :param path: Directory inside the repository.
+    :param blobs: Object names to read.
+    :return: The content of each blob that exists, by name.
+    """
+    names = list(dict.fromkeys(blobs))
+    if not names:
+        return {}
+    process = subprocess.Popen(
+        ["git", "-C", path, "cat-file", "--batch"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+
+    def feed() -> None:
+        # Written from a thread so a full stdout pipe cannot deadlock the request stream
+        try:
+            process.stdin.write("".join(f"{name}\n" for name in names).encode("ascii"))
+        finally:
+            process.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    contents = {}
+    try:
+        for name in names:
+            header = process.stdout.readline().split()
+            if len(header) < 3 or header[1] != b"blob":
+                continue
+            size = int(header[2])
+            contents[name] = process.stdout.read(size)
+            process.stdout.read(1)
+    finally:
+        writer.join()
+        process.stdout.close()
+        process.wait()
+    metrics.count("blobs_read", len(contents))
+    metrics.count("bytes_read", sum(len(data) for data in contents.values()))
+    return contents
+
+
+def _imported_names(names: str) -> List[str]:
+    return [name.split()[0] for name in names.split(",") if name.strip()]
+
+
+def _python_targets(file_path: str, content: str, modules: Dict[str, List[str]]) -> Iterable[str]:
+    directory = posixpath.dirname(file_path)
+    for match in _PYTHON_IMPORT.finditer(content):
+        module, names, plain = match.groups()
+        candidates = []
+        if plain:
+            candidates.append(plain)
+        elif module.startswith("."):
+            level = len(module) - len(module.lstrip("."))
+            base = directory
+            for _ in range(level - 1):
+                base = posixpath.dirname(base)
+            stem = posixpath.join(base, module.lstrip(".").replace(".", "/")).strip("/")
+            # "from . import x" may name submodules
+            for name in [""] + _imported_names(names):
+                target = posixpath.join(stem, name).strip("/")
+                if target:
+                    yield f"{target}.py"
+                    yield f"{target}/__init__.py"
+            continue
+        else:
+            candidates.append(module)
+            candidates.extend(f"{module}.{name}" for name in _imported_names(names))
+        for dotted in candidates:
+            tail = dotted.replace(".", "/")
+            # Absolute imports can live below a source root such as src/
+            for suffix in (f"{tail}.py", f"{tail}/__init__.py"):
+                for candidate in modules.get(posixpath.basename(suffix), ()):
+                    if candidate == suffix or candidate.endswith("/" + suffix):
+                        yield candidate
+
+
+def _relative_targets(file_path: str, specifiers: Iterable[str], suffixes: Tuple[str, ...]) -> Iterable[str]:
+    directory = posixpath.dirname(file_path)
+    for specifier in specifiers:
+        target = posixpath.normpath(posixpath.join(directory, specifier))
+        for suffix in suffixes:
+            yield target + suffix
+
+
+def find_related(
+        changed: Dict[str, str], tree: Dict[str, Tuple[str, int]], limit: int
+) -> List[str]:
+    """
+    Picks files referenced by the imports of the changed files.
+
+    Python imports (absolute and relative), relative JavaScript/TypeScript
+    imports and quoted C includes are resolved against the files of the tree;
+    the ``limit`` files referenced most often are returned.
+
+    :param changed: Text content of the changed files, by path.
+    :param tree: Files of the commit, as returned by list_tree.
+    :param limit: Maximum number of related files.
+    """
+    modules: Dict[str, List[str]] = {}
+    for file_path in tree:
+        if file_path.endswith(".py"):
+            modules.setdefault(posixpath.basename(file_path), []).append(file_path)
+    references = Counter()
+    for file_path, content in changed.items():
+        ext = get_extension(file_path)
+        if ext == ".py":
+            targets = _python_targets(file_path, content, modules)
+        elif ext in _JS_EXTENSIONS:
+            targets = _relative_targets(file_path, _JS_IMPORT.findall(content), _JS_RESOLVE)
+        elif ext in _C_EXTENSIONS:
+            targets = _relative_targets(file_path, _C_INCLUDE.findall(content), ("",))
+        else:
+            continue
+        for target in set(targets):
+            if target in tree and target not in changed:
+                references[target] += 1
+    ranked = sorted(references.items(), key=lambda item: (-item[1], item[0]))
+    return [file_path for file_path, _ in ranked[:limit]]
+
+
+def _ignore_filter(root: str, options: ExportOptions):
+    """Returns a predicate telling whether a slash-separated path is ignored by the export rules."""
+    chains: Dict[str, Optional[IgnoreChain]] = {
+        "": IgnoreChain([("", parse_ignore_file(root, use_gitignore=options.use_gitignore))])
+    }
+
+    def chain_for(directory: str) -> Optional[IgnoreChain]:
+        # None marks a directory that is itself ignored
+        if directory not in chains:
+            parent = chain_for(posixpath.dirname(directory))
+            if parent is None or parent.is_ignored(directory, True):
+                chains[directory] = None
+            elif options.nested_ignore:
+                matcher = load_nested_ignore(os.path.join(root, directory), options.use_gitignore)
+                chains[directory] = parent.child(directory, matcher)
+            else:
+                chains[directory] = parent
+        return chains[directory]
+
+    def is_ignored(file_path: str) -> bool:
+        chain = chain_for(posixpath.dirname(file_path))
+        return chain is None or chain.is_ignored(file_path)
+
+    return is_ignored
+
+
+def manifest_from_files(root: str, files: Dict[str, int]) -> Manifest:
+    """Builds a Manifest in tree order from slash-separated file paths and their sizes."""
+    tree: dict = {}
+    for file_path in files:
+        node = tree
+        for part in file_path.split("/")[:-1]:
+            node = node.setdefault(part + "/", {})
+        node[file_path.rsplit("/", 1)[-1]] = None
+    entries: List[ManifestEntry] = []
+
+    def walk(node: dict, rel_dir: str, depth: int) -> None:
+        for key in sorted(name for name in node if name.endswith("/")):
+            name = key[:-1]
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            entries.append(ManifestEntry(rel_path, name, depth, True, 0))
+            walk(node[key], rel_path, depth + 1)
+        for name in sorted(name for name in node if not name.endswith("/")):
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            size = files[rel_path.replace(os.sep, "/")]
+            entries.append(ManifestEntry(rel_path, name, depth, False, size))
+
+    walk(tree, "", 1)
+    return Manifest(root, entries)
+
+
+class GitDiffExport:
+    """
+    The change set of a branch against a base ref, read from the object database.
+
+    Files changed between the merge base of ``base`` and HEAD are exported as
+    committed at HEAD, with their blobs read by one ``git cat-file --batch``,
+    plus up to ``options.diff_related`` unchanged files they import. Paths
+    excluded by the ignore rules are left out. Uncommitted changes are not
+    part of the export.
+    """
+
+    def __init__(self, path: str, options: ExportOptions):
+        self.path = path
+        self.options = options
+        self.base = options.diff_base
+        with metrics.stage("git_diff"):
+            self.head = _git(path, "rev-parse", "--verify", "HEAD").decode("ascii").strip()
+            self.merge_base = _git(
+                path, "merge-base", self.base, self.head
+            ).decode("ascii").strip()
+            is_ignored = _ignore_filter(path, options)
+            self.changes = [
+                change for change in list_changes(path, self.merge_base, self.head)
+                if not is_ignored(change.path)
+            ]
+            blobs = read_blobs(path, [change.blob for change in self.changes if change.blob])
+            self.contents = {
+                change.path: blobs[change.blob] for change in self.changes if change.blob in blobs
+            }
+            self.related: List[str] = []
+            if options.diff_related:
+                tree = list_tree(path, self.head)
+                texts = {}
+                for file_path, data in self.contents.items():
+                    if not prefix_is_binary(data[:options.sniff_bytes]):
+                        texts[file_path] = data.decode("utf-8", "replace")
+                candidates = [
+                    file_path for file_path in find_related(texts, tree, len(tree))
+                    if not is_ignored(file_path)
+                ]
+                self.related = candidates[:options.diff_related]
+                related_blobs = read_blobs(path, [tree[file_path][0] for file_path in self.related])
+                for file_path in self.related:
+                    self.contents[file_path] = related_blobs.get(tree[file_path][0], b"")
+        logging.info(
+            f"Diff against {self.base} ({self.merge_base[:10]}): {len(self.changes)} changed files, "
+            f"{len(self.related)} related files"
+        )
+
+    def manifest(self) -> Manifest:
+        return manifest_from_files(
+            self.path, {file_path: len(data) for file_path, data in self.contents.items()}
+        )
+
+    def read(self, entry: ManifestEntry, limit: Optional[int] = None) -> ExportedFile:
+        """Classifies and decodes one blob like read_exported_file does for files on disk."""
+        data = self.contents.get(entry.rel_path.replace(os.sep, "/"), b"")
+        ext = get_extension(entry.rel_path)
+        options = self.options
+        if ext in options.binary_extensions or (
+                ext not in options.text_extensions and prefix_is_binary(data[:options.sniff_bytes])
+        ):
+            metrics.count("files_binary")
+            return ExportedFile(entry.rel_path, BINARY)
+        try:
+            if limit is not None:
+                content = codecs.getincrementaldecoder("utf-8")().decode(data[:limit], final=False)
+                content += f"\n... [truncated: {limit} of {len(data)} bytes shown]"
+            else:
+                content = decode_text(data)
+        except UnicodeDecodeError:
+            metrics.count("files_binary")
+            return ExportedFile(entry.rel_path, BINARY)
+        metrics.count("files_read")
+        if content.strip():
+            return ExportedFile(entry.rel_path, TEXT, content)
+        return ExportedFile(entry.rel_path, EMPTY)
+
+    def summary(self) -> str:
+        """Renders the list of changes as a markdown section."""
+        lines = [
+            "# Changes",
+            f"Diff of HEAD ({self.head[:10]}) against {self.base} (merge base {self.merge_base[:10]}): "
+            f"{len(self.changes)} changed files, {len(self.related)} related files included.",
+            "",
+        ]
+        for change in self.changes:
+            renamed = f" (from {change.old_path})" if change.old_path else ""
+            lines.append(f"- {change.status} {change.path}{renamed}")
+        if self.related:
+            lines.append("")
+            lines.append("Related files (imported by the changes):")
+            lines.extend(f"- {file_path}" for file_path in self.related)
+        return "\n".join(lines) + "\n"
@@ -1,8 +1,12 @@
 import logging
 import os
+import re
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from pathspec import PathSpec
-from pathspec.patterns import GitWildMatchPattern
+from export_for_ai.metrics import metrics
+
+if TYPE_CHECKING:
+    from pathspec.patterns import GitWildMatchPattern
 
 DEFAULT_IGNORE_PATTERNS = [
     '__pycache__/',
@@ -71,40 +75,275 @@ DEFAULT_IGNORE_PATTERNS = [
     '/output/',
     '.bin/',
     '.obj/',
+    'exported-from-*/',
 ]
 
 
-def parse_ignore_file(directory):
+# Characters that make a pattern more than a plain name or extension
+_WILDCARD_CHARS = set('*?[]\\!')
+_NAMED_GROUP = re.compile(r'\(\?P<[^>]+>')
+
+
+class _PatternGroup:
+    """
+    Consecutive patterns sharing one polarity, matched as a unit.
+
+    Plain names (``.git``, ``build/``) and extensions (``*.log``) are checked
+    against path components with set and suffix lookups; every other pattern
+    is folded into a single combined regular expression.
+    """
+
+    def __init__(self, include: bool):
+        self.include = include
+        self.names = set()
+        self.dir_names = set()
+        self.suffixes = []
+        self.dir_suffixes = []
+        self.regexes = []
+        self.regex = None
+
+    def add(self, pattern: str, compiled: "GitWildMatchPattern") -> None:
+        text = pattern[1:] if pattern.startswith('!') else pattern
+        dir_only = text.endswith('/')
+        body = text[:-1] if dir_only else text
+        if body and '/' not in body and not (_WILDCARD_CHARS & set(body)):
+            (self.dir_names if dir_only else self.names).add(body)
+        elif (body.startswith('*.') and '/' not in body
+              and not (_WILDCARD_CHARS & set(body[1:]))):
+            (self.dir_suffixes if dir_only else self.suffixes).append(body[1:])
+        else:
+            self.regexes.append(_NAMED_GROUP.sub('(?:', compiled.regex.pattern))
+
+    def finish(self) -> None:
+        self.suffixes = tuple(self.suffixes)
+        self.dir_suffixes = tuple(self.dir_suffixes)
+        if self.regexes:
+            self.regex = re.compile('|'.join(f'(?:{r})' for r in self.regexes))
+
+    def matches(self, path: str, parts: List[str]) -> bool:
+        if self.names and not self.names.isdisjoint(parts):
+            return True
+        if self.dir_names and not self.dir_names.isdisjoint(parts[:-1]):
+            return True
+        if self.suffixes and any(part.endswith(self.suffixes) for part in parts):
+            return True
+        if self.dir_suffixes and any(part.endswith(self.dir_suffixes) for part in parts[:-1]):
+            return True
+        return self.regex is not None and self.regex.match(path) is not None
+
+
+class IgnoreMatcher:
+    """
+    Compiled gitignore-style matcher, equivalent to a PathSpec of GitWildMatchPatterns.
+
+    Patterns are grouped into runs of the same polarity; groups are checked
+    from the last to the first, so the last matching pattern still wins.
+    Directory decisions are memoized so that scanners can prune excluded
+    subtrees without re-evaluating their prefixes.
+    """
+
+    def __init__(self, patterns: List[str]):
+        # Imported on first use so that importing the CLI does not load pathspec
+        from pathspec.patterns import GitWildMatchPattern
+
+        self.patterns = list(patterns)
+        self.groups: List[_PatternGroup] = []
+        for pattern in self.patterns:
+            compiled = GitWildMatchPattern(pattern)
+            if compiled.include is None:
+                continue
+            if not self.groups or self.groups[-1].include != compiled.include:
+                self.groups.append(_PatternGroup(compiled.include))
+            self.groups[-1].add(pattern, compiled)
+        for group in self.groups:
+            group.finish()
+        self.groups.reverse()
+        self._dir_cache: Dict[str, bool] = {}
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        if os.sep != '/':
+            path = path.replace(os.sep, '/')
+        if path.startswith('./'):
+            path = path[2:]
+        return path
+
+    def check(self, path: str) -> Optional[bool]:
+        """
+        Returns True if the last matching pattern ignores the normalized path,
+        False if it re-includes it, and None if no pattern matches.
+        """
+        parts = path.split('/')
+        for group in self.groups:
+            if group.matches(path, parts):
+                return group.include
+        return None
+
+    def match_file(self, path: str) -> bool:
+        """Returns True if the path is ignored, like PathSpec.match_file."""
+        return bool(self.check(self.normalize(path)))
+
+    def match_dir(self, path: str) -> bool:
+        """Returns True if the directory is ignored, memoizing the decision."""
+        path = self.normalize(path).rstrip('/')
+        ignored = self._dir_cache.get(path)
+        if ignored is None:
+            ignored = bool(self.check(path + '/'))
+            self._dir_cache[path] = ignored
+        return ignored
+
+
+EXPORTIGNORE = '.exportignore'
+GITIGNORE = '.gitignore'
+
+# Compiled matchers keyed by directory, reused while the ignore files are unchanged
+_matcher_cache: Dict[tuple, Tuple[tuple, Optional[IgnoreMatcher]]] = {}
+
+
+def read_ignore_patterns(ignore_file_path):
+    """
+    Reads the patterns of one gitignore-style file, skipping blanks and comments.
+
+    :param ignore_file_path: Path to the ignore file.
+    :return: The list of patterns.
+    """
+    patterns = []
+    with open(ignore_file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(line)
+    return patterns
+
+
+def _ignore_file_stamps(directory, file_names):
+    stamps = []
+    for name in file_names:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        stamps.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def _load_matcher(directory, file_names, base_patterns=()):
+    """Builds (or reuses) the matcher for the ignore files present in a directory."""
+    stamps = _ignore_file_stamps(directory, file_names)
+    key = (os.path.abspath(directory), tuple(file_names), bool(base_patterns))
+    cached = _matcher_cache.get(key)
+    if cached is not None and cached[0] == stamps:
+        return cached[1], stamps
+
+    patterns = list(base_patterns)
+    for name, _, _ in stamps:
+        patterns.extend(read_ignore_patterns(os.path.join(directory, name)))
+    metrics.count("ignore_files_loaded", len(stamps))
+    metrics.count("ignore_patterns", len(patterns))
+    with metrics.stage("ignore_compile"):
+        matcher = IgnoreMatcher(patterns) if patterns else None
+    _matcher_cache[key] = (stamps, matcher)
+    return matcher, stamps
+
+
+def parse_ignore_file(directory, use_gitignore=False):
     """
     Parses the .exportignore file and combines it with default ignore patterns.
+
+    When ``use_gitignore`` is set, the root .gitignore is applied first so that
+    .exportignore can override it. The compiled matcher is cached until one of
+    the files changes.
     
     :param directory: The root directory of the project.
-    :return: A PathSpec object containing all ignore patterns.
+    :param use_gitignore: Also read the root .gitignore.
+    :return: An IgnoreMatcher containing all ignore patterns.
     """
-    ignore_file_path = os.path.join(directory, '.exportignore')
-    patterns = DEFAULT_IGNORE_PATTERNS.copy()
+    file_names = (GITIGNORE, EXPORTIGNORE) if use_gitignore else (EXPORTIGNORE,)
+    spec, stamps = _load_matcher(directory, file_names, DEFAULT_IGNORE_PATTERNS)
 
-    if os.path.exists(ignore_file_path):
-        with open(ignore_file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    patterns.append(line)
+    if any(name == EXPORTIGNORE for name, _, _ in stamps):
         logging.info(f"Loaded ignore patterns from .exportignore")
     else:
         logging.warning("No .exportignore file found. Using default exclusion rules.")
 
-    spec = PathSpec.from_lines(GitWildMatchPattern, patterns)
-    logging.debug(f"Final ignore patterns: {patterns}")
+    logging.debug(f"Final ignore patterns: {spec.patterns}")
     return spec
 
 
+def load_nested_ignore(directory, use_gitignore=True):
+    """
+    Returns the matcher for a sub-directory's own .gitignore/.exportignore files.
+
+    :param directory: The sub-directory on disk.
+    :param use_gitignore: Also read the directory's .gitignore.
+    :return: An IgnoreMatcher, or None if the directory has no ignore files.
+    """
+    file_names = (GITIGNORE, EXPORTIGNORE) if use_gitignore else (EXPORTIGNORE,)
+    return _load_matcher(directory, file_names)[0]
+
+
+class IgnoreChain:
+    """
+    The matchers that apply inside one directory, following git precedence.
+
+    Each level pairs the directory's path prefix (relative to the export root,
+    empty for the root itself) with its matcher. Levels are checked from the deepest to the root, and the
+    first level with a matching pattern decides, so nested files override
+    their parents. Within a level, .exportignore overrides .gitignore.
+    """
+
+    def __init__(self, levels: List[Tuple[str, IgnoreMatcher]]):
+        self.levels = levels
+
+    def child(self, prefix, matcher):
+        """Returns the chain for a sub-directory with its own matcher."""
+        if matcher is None:
+            return self
+        return IgnoreChain([(IgnoreMatcher.normalize(prefix).rstrip('/') + '/', matcher)] + self.levels)
+
+    def is_ignored(self, item, is_dir=False):
+        """
+        Decides whether a path relative to the export root is ignored.
+
+        :param item: The relative path of the item.
+        :param is_dir: True if the item is a directory.
+        :return: True if the item is ignored, False otherwise.
+        """
+        path = IgnoreMatcher.normalize(item)
+        if len(self.levels) == 1:
+            matcher = self.levels[0][1]
+            return matcher.match_dir(path) if is_dir else bool(matcher.check(path))
+        if is_dir:
+            path = path.rstrip('/') + '/'
+        for prefix, matcher in self.levels:
+            decision = matcher.check(path[len(prefix):])
+            if decision is not None:
+                return decision
+        return False
+
+
 def should_include_item(item, spec):
     """
     Determines whether an item should be included based on ignore patterns.
     
     :param item: The relative path of the item.
-    :param spec: The PathSpec object containing ignore patterns.
+    :param spec: The IgnoreMatcher (or PathSpec) containing ignore patterns.
     :return: True if the item should be included, False otherwise.
     """
     return not spec.match_file(item)
+
+
+def should_include_dir(item, spec):
+    """
+    Determines whether a directory should be included, and so descended into.
+
+    Directory-only patterns such as ``build/`` are matched against the
+    directory itself, so excluded subtrees are pruned as a whole.
+
+    :param item: The relative path of the directory.
+    :param spec: The IgnoreMatcher (or PathSpec) containing ignore patterns.
+    :return: True if the directory should be included, False otherwise.
+    """
+    if isinstance(spec, IgnoreMatcher):
+        return not spec.match_dir(item)
+    return not spec.match_file(item.rstrip('/\\') + '/')
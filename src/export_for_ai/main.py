@@ -1,28 +1,68 @@
 # main.py
+import argparse
 import html
 import logging
 import os
 import re
-import sys
-from typing import Optional
+from dataclasses import replace
+from typing import Iterable, Iterator, Optional, Union
+
+from export_for_ai.folder_exporter import FolderExport
+from export_for_ai.options import (
+    DEFAULT_CLIPBOARD_MAX_BYTES,
+    ExportOptions,
+    add_export_arguments,
+    options_from_arguments,
+)
+from export_for_ai.repository_export import open_git_diff, process_single_repository
+from export_for_ai.scanner import Manifest, scan_directory
+from export_for_ai.tree_visualizer import iter_tree_structure
+
+# Opens project-<name>.md, ahead of the tree and the contents
+EFA_SECTIONS = """
+# Previous step 
+
+# The goal
+
+# Core Design Philosophy
+Seek a most minimal, simple, fewest LOC, lowest complexity design plans or paths to the required functionality. Preserve the robust, clutter-free design, and avoid any code, features, or decorations that do not directly contribute to the strictly essential functionality. It must be raw, and should aim to retain most or all existing functionality, unless the task is to, or requires that you, remove it. Aim to avoid creating divergent code pathways, and instead seek unified routes without branching where possible. Don't attempt to improvise, innovate, make unspecified improvements or changes, or move outside the scope of your specified task. Do not blindly follow the task instructions and analysis. Verify for yourself that the conclusions are accurate, and will not cause unanticipated side effects.
+
+### Requirement:
+Leverages existing libraries when possible to minimize manual implementation.
+
+### Requirement:
+Use already existing implementation when possible.
+
+### Requirement:
+Create reusable code and reuse existing code.
 
-import pyperclip
-import yaml
+### Requirement:
+Implement abstractions like base classes and common interfaces.
 
-from export_for_ai.folder_exporter import export_folder_content, minify_code
-from export_for_ai.tree_visualizer import get_tree_structure
+### Requirement:
+Utilize the best libraries to minimize manual coding
+"""
 
 
 def setup_logging() -> None:
     logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
 
 
-def parse_arguments() -> Optional[str]:
-    if len(sys.argv) != 2:
-        logging.error("Usage: export-for-ai <directory_path>")
-        return None
-
-    return os.path.abspath(sys.argv[1])
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="export-for-ai", usage="export-for-ai <directory_path> [options]"
+    )
+    parser.add_argument("directory_path", type=os.path.abspath)
+    parser.add_argument(
+        "--clipboard", action="store_true",
+        help="Copy the generated project markdown to the clipboard",
+    )
+    parser.add_argument(
+        "--clipboard-max-bytes", type=int, default=DEFAULT_CLIPBOARD_MAX_BYTES,
+        help="Skip the clipboard copy when the export is larger than this",
+    )
+    add_export_arguments(parser)
+    return parser.parse_args()
 
 
 def validate_directory(directory_path: str) -> bool:
@@ -50,6 +90,39 @@ def create_export_directory(directory_path: str) -> Optional[tuple[str, str]]:
         return None
 
 
+def _tag_start(tag: str, attributes: dict = None) -> str:
+    """Returns ``<tag`` followed by the escaped attributes, validating the tag name."""
+    # Validate tag name (simple regex for tag names)
+    if not re.match(r"^[A-Za-z_][A-Za-z0-9_.-]*$", tag):
+        raise ValueError(f"Invalid tag name: {tag}")
+
+    attrs = ""
+    if attributes:
+        attrs = " " + " ".join(
+            f'{key}="{html.escape(str(value), quote=True)}"'
+            for key, value in attributes.items()
+        )
+    return f"<{tag}{attrs}"
+
+
+def iter_tag(tag: str, chunks: Iterable[str], attributes: dict = None) -> Iterator[str]:
+    """
+    Yields a tag wrapping content chunks, escaping each chunk on its own.
+
+    html.escape replaces single characters, so escaping chunk by chunk gives
+    the same text as escaping the whole content, without building it.
+
+    :param tag: The name of the tag.
+    :param chunks: The inner content, consumed lazily.
+    :param attributes: A dictionary of attributes for the tag.
+    :return: An iterator over the tag's text.
+    """
+    yield f"{_tag_start(tag, attributes)}>\n\n"
+    for chunk in chunks:
+        yield html.escape(chunk)
+    yield f"\n\n</{tag}>"
+
+
 def build_tag(
         tag: str, content: str, attributes: dict = None, self_closing: bool = False
 ) -> str:
@@ -62,65 +135,48 @@ def build_tag(
     :param self_closing: If True, creates a self-closing tag.
     :return: The constructed tag as a string.
     """
-    # Validate tag name (simple regex for tag names)
-    if not re.match(r"^[A-Za-z_][A-Za-z0-9_.-]*$", tag):
-        raise ValueError(f"Invalid tag name: {tag}")
-
-    attrs = ""
-    if attributes:
-        attrs = " " + " ".join(
-            f'{key}="{html.escape(str(value), quote=True)}"'
-            for key, value in attributes.items()
-        )
-
     if self_closing:
-        return f"<{tag}{attrs} />"
-    else:
-        escaped_content = html.escape(content)
-        return f"<{tag}{attrs}>\n\n{escaped_content}\n\n</{tag}>"
+        return f"{_tag_start(tag, attributes)} />"
+    return "".join(iter_tag(tag, [content], attributes))
 
 
 def save_content(
-        content: str, output_file: str, tag: str = "LogicalBlock", attributes: dict = None
+        content: Union[str, Iterable[str]], output_file: str, tag: str = "LogicalBlock", attributes: dict = None
 ) -> bool:
     """
     Saves the content wrapped in a specified tag to an output file.
 
-    :param content: The content to wrap and save.
+    Content given as chunks is escaped and written one chunk at a time, so
+    only the current chunk is held in memory.
+
+    :param content: The content to wrap and save, as a string or an iterable of chunks.
     :param output_file: The path to the output file.
     :param tag: The tag to wrap the content with.
     :param attributes: Optional dictionary of attributes for the tag.
     :return: True if successful, False otherwise.
     """
-    try:
-        minify = minify_code(content)
-
-        wrapped_content = build_tag(tag, minify, attributes)
+    from export_for_ai.writers import atomic_output
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(wrapped_content)
+    chunks = [content] if isinstance(content, str) else content
+    try:
+        with atomic_output(output_file) as f:
+            for chunk in iter_tag(tag, chunks, attributes):
+                f.write(chunk)
         logging.info(f"Content exported to {output_file}")
         return True
-    except (IOError, ValueError) as e:
+    except Exception as e:
         logging.error(f"Error writing to file: {e}")
         return False
 
 
-def export_tree_structure(directory_path: str) -> Optional[str]:
-    try:
-        logging.info("Exporting directory structure...")
-        return get_tree_structure(directory_path)
-    except Exception as e:
-        logging.error(f"Error generating tree structure: {e}")
-        return None
-
-
-def export_folder_contents(directory_path: str) -> Optional[str]:
+def scan_repository(
+        directory_path: str, options: Optional[ExportOptions] = None
+) -> Optional[Manifest]:
     try:
-        logging.info("Exporting folder contents...")
-        return export_folder_content(directory_path)
+        logging.info("Scanning directory...")
+        return scan_directory(directory_path, options=options)
     except Exception as e:
-        logging.error(f"Error exporting folder contents: {e}")
+        logging.error(f"Error scanning directory: {e}")
         return None
 
 
@@ -129,76 +185,10 @@ def export_folder_contents(directory_path: str) -> Optional[str]:
 # ... (rest of the imports and existing code)
 
 
-def export_project_md(
-        tree_structure: str, folder_contents: str, export_dir: str, folder_name: str
-) -> bool:
-    """
-    Combines the dynamically added sections, tree structure, and folder contents into project.md.
-    Also copies the content to system clipboard.
-
-    :param tree_structure: The string representation of the tree structure.
-    :param folder_contents: The string representation of the folder contents.
-    :param export_dir: The directory where project.md will be saved.
-    :param folder_name: The name of the original folder.
-    :return: True if successful, False otherwise.
-    """
-    try:
-        # Get dynamically added sections
-        dynamic_sections = """
-# Previous step 
-
-# The goal
-
-# Core Design Philosophy
-Seek a most minimal, simple, fewest LOC, lowest complexity design plans or paths to the required functionality. Preserve the robust, clutter-free design, and avoid any code, features, or decorations that do not directly contribute to the strictly essential functionality. It must be raw, and should aim to retain most or all existing functionality, unless the task is to, or requires that you, remove it. Aim to avoid creating divergent code pathways, and instead seek unified routes without branching where possible. Don't attempt to improvise, innovate, make unspecified improvements or changes, or move outside the scope of your specified task. Do not blindly follow the task instructions and analysis. Verify for yourself that the conclusions are accurate, and will not cause unanticipated side effects.
-
-### Requirement:
-Leverages existing libraries when possible to minimize manual implementation.
-
-### Requirement:
-Use already existing implementation when possible.
-
-### Requirement:
-Create reusable code and reuse existing code.
-
-### Requirement:
-Implement abstractions like base classes and common interfaces.
-
-### Requirement:
-Utilize the best libraries to minimize manual coding
-        """
-
-        content = (
-            f"{dynamic_sections}"
-            "\n\n# SolutionTreeView \n```\n"
-            f"{tree_structure}\n"
-            "```\n\n"
-            "\n\n# Entire Solution Code start \n"
-            f"{folder_contents}\n"
-            "# EntireSolution Code end \n"
-        )
-        
-        project_md_filename = f"project-{folder_name}.md"
-        project_md_path = os.path.join(export_dir, project_md_filename)
-        with open(project_md_path, "w", encoding="utf-8") as f:
-            f.write(content)
-        logging.info(f"{project_md_filename} exported to {project_md_path}")
-
-        # Copy content to clipboard
-        try:
-            pyperclip.copy(content)
-            logging.info("Content successfully copied to clipboard")
-        except Exception as e:
-            logging.warning(f"Could not copy to clipboard: {e}")
-
-        return True
-    except Exception as e:
-        logging.error(f"Error exporting project.md: {e}")
-        return False
-
-
 def load_config(config_path: str) -> dict:
     try:
+        import yaml
+
         with open(config_path, "r", encoding="utf-8") as f:
             return yaml.safe_load(f)
     except Exception as e:
@@ -209,13 +199,21 @@ def load_config(config_path: str) -> dict:
 def main() -> None:
     setup_logging()
 
-    directory_path = parse_arguments()
-    if not directory_path:
-        return
+    args = parse_arguments()
+    directory_path = args.directory_path
 
     if not validate_directory(directory_path):
         return
 
+    # Read the change set before creating the export directory, so a bad
+    # base ref or a non-git directory leaves nothing behind
+    options = options_from_arguments(args)
+    git_diff = None
+    if options.diff_base:
+        git_diff = open_git_diff(directory_path, options)
+        if git_diff is None:
+            return
+
     export_dir, folder_name = create_export_directory(directory_path)
     if export_dir is None:
         return
@@ -223,26 +221,62 @@ def main() -> None:
     # Load section contents from config.yaml
     # Skipped
 
-    # Export Directory Structure
-    tree_structure = export_tree_structure(directory_path)
-    if tree_structure:
-        tree_output_file = os.path.join(export_dir, "project_structure.txt")
-        if not save_content(tree_structure, tree_output_file, "SolutionTreeView"):
+    # Scan once, or read the change set once, and share it between the outputs
+    if git_diff is not None:
+        manifest = git_diff.manifest()
+    else:
+        manifest = scan_repository(directory_path, options)
+        if manifest is None:
             return
 
-    # Export Folder Contents with Correct Tag and File Path
-    folder_contents = export_folder_contents(directory_path)
-    if folder_contents:
+    # Export Directory Structure, streamed from the manifest
+    tree_output_file = os.path.join(export_dir, "project_structure.txt")
+    if not save_content(
+            iter_tree_structure(directory_path, manifest, options), tree_output_file, "SolutionTreeView"
+    ):
+        return
+
+    if not manifest.files and not (git_diff and git_diff.changes):
+        logging.warning(f"No files to export in {directory_path}")
+        return
+
+    from export_for_ai.export_cache import MemoryCache, open_cache
+
+    cache = open_cache(directory_path, options) if git_diff is None else None
+    # Without the persistent cache (--diff, --no-cache) the bodies read for
+    # project_contents.md are kept for this run only
+    run_cache = cache if cache is not None else MemoryCache()
+    try:
+        # Export Folder Contents with Correct Tag and File Path; project_contents.md
+        # is minified file by file and the cache keeps the original content, so
+        # project.md does not read the files again. Files are selected once
+        # (query, dedupe, budgets) for both outputs
         folder_output_file = os.path.join(export_dir, "project_contents.md")
-        if not save_content(
-                folder_contents, folder_output_file, tag="EntireSolutionCode"
-        ):
+        contents = FolderExport(
+            directory_path, manifest, replace(options, minify=True), run_cache,
+            reader=git_diff.read if git_diff else None,
+        )
+        if not save_content(contents.iter_chunks(), folder_output_file, tag="EntireSolutionCode"):
             return
 
-    # Generate project.md combining tree and code with dynamic sections
-    if tree_structure and folder_contents:
-        if not export_project_md(tree_structure, folder_contents, export_dir, folder_name):
+        # project-<name>.md goes through the same writer as app_main, so the
+        # format, compression, split, store and diff options apply to it
+        if not process_single_repository(
+                directory_path,
+                options,
+                copy_to_clipboard=args.clipboard,
+                clipboard_max_bytes=args.clipboard_max_bytes,
+                manifest=manifest,
+                cache=cache,
+                export_destination=export_dir,
+                git_diff=git_diff,
+                sections=EFA_SECTIONS,
+                folder_export=contents.with_options(options),
+        ):
             return
+    finally:
+        if cache is not None:
+            cache.close()
 
     logging.info(f"Export completed successfully. Files saved in {export_dir}")
 
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Metrics:
+    """
+    Process-wide stage timers and counters for the export pipeline.
+
+    ``stage`` times a block and ``count`` adds to a counter; both are cheap
+    enough to stay enabled. Hot loops keep local counts and add them once.
+    Stages timed on worker threads (file reads) add up the time of every
+    thread, so their total can exceed the wall time of the export.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        # name -> [total seconds, calls]
+        self.stages: Dict[str, list] = {}
+        self.counters: Dict[str, int] = {}
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [seconds, calls]
+            else:
+                stage[0] += seconds
+                stage[1] += calls
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Yields from ``iterable``, timing only the time spent producing items."""
+        iterator = iter(iterable)
+        elapsed = 0.0
+        perf_counter = time.perf_counter
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += perf_counter() - start
+                    return
+                elapsed += perf_counter() - start
+                yield item
+        finally:
+            self.add_time(name, elapsed)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, snapshot: Optional[dict]) -> None:
+        """Adds a snapshot taken in another process, e.g. a batch worker."""
+        if not snapshot:
+            return
+        for name, stage in snapshot.get("stages", {}).items():
+            self.add_time(name, stage["seconds"], stage["calls"])
+        for name, value in snapshot.get("counters", {}).items():
+            self.count(name, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "since": self.started,
+                "stages": {
+                    name: {"seconds": round(seconds, 6), "calls": calls}
+                    for name, (seconds, calls) in self.stages.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def diff(self, before: dict) -> dict:
+        """Returns what was recorded since ``before`` was taken."""
+        now = self.snapshot()
+        previous_stages = before.get("stages", {})
+        previous_counters = before.get("counters", {})
+        stages = {}
+        for name, stage in now["stages"].items():
+            previous = previous_stages.get(name, {"seconds": 0, "calls": 0})
+            if stage["calls"] != previous["calls"]:
+                stages[name] = {
+                    "seconds": round(stage["seconds"] - previous["seconds"], 6),
+                    "calls": stage["calls"] - previous["calls"],
+                }
+        counters = {
+            name: value - previous_counters.get(name, 0)
+            for name, value in now["counters"].items()
+            if value != previous_counters.get(name, 0)
+        }
+        return {"since": before.get("since", now["since"]), "stages": stages, "counters": counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.stages.clear()
+            self.counters.clear()
+
+    def summary(self, snapshot: Optional[dict] = None) -> str:
+        """Renders stage timings and counters as a small text table."""
+        snapshot = snapshot or self.snapshot()
+        lines = ["Export metrics:"]
+        stages = sorted(snapshot["stages"].items(), key=lambda item: -item[1]["seconds"])
+        for name, stage in stages:
+            lines.append(f"  {name:<20} {stage['seconds']:10.3f}s  {stage['calls']:>8,} calls")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"  {name:<20} {value:>14,}")
+        return "\n".join(lines)
+
+
+# Shared by every export in the process, like the logging module's root logger
+metrics = Metrics()
@@ -0,0 +1,285 @@
+import re
+import sys
+from itertools import chain, compress, count, repeat
+from typing import List, Optional
+
+from export_for_ai.file_types import get_extension
+
+PYTHON_EXTENSIONS = frozenset({'.py', '.pyi', '.pyw'})
+# JS/TS also have regex literals, which a lexer cannot tell from division
+JS_EXTENSIONS = frozenset({'.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx'})
+C_STYLE_EXTENSIONS = JS_EXTENSIONS | frozenset({
+    '.c', '.h', '.cc', '.cpp', '.hpp',
+    '.cs', '.java', '.kt', '.kts', '.go', '.rs', '.swift', '.scala', '.php',
+    '.gradle', '.proto', '.dart',
+})
+# Only /* */ is a comment in CSS; "//" appears in url(http://...) values
+CSS_EXTENSIONS = frozenset({'.css', '.scss', '.less'})
+HASH_COMMENT_EXTENSIONS = frozenset({
+    '.sh', '.bash', '.zsh', '.yaml', '.yml', '.toml', '.rb', '.pl', '.r', '.conf',
+    '.cfg', '.tf', '.hcl', '.dockerfile', '.ps1', '.cmake',
+})
+HASH_COMMENT_NAMES = frozenset({'makefile', 'dockerfile', '.gitignore', '.exportignore'})
+
+def _chars_except(excluded: str) -> str:
+    """
+    Returns a character class matching any character but those in ``excluded``.
+
+    The class is written as ranges rather than ``[^...]``: the re module
+    tests a negated set of literals one literal at a time, while ranges
+    compile to a bitmap that scans about three times faster. The lexers
+    below spend nearly all their time in such classes.
+    """
+    ranges = []
+    start = 0
+    for code in sorted(set(map(ord, excluded))):
+        if code > start:
+            ranges.append((start, code - 1))
+        start = code + 1
+    ranges.append((start, sys.maxunicode))
+    return "[" + "".join(
+        re.escape(chr(first)) if first == last else f"{re.escape(chr(first))}-{re.escape(chr(last))}"
+        for first, last in ranges
+    ) + "]"
+
+
+def _string(quote: str, multiline: bool = False) -> str:
+    """Returns the pattern of a backslash-escaped string literal, possibly unterminated."""
+    body = _chars_except(quote + '\\' + ('' if multiline else '\n'))
+    return rf'{quote}{body}*(?:\\.{body}*)*{quote}?'
+
+
+def _triple_string(quote: str) -> str:
+    """
+    Returns the pattern of a triple-quoted string literal, possibly unterminated.
+
+    It ends only at its closing quotes or the end of input, so no backtracking
+    can make it match less.
+    """
+    body = _chars_except(quote + '\\')
+    return rf'{quote * 3}{body}*(?:(?:\\(?:.|\Z)|{quote}(?!{quote * 2})){body}*)*(?:{quote * 3}|\Z)'
+
+
+# Each lexer matches a run of code, then one token from the given groups of
+# alternatives, so findall returns a tuple per token in one C-level scan:
+# the code before it, then the token in its group's slot, the others empty.
+# The code run is consumed by a character class, which skips code far
+# faster than searching for the next token start. String literals are
+# matched before comment markers, so "#" or "//" inside them (URLs, "#fff")
+# survive; comments are always the last group. The patterns use the
+# unrolled-loop form, and unterminated strings or comments run to the end of
+# the line or input instead of backtracking, which keeps every scan linear.
+def _lexer(code: str, *groups: tuple, flags: int = re.DOTALL) -> re.Pattern:
+    tokens = "".join(f'({"|".join(alternatives)})|' for alternatives in groups)
+    return re.compile(rf'({code})(?:{tokens}\Z)', flags)
+
+
+def _lex(pattern: re.Pattern, source: str) -> List[str]:
+    """
+    Splits source into pieces, pattern.groups of them per token.
+
+    The last group of pieces holds the code after the final token and empty
+    strings, so every token is followed by a code piece.
+    """
+    matches = pattern.findall(source)
+    # Trailing code is matched with the end of input; an empty match may follow it
+    if len(matches) > 1 and not any(matches[-1]) and not any(matches[-2][1:]):
+        matches.pop()
+    return list(chain.from_iterable(matches))
+
+
+def _drop_comments(pattern: re.Pattern, source: str) -> str:
+    pieces = _lex(pattern, source)
+    del pieces[pattern.groups - 1::pattern.groups]
+    return "".join(pieces)
+
+
+_PYTHON_TRIPLE_STRING = _triple_string('"') + '|' + _triple_string("'")
+# Triple-quoted strings followed by nothing but a comment or a line break
+# are lexed apart as docstring candidates; the checks below run on these only
+_PYTHON_TOKENS = _lexer(
+    _chars_except('"\'#') + '*',
+    (rf'(?:{_PYTHON_TRIPLE_STRING})(?=[ \t]*(?:[\n#]|\Z))',),
+    (_PYTHON_TRIPLE_STRING, _string('"'), _string("'")),
+    ('#[^\n]*',),
+)
+# The code before a docstring ends a line not continued by a backslash, then
+# indents it; only plain string constants are docstrings, so f-strings and
+# bytes are left alone
+_PYTHON_DOCSTRING_HEAD = re.compile(r'(?:.*[^\\])?\n([ \t]*)[rRuU]?', re.DOTALL)
+# The next line holding code after a docstring
+_PYTHON_NEXT_CODE = re.compile(r'(?:[ \t]*(?:#[^\n]*)?\n)*([ \t]*)([^\s#]?)')
+
+_BLOCK_COMMENT = r'/\*[^*]*(?:\*+[^*/][^*]*)*(?:\*+/)?'
+# A "/" opening no comment is code
+_C_STYLE_CODE = _chars_except('"\'`/')
+_C_STYLE_TOKENS = _lexer(
+    rf'{_C_STYLE_CODE}*(?:/(?![/*]){_C_STYLE_CODE}*)*',
+    (_string('"'), _string("'"), _string('`', multiline=True)),
+    ('//[^\n]*', _BLOCK_COMMENT),
+)
+_CSS_CODE = _chars_except('"\'/')
+_CSS_TOKENS = _lexer(
+    rf'{_CSS_CODE}*(?:/(?!\*){_CSS_CODE}*)*',
+    (_string('"'), _string("'")),
+    (_BLOCK_COMMENT,),
+)
+# A "#" inside a word, like "a#b", starts no comment
+_HASH_CODE = _chars_except('"\'#')
+_HASH_TOKENS = _lexer(
+    rf'{_HASH_CODE}*(?:(?<=\S)#{_HASH_CODE}*)*',
+    (_string('"'), "'" + _chars_except("'\n") + "*'?"),
+    ('#[^\n]*',),
+    # A backslash does not continue a string over a line break here
+    flags=0,
+)
+
+
+def _drop_blank_lines(content: str, strip_indent: bool) -> str:
+    strip = str.strip if strip_indent else str.rstrip
+    return "\n".join(filter(None, map(strip, content.splitlines())))
+
+
+def minify_python(source: str) -> str:
+    """
+    Removes comments and docstrings from Python source in a single pass.
+
+    Strings that merely contain ``#`` or triple quotes are left alone, and
+    indentation is preserved. Only triple-quoted strings forming a whole
+    statement outside brackets are removed; one that closes an indented block
+    becomes ``pass`` so a body holding nothing but a docstring still parses.
+
+    This is a regex lexer rather than ``tokenize``: tokenize is pure Python
+    and lexes only a few MB/s, an order of magnitude below this scan, and
+    minification runs on every file of every efa export (see
+    benchmarks/bench_minify.py). Its cost follows the number of literals,
+    comments and docstrings rather than the size of the source: on the
+    standard library it is within a tenth of the old ``#.*`` regexes, which
+    ignored strings, and on code with a docstring every few lines about half
+    as fast.
+    """
+    pieces = _lex(_PYTHON_TOKENS, source)
+    # Pieces come in fours: code, docstring candidate, string and comment
+    output = pieces[:]
+    del output[3::4]
+    positions = list(compress(count(), pieces[1::4]))
+    heads = pieces[0::4]
+    # The first docstring candidate may start the input
+    heads[0] = '\n' + heads[0]
+    depth = 0
+    offset = 0
+    measured = 0
+    counted = 0
+    for position, head in zip(positions, map(_PYTHON_DOCSTRING_HEAD.fullmatch, map(heads.__getitem__, positions))):
+        if head is None:
+            continue
+        index = 4 * position
+        # Bracket depth is only brought up to date for candidates; code pieces
+        # never contain literals or comments
+        code = "".join(pieces[counted:index + 1:4])
+        depth += code.count('(') + code.count('[') + code.count('{')
+        depth -= code.count(')') + code.count(']') + code.count('}')
+        counted = index + 4
+        if depth > 0:
+            continue
+        indent = head.group(1)
+        output[3 * position + 1] = ''
+        if indent:
+            # A docstring closing its block becomes pass, so the block still parses
+            after = pieces[index + 4]
+            following = _PYTHON_NEXT_CODE.match(after)
+            if not following.group(2):
+                # The next code follows other tokens; look for it in the source
+                offset += sum(map(len, pieces[measured:index + 4]))
+                measured = index + 4
+                following = _PYTHON_NEXT_CODE.match(source, offset)
+            if not following.group(2) or len(following.group(1)) < len(indent):
+                output[3 * position + 1] = 'pass'
+        if head.end(1) < head.end():
+            output[3 * position] = pieces[index][:-1]
+    return _drop_blank_lines("".join(output), strip_indent=False)
+
+
+def minify_c_style(source: str) -> str:
+    """Removes // and /* */ comments outside string literals and trims every line."""
+    return _drop_blank_lines(_drop_comments(_C_STYLE_TOKENS, source), strip_indent=True)
+
+
+def _drop_js_comments(source: str) -> str:
+    """
+    Like _drop_comments for JS/TS, but keeps ambiguous comment openers.
+
+    A ``//`` or ``/*`` preceded by a ``/`` on the same line may be part of a
+    regex literal such as ``/[/*]/``, or follow a division, so it and the
+    text the lexer matched for it are kept unchanged.
+    """
+    pieces = _lex(_C_STYLE_TOKENS, source)
+    output = pieces[:]
+    del output[2::3]
+    # Without a "/" in the code every comment goes, and no loop is needed
+    if not any(map(str.__contains__, pieces[0::3], repeat('/'))):
+        return "".join(output)
+    output = []
+    slash_on_line = False
+    for index in range(0, len(pieces), 3):
+        code, string, comment = pieces[index:index + 3]
+        line_start = code.rfind('\n') + 1
+        if line_start:
+            slash_on_line = '/' in code[line_start:]
+        else:
+            slash_on_line = slash_on_line or '/' in code
+        output.append(code)
+        if string:
+            output.append(string)
+            # Slashes in a string are not code
+            if '\n' in string:
+                slash_on_line = False
+        elif comment and slash_on_line:
+            output.append(comment)
+            line_start = comment.rfind('\n') + 1
+            if line_start:
+                slash_on_line = '/' in comment[line_start:]
+    return "".join(output)
+
+
+def minify_js(source: str) -> str:
+    """Removes unambiguous // and /* */ comments from JS/TS and trims every line."""
+    return _drop_blank_lines(_drop_js_comments(source), strip_indent=True)
+
+
+def minify_css(source: str) -> str:
+    """Removes /* */ comments outside string literals and trims every line."""
+    return _drop_blank_lines(_drop_comments(_CSS_TOKENS, source), strip_indent=True)
+
+
+def minify_hash_comments(source: str) -> str:
+    """Removes # comments outside quotes, keeping indentation (YAML, shell, Makefiles)."""
+    return _drop_blank_lines(_drop_comments(_HASH_TOKENS, source), strip_indent=False)
+
+
+def minify_source(content: str, path: Optional[str] = None) -> str:
+    """
+    Minifies one file's content with the lexer matching its extension.
+
+    Files of unknown type, or content without a path, only lose blank lines
+    and trailing whitespace.
+
+    :param content: The file content.
+    :param path: The file path, used to pick the language.
+    :return: The minified content.
+    """
+    if path is None:
+        return _drop_blank_lines(content, strip_indent=False)
+    ext = get_extension(path)
+    name = path.replace('\\', '/').rsplit('/', 1)[-1].lower()
+    if ext in PYTHON_EXTENSIONS:
+        return minify_python(content)
+    if ext in JS_EXTENSIONS:
+        return minify_js(content)
+    if ext in C_STYLE_EXTENSIONS:
+        return minify_c_style(content)
+    if ext in CSS_EXTENSIONS:
+        return minify_css(content)
+    if ext in HASH_COMMENT_EXTENSIONS or name in HASH_COMMENT_NAMES:
+        return minify_hash_comments(content)
+    return _drop_blank_lines(content, strip_indent=False)
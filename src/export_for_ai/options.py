@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import os
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Optional, Tuple
+
+from export_for_ai.file_types import (
+    BINARY_EXTENSIONS,
+    SNIFF_BYTES,
+    TEXT_EXTENSIONS,
+    normalize_extensions,
+)
+
+# Bump when the processing of file contents changes in a way options don't capture
+RENDER_FORMAT_VERSION = 1
+# ExportOptions fields that change what is rendered for a file
+RENDER_FIELDS = ("binary_extensions", "text_extensions", "sniff_bytes", "max_file_bytes")
+# ExportOptions fields that change a watcher's model: the scanned manifest and
+# the cached file blocks. The other fields only shape one export of the model.
+MODEL_FIELDS = RENDER_FIELDS + ("use_gitignore", "nested_ignore", "use_git_index", "minify")
+
+FORMAT_MARKDOWN = "markdown"
+FORMAT_JSONL = "jsonl"
+OUTPUT_FORMATS = (FORMAT_MARKDOWN, FORMAT_JSONL)
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+DEFAULT_JOBS = min(8, os.cpu_count() or 1)
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TOP_K = 20
+# Exports larger than this are not copied to the clipboard
+DEFAULT_CLIPBOARD_MAX_BYTES = 8 * 1024 * 1024
+
+
+@dataclass
+class ExportOptions:
+    """Settings that control how folder contents are read and rendered."""
+
+    # Number of threads reading file bodies concurrently
+    jobs: int = DEFAULT_JOBS
+    # Persistent per-repository cache of rendered file blocks
+    use_cache: bool = True
+    cache_dir: Optional[str] = None
+    cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES
+    # Confirm cache entries by content hash when only the mtime changed
+    cache_hash: bool = False
+    # Binary detection: denylisted extensions are never opened, allowlisted
+    # ones are read without sniffing, the rest are sniffed from a prefix
+    binary_extensions: frozenset = BINARY_EXTENSIONS
+    text_extensions: frozenset = TEXT_EXTENSIONS
+    sniff_bytes: int = SNIFF_BYTES
+    # Budgets; None means unlimited. Once the total budget runs out, files are
+    # kept in budget_priority order ("tree" or "smallest"), with paths
+    # matching budget_prefer patterns first.
+    max_file_bytes: Optional[int] = None
+    max_total_bytes: Optional[int] = None
+    max_total_tokens: Optional[int] = None
+    budget_priority: str = "tree"
+    budget_prefer: Tuple[str, ...] = ()
+    # Ignore rules: root and nested .gitignore files are honored next to
+    # .exportignore; use_git_index keeps only files listed by git ls-files
+    use_gitignore: bool = True
+    nested_ignore: bool = True
+    use_git_index: bool = False
+    # Strip comments and blank lines from each file with a language-aware lexer
+    minify: bool = False
+    # Tree limits; None means unlimited. Directories at tree_max_depth or with
+    # more than tree_collapse_files files are shown as a one-line summary, and
+    # listings are cut after tree_max_children entries.
+    tree_max_depth: Optional[int] = None
+    tree_max_children: Optional[int] = None
+    tree_collapse_files: Optional[int] = None
+    # Content-addressed store that outputs are published through; identical
+    # outputs are not rewritten
+    artifact_store: Optional[str] = None
+    # Output layout: one markdown file, or one JSON record per file, optionally
+    # compressed; split_tokens cuts the markdown into parts of about that size
+    output_format: str = FORMAT_MARKDOWN
+    compression: Optional[str] = None
+    split_tokens: Optional[int] = None
+    # Export only the files changed between the merge base of diff_base and
+    # HEAD, read from the git object database, plus up to diff_related
+    # unchanged files they import
+    diff_base: Optional[str] = None
+    diff_related: int = 0
+    # Export only the top_k files most relevant to query, ranked by a
+    # persistent BM25 index stored next to the export cache
+    query: Optional[str] = None
+    top_k: int = DEFAULT_TOP_K
+    # Export files with identical contents once: later copies in a folder
+    # refer to the first, and batch runs share bodies found in several
+    # repositories through one shared-content file
+    dedupe: bool = False
+
+    def render_key(self) -> str:
+        """Identifies the settings that change rendered file blocks, for cache keys."""
+        return self._fields_key(RENDER_FIELDS)
+
+    def model_key(self) -> str:
+        """Identifies the settings that change a watcher's manifest and cached blocks."""
+        return self._fields_key(MODEL_FIELDS)
+
+    def model_options(self) -> "ExportOptions":
+        """Returns default options carrying only this instance's MODEL_FIELDS and jobs."""
+        return ExportOptions(jobs=self.jobs, **{name: getattr(self, name) for name in MODEL_FIELDS})
+
+    def _fields_key(self, names: Tuple[str, ...]) -> str:
+        state = [RENDER_FORMAT_VERSION]
+        for name in names:
+            value = getattr(self, name)
+            state.append(sorted(value) if isinstance(value, frozenset) else value)
+        return hashlib.sha1(repr(state).encode("utf-8")).hexdigest()
+
+
+def options_to_dict(options: ExportOptions) -> dict:
+    """Returns ExportOptions as JSON-serializable values, e.g. to send them to the export daemon."""
+    return {
+        name: sorted(value) if isinstance(value, frozenset) else list(value) if isinstance(value, tuple) else value
+        for name, value in asdict(options).items()
+    }
+
+
+def options_from_dict(data: dict) -> ExportOptions:
+    """Builds ExportOptions from options_to_dict output; unknown keys are ignored."""
+    values = {}
+    for field in fields(ExportOptions):
+        if field.name not in data:
+            continue
+        value = data[field.name]
+        if isinstance(field.default, frozenset):
+            value = frozenset(value)
+        elif isinstance(field.default, tuple):
+            value = tuple(value)
+        values[field.name] = value
+    return ExportOptions(**values)
+
+
+def options_from_config(config: dict) -> ExportOptions:
+    """
+    Builds the ExportOptions of an export described by ui_config.json.
+
+    The config's ``options`` hold ExportOptions fields as written by
+    options_to_dict; its ``artifact_store`` and ``dedupe`` keys are applied
+    on top. The web UI jobs and the tray hotkey both export with these.
+    """
+    options = options_from_dict(config.get("options") or {})
+    if config.get("artifact_store"):
+        options = replace(options, artifact_store=config["artifact_store"])
+    if config.get("dedupe"):
+        options = replace(options, dedupe=True)
+    return options
+
+
+def add_export_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the command line flags that map onto ExportOptions."""
+    parser.add_argument(
+        "--jobs", type=int, default=DEFAULT_JOBS,
+        help="Number of threads reading files concurrently",
+    )
+    parser.add_argument(
+        "--no-cache", dest="use_cache", action="store_false",
+        help="Do not read or update the incremental export cache",
+    )
+    parser.add_argument("--cache-dir", help="Directory holding the export cache")
+    parser.add_argument(
+        "--cache-max-bytes", type=int, default=DEFAULT_CACHE_MAX_BYTES,
+        help="Evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--cache-hash", action="store_true",
+        help="Reuse cache entries whose mtime changed but content hash did not",
+    )
+    parser.add_argument(
+        "--binary-ext", action="append", default=[], metavar="EXT",
+        help="Extra extension treated as binary without reading (repeatable)",
+    )
+    parser.add_argument(
+        "--text-ext", action="append", default=[], metavar="EXT",
+        help="Extra extension read as text without sniffing (repeatable)",
+    )
+    parser.add_argument(
+        "--sniff-bytes", type=int, default=SNIFF_BYTES,
+        help="Bytes inspected to detect binary files",
+    )
+    parser.add_argument(
+        "--max-file-bytes", type=int, default=None,
+        help="Truncate each file to this many bytes",
+    )
+    parser.add_argument(
+        "--max-total-bytes", type=int, default=None,
+        help="Stop adding file contents once this many bytes are included",
+    )
+    parser.add_argument(
+        "--max-total-tokens", type=int, default=None,
+        help="Like --max-total-bytes, using an estimated token count",
+    )
+    parser.add_argument(
+        "--priority", choices=("tree", "smallest"), default="tree",
+        help="Order in which files are kept once the budget runs out",
+    )
+    parser.add_argument(
+        "--prefer", action="append", default=[], metavar="PATTERN",
+        help="Gitignore-style pattern of files kept first under a budget (repeatable)",
+    )
+    parser.add_argument(
+        "--no-gitignore", dest="use_gitignore", action="store_false",
+        help="Ignore .gitignore files; only .exportignore rules apply",
+    )
+    parser.add_argument(
+        "--no-nested-ignore", dest="nested_ignore", action="store_false",
+        help="Only read ignore files in the root directory",
+    )
+    parser.add_argument(
+        "--git-index", dest="use_git_index", action="store_true",
+        help="Only export files listed by git ls-files (tracked or untracked, not ignored)",
+    )
+    parser.add_argument(
+        "--minify", action="store_true",
+        help="Strip comments and blank lines from each exported file",
+    )
+    parser.add_argument(
+        "--tree-depth", type=int, default=None,
+        help="Summarize directories below this depth in the tree",
+    )
+    parser.add_argument(
+        "--tree-max-children", type=int, default=None,
+        help="Show at most this many entries per directory in the tree",
+    )
+    parser.add_argument(
+        "--tree-collapse", type=int, default=None, metavar="FILES",
+        help="Summarize directories holding more than this many files in the tree",
+    )
+    parser.add_argument(
+        "--artifact-store", metavar="DIR", default=None,
+        help="Content-addressed store used to skip rewriting identical exports",
+    )
+    parser.add_argument(
+        "--format", dest="output_format", choices=OUTPUT_FORMATS, default=FORMAT_MARKDOWN,
+        help="Write one markdown file or one JSON record per file (jsonl)",
+    )
+    parser.add_argument(
+        "--compress", dest="compression", choices=COMPRESSIONS, default=None,
+        help="Compress the output (zstd needs the zstandard package)",
+    )
+    parser.add_argument(
+        "--split-tokens", type=int, default=None, metavar="TOKENS",
+        help="Split the markdown into parts of about this many tokens, with a manifest",
+    )
+    parser.add_argument(
+        "--diff", dest="diff_base", metavar="BASE", default=None,
+        help="Export only files committed on HEAD since its merge base with BASE",
+    )
+    parser.add_argument(
+        "--related", dest="diff_related", type=int, default=0, metavar="N",
+        help="With --diff, also export up to N unchanged files imported by the changes",
+    )
+    parser.add_argument(
+        "--query", default=None,
+        help="Export only the files most relevant to this text (the tree stays complete)",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=DEFAULT_TOP_K, metavar="K",
+        help="Number of files exported with --query",
+    )
+    parser.add_argument(
+        "--dedupe", action="store_true",
+        help="Export identical files once; batch runs share them across repositories",
+    )
+
+
+def options_from_arguments(parsed: argparse.Namespace) -> ExportOptions:
+    """Builds ExportOptions from flags added by add_export_arguments."""
+    return ExportOptions(
+        jobs=max(1, parsed.jobs),
+        use_cache=parsed.use_cache,
+        cache_dir=parsed.cache_dir,
+        cache_max_bytes=parsed.cache_max_bytes,
+        cache_hash=parsed.cache_hash,
+        binary_extensions=BINARY_EXTENSIONS | normalize_extensions(parsed.binary_ext),
+        text_extensions=(
+            TEXT_EXTENSIONS | normalize_extensions(parsed.text_ext)
+        ) - normalize_extensions(parsed.binary_ext),
+        sniff_bytes=max(1, parsed.sniff_bytes),
+        max_file_bytes=parsed.max_file_bytes,
+        max_total_bytes=parsed.max_total_bytes,
+        max_total_tokens=parsed.max_total_tokens,
+        budget_priority=parsed.priority,
+        budget_prefer=tuple(parsed.prefer),
+        use_gitignore=parsed.use_gitignore,
+        nested_ignore=parsed.nested_ignore,
+        use_git_index=parsed.use_git_index,
+        minify=parsed.minify,
+        tree_max_depth=None if parsed.tree_depth is None else max(1, parsed.tree_depth),
+        tree_max_children=None if parsed.tree_max_children is None else max(1, parsed.tree_max_children),
+        tree_collapse_files=parsed.tree_collapse,
+        artifact_store=parsed.artifact_store,
+        output_format=parsed.output_format,
+        compression=parsed.compression,
+        split_tokens=None if parsed.split_tokens is None else max(1, parsed.split_tokens),
+        diff_base=parsed.diff_base,
+        diff_related=max(0, parsed.diff_related),
+        query=parsed.query,
+        top_k=max(1, parsed.top_k),
+        dedupe=parsed.dedupe,
+    )
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+
+class ExportCancelled(Exception):
+    """Raised inside an export once its job has been cancelled."""
+
+
+class ExportProgress:
+    """
+    Thread-safe progress counters and cancellation flag shared by one export job.
+
+    Exporters add the files they are about to process with ``add_total`` and
+    report each processed file with ``advance``; worker threads call ``check``
+    between files, which raises ExportCancelled once ``cancel`` was called, so
+    cancellation stops them cooperatively at the next file boundary.
+    ``on_update`` is called from the worker threads after every change.
+    """
+
+    def __init__(self, on_update: Optional[Callable[["ExportProgress"], None]] = None):
+        self.on_update = on_update
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.current = None
+        self.started = time.monotonic()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise ExportCancelled()
+
+    def add_total(self, files: int, size: int) -> None:
+        with self._lock:
+            self.files_total += files
+            self.bytes_total += size
+        self._notify()
+
+    def advance(self, rel_path: str, size: int) -> None:
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            self.current = rel_path
+        self._notify()
+
+    def eta(self) -> Optional[float]:
+        """Seconds left at the average throughput so far, or None before any bytes are done."""
+        if not self.bytes_done:
+            return None
+        elapsed = time.monotonic() - self.started
+        return max(0.0, elapsed * (self.bytes_total - self.bytes_done) / self.bytes_done)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = {
+                "files_done": self.files_done,
+                "files_total": self.files_total,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.bytes_total,
+                "current": self.current,
+            }
+        state["elapsed"] = round(time.monotonic() - self.started, 2)
+        eta = self.eta()
+        state["eta"] = None if eta is None else round(eta, 1)
+        return state
+
+    def _notify(self) -> None:
+        if self.on_update is not None:
+            self.on_update(self)
+
+
+class QueueProgress(ExportProgress):
+    """
+    ExportProgress of an export running in a worker process.
+
+    Every update is also put on ``updates`` as ``("total", files, size)`` or
+    ``("advance", rel_path, size)`` for relay_progress in the parent, and the
+    cancellation flag is ``cancelled``, a multiprocessing Event the parent
+    sets, so ``check`` stops the worker like a local cancel.
+    """
+
+    def __init__(self, updates, cancelled):
+        super().__init__()
+        self.updates = updates
+        self._cancelled = cancelled
+
+    def add_total(self, files: int, size: int) -> None:
+        super().add_total(files, size)
+        self.updates.put(("total", files, size))
+
+    def advance(self, rel_path: str, size: int) -> None:
+        super().advance(rel_path, size)
+        self.updates.put(("advance", rel_path, size))
+
+
+def relay_progress(updates, progress: ExportProgress, cancelled, done: threading.Event) -> None:
+    """
+    Applies the updates of QueueProgress workers to ``progress`` until ``done``.
+
+    Runs on a thread of the parent process. Cancelling ``progress`` sets the
+    workers' ``cancelled`` event. Once ``done`` is set, the updates still
+    queued are applied before returning.
+    """
+    while True:
+        if progress.cancelled:
+            cancelled.set()
+        try:
+            kind, *args = updates.get(timeout=0.1)
+        except queue.Empty:
+            if done.is_set():
+                return
+            continue
+        if kind == "total":
+            progress.add_total(*args)
+        else:
+            progress.advance(*args)
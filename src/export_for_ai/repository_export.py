@@ -0,0 +1,485 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from export_for_ai.folder_exporter import FolderExport
+from export_for_ai.metrics import metrics
+from export_for_ai.options import DEFAULT_CLIPBOARD_MAX_BYTES, FORMAT_JSONL, FORMAT_MARKDOWN, ExportOptions
+from export_for_ai.progress import ExportCancelled, ExportProgress, QueueProgress, relay_progress
+from export_for_ai.scanner import Manifest, scan_directory
+from export_for_ai.tree_visualizer import iter_tree_structure
+
+# The writers, the caches, dedupe and git are imported where they are used,
+# so CLI entry points that only parse arguments or talk to the daemon start fast
+if TYPE_CHECKING:
+    from export_for_ai.artifact_store import ArtifactStore
+    from export_for_ai.git_diff import GitDiffExport
+    from export_for_ai.watcher import RepositoryWatcher
+
+DEFAULT_SECTIONS = """
+# Previous step
+
+# The goal
+
+# Core Design Philosophy
+Seek a most minimal, simple, fewest LOC, lowest complexity design plans or paths to the required functionality. Preserve the robust, clutter-free design, and avoid any code, features, or decorations that do not directly contribute to the strictly essential functionality. It must be raw, and should aim to retain most or all existing functionality, unless the task is to, or requires that you, remove it. Aim to avoid creating divergent code pathways, and instead seek unified routes without branching where possible. Don't attempt to improvise, innovate, make unspecified improvements or changes, or move outside the scope of your specified task. Do not blindly follow the task instructions and analysis. Verify for yourself that the conclusions are accurate, and will not cause unanticipated side effects.
+"""
+
+
+def setup_logging() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+
+def validate_directory(directory_path: str) -> bool:
+    if not os.path.isdir(directory_path):
+        logging.error(f"Error: '{directory_path}' is not a valid directory")
+        return False
+    return True
+
+
+def get_folder_name(directory_path: str) -> str:
+    return os.path.basename(os.path.abspath(directory_path))
+
+
+def create_export_directory(directory_path: str) -> Optional[tuple[str, str]]:
+    folder_name = get_folder_name(directory_path)
+    export_dir_name = f"exported-from-{folder_name}"
+    export_dir_path = os.path.join(directory_path, export_dir_name)
+
+    try:
+        os.makedirs(export_dir_path, exist_ok=True)
+        return export_dir_path, folder_name
+    except OSError as e:
+        logging.error(f"Error creating export directory: {e}")
+        return None
+
+
+def export_project_md(
+    tree_structure: Iterable[str],
+    folder_export: FolderExport,
+    export_dir: str,
+    folder_name: str,
+    copy_to_clipboard: bool = False,
+    clipboard_max_bytes: int = DEFAULT_CLIPBOARD_MAX_BYTES,
+    store: Optional["ArtifactStore"] = None,
+    summary: str = "",
+    sections: str = DEFAULT_SECTIONS,
+) -> Optional[str]:
+    """
+    Streams tree structure and folder contents into project-....md file.
+    Returns the path to the created file. The file is replaced atomically,
+    through ``store`` when given, so a failed or cancelled export leaves the
+    previous one in place; ExportCancelled is re-raised.
+
+    The export's options pick the layout: a single markdown file, markdown
+    parts of ``split_tokens`` tokens with a manifest (whose path is returned),
+    or one JSON record per file, each optionally compressed. ``sections``
+    opens the markdown and ``summary`` is written after it, e.g. the change
+    list of a diff export.
+    """
+    from export_for_ai.writers import (
+        atomic_output,
+        copy_file_to_clipboard,
+        output_suffix,
+        write_jsonl,
+        write_project_md,
+        write_project_parts,
+    )
+
+    try:
+        dynamic_sections = sections
+        if summary:
+            dynamic_sections += "\n" + summary
+        metrics.count("repositories")
+        options = folder_export.options
+        base_path = os.path.join(export_dir, f"project-{folder_name}")
+        if options.output_format == FORMAT_JSONL:
+            project_md_path = base_path + output_suffix(FORMAT_JSONL, options.compression)
+            with metrics.stage("export"), atomic_output(project_md_path, store, options.compression) as f:
+                write_jsonl(f, folder_export, summary)
+        elif options.split_tokens:
+            with metrics.stage("export"):
+                project_md_path = write_project_parts(
+                    base_path, dynamic_sections, tree_structure, folder_export,
+                    options.split_tokens, store, options.compression,
+                )
+        else:
+            project_md_path = base_path + output_suffix(FORMAT_MARKDOWN, options.compression)
+            with metrics.stage("export"), atomic_output(project_md_path, store, options.compression) as f:
+                write_project_md(f, dynamic_sections, tree_structure, folder_export.iter_chunks(passthrough=True))
+        project_md_filename = os.path.basename(project_md_path)
+        logging.info(f"Generated '{project_md_filename}' in {export_dir}")
+
+        if copy_to_clipboard:
+            if project_md_path.endswith(".md"):
+                with metrics.stage("clipboard"):
+                    copy_file_to_clipboard(project_md_path, clipboard_max_bytes)
+            else:
+                logging.warning(f"Skipping clipboard copy of {project_md_filename}")
+
+        return project_md_path
+    except ExportCancelled:
+        raise
+    except Exception as e:
+        logging.error(f"Error exporting project.md: {e}")
+        return None
+
+
+def open_git_diff(directory_path: str, options: ExportOptions) -> Optional["GitDiffExport"]:
+    """Reads the change set against ``options.diff_base``, or logs why it cannot be read."""
+    from export_for_ai.git_diff import GitDiffExport, GitError
+
+    try:
+        return GitDiffExport(directory_path, options)
+    except GitError as e:
+        logging.error(f"Cannot export changes against '{options.diff_base}': {e}")
+        return None
+
+
+def process_single_repository(
+    directory_path: str,
+    options: Optional[ExportOptions] = None,
+    copy_to_clipboard: bool = False,
+    clipboard_max_bytes: int = DEFAULT_CLIPBOARD_MAX_BYTES,
+    manifest: Optional[Manifest] = None,
+    cache=None,
+    progress: Optional[ExportProgress] = None,
+    export_destination: Optional[str] = None,
+    duplicates: Optional[Dict[str, str]] = None,
+    git_diff: Optional["GitDiffExport"] = None,
+    sections: str = DEFAULT_SECTIONS,
+    folder_export: Optional[FolderExport] = None,
+) -> Optional[str]:
+    """
+    Processes a single repository and returns the path to the generated markdown file.
+
+    The markdown is written straight into ``export_destination``, or into an
+    ``exported-from-<name>`` folder inside the repository when none is given.
+    A watcher passes its up-to-date manifest and in-memory cache; otherwise the
+    repository is scanned and the persistent export cache is used. ``progress``
+    receives per-file progress; once it is cancelled, ExportCancelled is raised.
+    With ``options.diff_base`` only the change set is exported, read from git
+    by ``git_diff`` or a GitDiffExport opened here; the manifest and cache are
+    not used then. ``duplicates`` maps files to the reference exported instead
+    of their content, as planned for a batch. ``sections`` opens the markdown.
+    ``folder_export`` is a prepared export of the manifest's files, used
+    instead of selecting and reading them here.
+    """
+    if not validate_directory(directory_path):
+        return None
+
+    logging.info(f"--- Processing repository: {directory_path} ---")
+
+    options = options or ExportOptions()
+    # The change set is read first, so a bad base ref leaves no export directory behind
+    if options.diff_base:
+        git_diff = git_diff or open_git_diff(directory_path, options)
+        if git_diff is None:
+            return None
+
+    if export_destination:
+        export_dir, folder_name = export_destination, get_folder_name(directory_path)
+    else:
+        created = create_export_directory(directory_path)
+        if created is None:
+            return None
+        export_dir, folder_name = created
+
+    if git_diff is not None:
+        manifest, cache = git_diff.manifest(), None
+    elif manifest is None:
+        logging.info("Scanning directory...")
+        manifest = scan_directory(directory_path, options=options)
+    if progress is not None:
+        progress.check()
+    if not manifest.files and not (git_diff and git_diff.changes):
+        logging.warning(f"No files to export in {directory_path}")
+        return None
+
+    logging.info("Exporting directory structure...")
+    tree_structure = iter_tree_structure(directory_path, manifest, options)
+
+    logging.info("Exporting folder contents...")
+    owns_cache = cache is None and git_diff is None and folder_export is None
+    if owns_cache:
+        from export_for_ai.export_cache import open_cache
+
+        cache = open_cache(directory_path, options)
+    store = None
+    if options.artifact_store:
+        from export_for_ai.artifact_store import ArtifactStore
+
+        store = ArtifactStore(options.artifact_store)
+    try:
+        if folder_export is None:
+            folder_export = FolderExport(
+                directory_path, manifest, options, cache, progress, git_diff.read if git_diff else None,
+                duplicates,
+            )
+        return export_project_md(
+            tree_structure,
+            folder_export,
+            export_dir,
+            folder_name,
+            copy_to_clipboard=copy_to_clipboard,
+            clipboard_max_bytes=clipboard_max_bytes,
+            store=store,
+            summary=git_diff.summary() if git_diff else "",
+            sections=sections,
+        )
+    finally:
+        if cache is not None:
+            if owns_cache:
+                cache.close()
+            logging.info(f"Export cache: {cache.hits} hits, {cache.misses} misses")
+
+
+class RepositoryResult(NamedTuple):
+    """Outcome of exporting one repository in a batch."""
+
+    repo_path: str
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    # Metrics recorded while exporting this repository
+    metrics: Optional[dict] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def export_repository_to_destination(
+    repo_path: str,
+    export_destination: str,
+    options: Optional[ExportOptions] = None,
+    manifest: Optional[Manifest] = None,
+    cache=None,
+    progress: Optional[ExportProgress] = None,
+    duplicates: Optional[Dict[str, str]] = None,
+) -> RepositoryResult:
+    """
+    Exports one repository straight into the export destination.
+
+    The result carries the metrics recorded during the export, so a batch
+    run on a process pool can add them to the parent's metrics.
+    """
+    before = metrics.snapshot()
+    try:
+        output_path = process_single_repository(
+            repo_path,
+            options=options,
+            manifest=manifest,
+            cache=cache,
+            progress=progress,
+            export_destination=export_destination,
+            duplicates=duplicates,
+        )
+        if not output_path:
+            result = RepositoryResult(repo_path, error="Failed to process repository")
+        else:
+            result = RepositoryResult(repo_path, output_path=output_path)
+    except ExportCancelled:
+        logging.info(f"Export of {repo_path} cancelled")
+        result = RepositoryResult(repo_path, error="Cancelled")
+    except Exception as e:
+        logging.error(f"Error processing {repo_path}", exc_info=True)
+        result = RepositoryResult(repo_path, error=str(e))
+    return result._replace(metrics=metrics.diff(before))
+
+
+def plan_batch_dedupe(
+    repositories: List[str],
+    export_destination: str,
+    options: ExportOptions,
+) -> Tuple[Dict[str, Manifest], Dict[str, Dict[str, str]]]:
+    """
+    Deduplicates file contents across the repositories of a batch.
+
+    Every repository is scanned up front and the bodies found in more than
+    one of them are written once to a shared-content file in the export
+    destination; a stale one from an earlier run is removed when nothing is
+    shared. Query and diff exports select their files per repository and
+    are not deduplicated across repositories.
+
+    :return: The manifest of each repository, to be exported as is, and the
+        references replacing duplicate files, per repository.
+    """
+    from export_for_ai.artifact_store import ArtifactStore
+    from export_for_ai.dedupe import SHARED_CONTENT_NAME, plan_dedupe, write_shared_content
+    from export_for_ai.writers import atomic_output, output_suffix
+
+    repositories = [repo_path for repo_path in repositories if os.path.isdir(repo_path)]
+    manifests = {repo_path: scan_directory(repo_path, options=options) for repo_path in repositories}
+    shared_path = os.path.join(
+        export_destination, SHARED_CONTENT_NAME + output_suffix(options.output_format, options.compression)
+    )
+    plan = plan_dedupe(
+        repositories,
+        [manifests[repo_path].files for repo_path in repositories],
+        options,
+        os.path.basename(shared_path),
+    )
+    if plan.shared:
+        store = ArtifactStore(options.artifact_store) if options.artifact_store else None
+        with metrics.stage("export"), atomic_output(shared_path, store, options.compression) as f:
+            write_shared_content(f, plan, options)
+        logging.info(f"Generated '{os.path.basename(shared_path)}' with {len(plan.shared)} shared files")
+    elif os.path.exists(shared_path):
+        os.remove(shared_path)
+    # Repositories without duplicates get an empty map, so they are not hashed again
+    return manifests, {repo_path: plan.references.get(repo_path, {}) for repo_path in repositories}
+
+
+# Progress queue and cancellation event of a batch worker process, set by _init_batch_worker
+_worker_updates = None
+_worker_cancelled = None
+
+
+def _init_batch_worker(updates=None, cancelled=None) -> None:
+    global _worker_updates, _worker_cancelled
+    setup_logging()
+    _worker_updates, _worker_cancelled = updates, cancelled
+
+
+def _export_in_worker(
+    repo_path: str,
+    export_destination: str,
+    options: Optional[ExportOptions],
+    manifest: Optional[Manifest],
+    duplicates: Optional[Dict[str, str]],
+) -> RepositoryResult:
+    """Runs export_repository_to_destination in a batch worker, reporting to the parent's progress."""
+    progress = None
+    if _worker_updates is not None:
+        if _worker_cancelled.is_set():
+            return RepositoryResult(repo_path, error="Cancelled")
+        progress = QueueProgress(_worker_updates, _worker_cancelled)
+    return export_repository_to_destination(
+        repo_path, export_destination, options, manifest, progress=progress, duplicates=duplicates,
+    )
+
+
+def _prune_store(options: Optional[ExportOptions]) -> None:
+    if options is not None and options.artifact_store:
+        from export_for_ai.artifact_store import ArtifactStore
+
+        ArtifactStore(options.artifact_store).prune()
+
+
+def iter_batch_export(
+    repositories: List[str],
+    export_destination: str,
+    options: Optional[ExportOptions] = None,
+    max_workers: Optional[int] = None,
+    progress: Optional[ExportProgress] = None,
+) -> Iterator[RepositoryResult]:
+    """
+    Exports repositories on a process pool, yielding results as they finish.
+
+    :param repositories: Paths of the repositories to export.
+    :param export_destination: Directory receiving the project markdown files.
+    :param options: ExportOptions applied to every repository.
+    :param max_workers: Concurrency limit; defaults to one process per CPU.
+    :param progress: Optional ExportProgress receiving the per-file progress of
+        every repository. Cancelling it stops the running exports at the next
+        file and skips the repositories not started yet; their results carry
+        the error "Cancelled".
+    :return: An iterator over RepositoryResult in completion order. Once all
+        are yielded, objects no output refers to are pruned from the
+        artifact store.
+    """
+    if not repositories:
+        return
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(repositories)))
+    manifests: Dict[str, Manifest] = {}
+    references: Dict[str, Dict[str, str]] = {}
+    if options is not None and options.dedupe and not options.diff_base and not options.query:
+        manifests, references = plan_batch_dedupe(repositories, export_destination, options)
+
+    if max_workers == 1:
+        for repo_path in repositories:
+            if progress is not None and progress.cancelled:
+                yield RepositoryResult(repo_path, error="Cancelled")
+                continue
+            yield export_repository_to_destination(
+                repo_path, export_destination, options,
+                manifests.get(repo_path), progress=progress, duplicates=references.get(repo_path),
+            )
+        _prune_store(options)
+        return
+
+    # Loaded only for parallel batches; multiprocessing is slow to import
+    import multiprocessing
+    import threading
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    initargs = ()
+    relay = None
+    if progress is not None:
+        # Passed through the pool initializer, so each worker inherits them
+        updates, cancelled = multiprocessing.Queue(), multiprocessing.Event()
+        initargs = (updates, cancelled)
+        relay_done = threading.Event()
+        relay = threading.Thread(
+            target=relay_progress, args=(updates, progress, cancelled, relay_done), daemon=True
+        )
+        relay.start()
+    try:
+        with ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_batch_worker, initargs=initargs
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _export_in_worker, repo_path, export_destination, options,
+                    manifests.get(repo_path), references.get(repo_path),
+                ): repo_path
+                for repo_path in repositories
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield RepositoryResult(futures[future], error=str(e))
+                    continue
+                # Worker processes record metrics in their own copy
+                metrics.merge(result.metrics)
+                yield result
+    finally:
+        if relay is not None:
+            relay_done.set()
+            relay.join()
+    _prune_store(options)
+
+
+def export_from_watcher(
+    watcher: "RepositoryWatcher",
+    export_destination: Optional[str] = None,
+    copy_to_clipboard: bool = False,
+    clipboard_max_bytes: int = DEFAULT_CLIPBOARD_MAX_BYTES,
+    options: Optional[ExportOptions] = None,
+) -> RepositoryResult:
+    """
+    Exports a watched repository from its in-memory model without re-reading files.
+
+    ``options`` may differ from the watcher's in the fields that only shape
+    one export (format, budgets, query, diff, ...); its MODEL_FIELDS must
+    match, or the cached blocks would not fit. Defaults to the watcher's.
+    """
+    options = options or watcher.options
+    with watcher.snapshot() as (manifest, cache):
+        cache.reset_stats()
+        if export_destination:
+            return export_repository_to_destination(
+                watcher.path, export_destination, options, manifest, cache
+            )
+        md_file_path = process_single_repository(
+            watcher.path,
+            options,
+            copy_to_clipboard=copy_to_clipboard,
+            clipboard_max_bytes=clipboard_max_bytes,
+            manifest=manifest,
+            cache=cache,
+        )
+        if md_file_path:
+            return RepositoryResult(watcher.path, output_path=md_file_path)
+        return RepositoryResult(watcher.path, error="Failed to process repository")
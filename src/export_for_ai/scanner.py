@@ -0,0 +1,370 @@
+import logging
+import os
+import subprocess
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from export_for_ai.ignore_parser import (
+    EXPORTIGNORE,
+    GITIGNORE,
+    IgnoreChain,
+    load_nested_ignore,
+    parse_ignore_file,
+)
+from export_for_ai.metrics import metrics
+from export_for_ai.options import ExportOptions
+
+
+class ManifestEntry(NamedTuple):
+    """A single included file or directory found by the scanner."""
+
+    rel_path: str
+    name: str
+    depth: int
+    is_dir: bool
+    size: int
+    mtime_ns: int = 0
+
+
+class Manifest:
+    """
+    The filtered result of one directory scan.
+
+    Entries are stored in tree order: for every directory, its sub-directories
+    (recursively) come first, then its files, each group sorted by name.
+    """
+
+    def __init__(self, root_path: str, entries: List[ManifestEntry]):
+        self.root_path = root_path
+        self.root_name = os.path.basename(os.path.abspath(root_path))
+        self.entries = entries
+
+    @property
+    def files(self) -> List[ManifestEntry]:
+        return [entry for entry in self.entries if not entry.is_dir]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def list_git_files(path: str) -> Optional[Tuple[Set[str], Set[str]]]:
+    """
+    Lists the files git would export: tracked plus untracked-but-not-ignored.
+
+    :param path: The root directory, inside a git work tree.
+    :return: A (files, directories) pair of '/'-separated relative paths,
+             or None if git is unavailable or the path is not a work tree.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", path, "ls-files", "-z", "--cached", "--others",
+             "--exclude-standard", "--full-name", "."],
+            capture_output=True, check=True,
+        )
+        prefix = subprocess.run(
+            ["git", "-C", path, "rev-parse", "--show-prefix"],
+            capture_output=True, check=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"git ls-files unavailable for {path}, walking the directory instead: {e}")
+        return None
+
+    files = set()
+    dirs = set()
+    for raw in result.stdout.split(b"\0"):
+        if not raw:
+            continue
+        rel = raw.decode("utf-8", errors="surrogateescape")[len(prefix):]
+        files.add(rel)
+        parent = rel.rpartition("/")[0]
+        while parent and parent not in dirs:
+            dirs.add(parent)
+            parent = parent.rpartition("/")[0]
+    return files, dirs
+
+
+def scan_directory(
+        path: str, spec=None, options: Optional[ExportOptions] = None
+) -> Manifest:
+    """
+    Walks the directory once with os.scandir and returns the filtered manifest.
+
+    Nested .gitignore/.exportignore files are honored with git precedence, and
+    excluded directories are pruned without being listed. With
+    ``options.use_git_index``, only files reported by ``git ls-files`` are kept.
+
+    :param path: The root directory to scan.
+    :param spec: Optional IgnoreMatcher for the root; parsed from the directory when omitted.
+    :param options: Optional ExportOptions with the ignore settings.
+    :return: A Manifest with every included file and directory.
+    """
+    with metrics.stage("scan"):
+        return _scan_directory(path, spec, options)
+
+
+class _Walker:
+    """
+    The ignore settings and counters of one scan, listing one directory at a time.
+
+    A full scan walks from the root; rescan_directories lists single
+    directories and walks only the sub-directories that are new.
+    """
+
+    def __init__(self, path: str, spec, options: Optional[ExportOptions]):
+        options = options or ExportOptions()
+        self.path = path
+        self.use_gitignore = options.use_gitignore
+        self.nested = options.nested_ignore
+        self.spec = spec if spec is not None else parse_ignore_file(path, use_gitignore=self.use_gitignore)
+        self.ignore_names = {GITIGNORE, EXPORTIGNORE} if self.use_gitignore else {EXPORTIGNORE}
+        self.git_listing = list_git_files(path) if options.use_git_index else None
+        # Counted locally and reported once, the walk is the hottest loop
+        self.counts = {"dirs_listed": 0, "entries_seen": 0, "entries_ignored": 0}
+        self.ignore_seconds = 0.0
+        # Paths of the directories above the one being listed
+        self.ancestors: List[str] = []
+        self._identities: Dict[str, Tuple[int, int]] = {}
+
+    def root_chain(self) -> IgnoreChain:
+        return IgnoreChain([("", self.spec)])
+
+    def chain_above(self, rel_dir: str) -> IgnoreChain:
+        """Returns the chain of the root and of every ancestor of ``rel_dir``, without its own files."""
+        chain = self.root_chain()
+        if not self.nested or not rel_dir:
+            return chain
+        parts = rel_dir.split(os.sep)
+        for index in range(1, len(parts)):
+            ancestor = os.path.join(*parts[:index])
+            ancestor_path = os.path.join(self.path, ancestor)
+            if any(os.path.isfile(os.path.join(ancestor_path, name)) for name in self.ignore_names):
+                chain = chain.child(ancestor, load_nested_ignore(ancestor_path, self.use_gitignore))
+        return chain
+
+    def set_ancestors(self, rel_dir: str) -> None:
+        """Sets the directories above ``rel_dir`` before listing it out of a walk."""
+        self.ancestors = []
+        if not rel_dir:
+            return
+        parts = rel_dir.split(os.sep)
+        self.ancestors = [self.path] + [os.path.join(self.path, *parts[:index]) for index in range(1, len(parts))]
+
+    def _identity(self, path: str) -> Tuple[int, int]:
+        identity = self._identities.get(path)
+        if identity is None:
+            stat = os.stat(path)
+            identity = self._identities[path] = (stat.st_dev, stat.st_ino)
+        return identity
+
+    def _is_loop(self, link_path: str, current_path: str) -> bool:
+        """Tells whether a symlinked directory leads back to a directory being walked."""
+        try:
+            target = self._identity(link_path)
+            return any(self._identity(path) == target for path in self.ancestors + [current_path])
+        except OSError:
+            return True
+
+    def list_directory(
+            self, current_path: str, rel_dir: str, depth: int, chain: IgnoreChain
+    ) -> Optional[Tuple[IgnoreChain, List[ManifestEntry], List[ManifestEntry]]]:
+        """
+        Lists the included entries of one directory, without descending.
+
+        :return: The chain applying inside the directory, its sub-directory
+            entries and its file entries, each sorted by name; or None if the
+            directory cannot be read.
+        """
+        counts = self.counts
+        counts["dirs_listed"] += 1
+        try:
+            with os.scandir(current_path) as it:
+                items = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logging.warning(f"Cannot read directory {current_path}: {e}")
+            return None
+
+        if self.nested and rel_dir and any(entry.name in self.ignore_names for entry in items):
+            chain = chain.child(rel_dir, load_nested_ignore(current_path, self.use_gitignore))
+
+        git_listing = self.git_listing
+        perf_counter = time.perf_counter
+        ignore_seconds = 0.0
+        dirs = []
+        files = []
+        counts["entries_seen"] += len(items)
+        for entry in items:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                if entry.is_dir():
+                    is_dir = True
+                elif entry.is_file():
+                    is_dir = False
+                else:
+                    continue
+                # Only symlinks can revisit a directory; real ones are never stated here
+                if is_dir and entry.is_symlink() and self._is_loop(entry.path, current_path):
+                    logging.warning(f"Skipping symlink loop: {rel_path}")
+                    continue
+            except OSError:
+                continue
+            if git_listing is not None:
+                git_path = rel_path.replace(os.sep, "/")
+                if git_path not in git_listing[1 if is_dir else 0]:
+                    continue
+            # Excluded directories are pruned without being listed
+            start = perf_counter()
+            ignored = chain.is_ignored(rel_path, is_dir)
+            ignore_seconds += perf_counter() - start
+            if ignored:
+                counts["entries_ignored"] += 1
+                logging.debug(f"Skipping: {rel_path}")
+            elif is_dir:
+                dirs.append(ManifestEntry(rel_path, entry.name, depth, True, 0))
+            else:
+                try:
+                    stat = entry.stat()
+                    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+                except OSError:
+                    size, mtime_ns = 0, 0
+                files.append(ManifestEntry(rel_path, entry.name, depth, False, size, mtime_ns))
+        self.ignore_seconds += ignore_seconds
+        return chain, dirs, files
+
+    def walk(
+            self, current_path: str, rel_dir: str, depth: int, chain: IgnoreChain, entries: List[ManifestEntry]
+    ) -> None:
+        """Appends the included entries below a directory to ``entries``, in tree order."""
+        listing = self.list_directory(current_path, rel_dir, depth, chain)
+        if listing is None:
+            return
+        chain, dirs, files = listing
+        self.ancestors.append(current_path)
+        for entry in dirs:
+            entries.append(entry)
+            self.walk(os.path.join(current_path, entry.name), entry.rel_path, depth + 1, chain, entries)
+        self.ancestors.pop()
+        entries.extend(files)
+
+    def report(self) -> None:
+        metrics.add_time("ignore_match", self.ignore_seconds, self.counts["entries_seen"])
+        for name, value in self.counts.items():
+            metrics.count(name, value)
+
+
+def _scan_directory(path: str, spec, options: Optional[ExportOptions]) -> Manifest:
+    walker = _Walker(path, spec, options)
+    entries: List[ManifestEntry] = []
+    walker.walk(path, "", 1, walker.root_chain(), entries)
+    walker.report()
+    metrics.count("files_included", sum(1 for entry in entries if not entry.is_dir))
+    return Manifest(path, entries)
+
+
+class ManifestUpdate(NamedTuple):
+    """The result of rescan_directories."""
+
+    manifest: Manifest
+    # Entries that are new, or files whose size or mtime changed, in tree order
+    changed: List[ManifestEntry]
+    # Relative paths of the files and directories that are gone
+    removed: List[str]
+
+
+def _index_children(entries: List[ManifestEntry], children: Dict[str, Tuple[list, list]]) -> None:
+    for entry in entries:
+        parent = os.path.dirname(entry.rel_path)
+        children.setdefault(parent, ([], []))[1 if not entry.is_dir else 0].append(entry)
+        if entry.is_dir:
+            children.setdefault(entry.rel_path, ([], []))
+
+
+def rescan_directories(
+        manifest: Manifest, rel_dirs: Iterable[str], options: Optional[ExportOptions] = None
+) -> ManifestUpdate:
+    """
+    Updates a manifest for changes inside some directories only.
+
+    Each directory is listed again without descending: its files are
+    re-stated, sub-directories that appeared are scanned in full, and those
+    that disappeared are dropped with everything below them. The entries of
+    all other directories are reused as they are, so the cost follows the
+    number of changed directories, not the size of the tree. Changes to
+    ignore files are not followed below the listed directories; callers
+    rescan in full for those.
+
+    :param manifest: The manifest of the last scan.
+    :param rel_dirs: Directories with changes, relative to the root ("" for the root).
+    :param options: The ExportOptions the manifest was scanned with.
+    :return: The ManifestUpdate with the new manifest and what changed.
+    """
+    with metrics.stage("scan"):
+        path = manifest.root_path
+        walker = _Walker(path, None, options)
+        children: Dict[str, Tuple[list, list]] = {"": ([], [])}
+        _index_children(manifest.entries, children)
+        changed: List[ManifestEntry] = []
+        removed: List[str] = []
+
+        def drop(rel_dir: str) -> None:
+            dirs, files = children.pop(rel_dir, ([], []))
+            removed.extend(entry.rel_path for entry in files)
+            for entry in dirs:
+                drop(entry.rel_path)
+                removed.append(entry.rel_path)
+
+        scanned = set()
+        for rel_dir in sorted(set(rel_dirs), key=lambda d: (d.count(os.sep) if d else -1, d)):
+            # Gone or ignored, or below a directory that was just scanned in full
+            if rel_dir not in children or rel_dir in scanned:
+                continue
+            depth = rel_dir.count(os.sep) + 2 if rel_dir else 1
+            current_path = os.path.join(path, rel_dir) if rel_dir else path
+            walker.set_ancestors(rel_dir)
+            listing = walker.list_directory(current_path, rel_dir, depth, walker.chain_above(rel_dir))
+            chain, dirs, files = listing if listing is not None else (None, [], [])
+            old_dirs, old_files = children[rel_dir]
+
+            old_by_name = {entry.name: entry for entry in old_files}
+            for entry in files:
+                old = old_by_name.pop(entry.name, None)
+                if old is None or old.size != entry.size or old.mtime_ns != entry.mtime_ns:
+                    changed.append(entry)
+            removed.extend(entry.rel_path for entry in old_by_name.values())
+
+            new_names = {entry.name for entry in dirs}
+            for entry in old_dirs:
+                if entry.name not in new_names:
+                    drop(entry.rel_path)
+                    removed.append(entry.rel_path)
+            old_names = {entry.name for entry in old_dirs}
+            for entry in dirs:
+                if entry.name in old_names:
+                    continue
+                below: List[ManifestEntry] = []
+                walker.walk(os.path.join(current_path, entry.name), entry.rel_path, depth + 1, chain, below)
+                children[entry.rel_path] = ([], [])
+                _index_children(below, children)
+                scanned.update(item.rel_path for item in below if item.is_dir)
+                changed.append(entry)
+                changed.extend(below)
+            children[rel_dir] = (dirs, files)
+
+        entries: List[ManifestEntry] = []
+
+        def flatten(rel_dir: str) -> None:
+            dirs, files = children.get(rel_dir, ((), ()))
+            for entry in dirs:
+                entries.append(entry)
+                flatten(entry.rel_path)
+            entries.extend(files)
+
+        flatten("")
+        walker.report()
+    return ManifestUpdate(Manifest(path, entries), changed, removed)
+
+
+def ensure_manifest(
+        path: str, manifest: Optional[Manifest], options: Optional[ExportOptions] = None
+) -> Manifest:
+    """Returns the given manifest, scanning the directory when none was provided."""
+    return manifest if manifest is not None else scan_directory(path, options=options)
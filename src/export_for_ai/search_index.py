@@ -0,0 +1,209 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from export_for_ai.export_cache import cache_path_for
+from export_for_ai.folder_exporter import TEXT, iter_exported_files
+from export_for_ai.metrics import metrics
+from export_for_ai.options import ExportOptions
+from export_for_ai.scanner import ManifestEntry
+
+# Bump when tokenization changes; an index built with another version is rebuilt
+INDEX_VERSION = 1
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Path terms count this many times, so a file named after a term ranks high
+PATH_WEIGHT = 3
+
+# Runs of letters and digits, split further into words when they mix case:
+# "retryPayment", "retry_payment" and "RETRY payment" all give "retry" and "payment"
+_RUN = re.compile(r'[A-Za-z0-9]+')
+_WORD = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+')
+
+
+def tokenize(text: str) -> Counter:
+    """Counts the lowercase terms of a text, splitting camelCase and snake_case identifiers."""
+    terms = Counter()
+    # Counting the raw runs first keeps the per-word Python work to distinct runs
+    for run, count in Counter(_RUN.findall(text)).items():
+        if run.islower() or run.isdigit():
+            if len(run) > 1:
+                terms[run] += count
+            continue
+        for word in _WORD.findall(run):
+            if len(word) > 1:
+                terms[word.lower()] += count
+    return terms
+
+
+def index_path_for(repo_path: str, cache_dir: Optional[str] = None) -> str:
+    """Returns the SQLite file holding the search index of one repository, next to its export cache."""
+    return cache_path_for(repo_path, cache_dir)[:-len(".sqlite")] + ".index.sqlite"
+
+
+class SearchIndex:
+    """
+    Persistent BM25 inverted index over the paths and contents of one repository.
+
+    ``update`` re-indexes only files whose mtime or size changed since the
+    last run and drops files that left the manifest, so keeping the index
+    current costs about as much as the scan. ``search`` ranks files by the
+    BM25 score of the query terms.
+    """
+
+    def __init__(self, repo_path: str, cache_dir: Optional[str] = None):
+        self.repo_path = repo_path
+        self.db_path = index_path_for(repo_path, cache_dir)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.executescript(
+            """
+            PRAGMA cache_size = -65536;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID;
+            """
+        )
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(INDEX_VERSION):
+            self.connection.executescript("DELETE FROM postings; DELETE FROM docs;")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),)
+            )
+
+    def update(self, entries: List[ManifestEntry], options: ExportOptions) -> int:
+        """
+        Brings the index in line with the manifest's file entries.
+
+        :param entries: The file entries to index.
+        :param options: ExportOptions used to read the files.
+        :return: The number of files (re-)indexed.
+        """
+        indexed = {
+            path: (doc, mtime_ns, size)
+            for doc, path, mtime_ns, size in self.connection.execute(
+                "SELECT id, path, mtime_ns, size FROM docs"
+            )
+        }
+        current = {entry.rel_path for entry in entries}
+        removed = [doc for path, (doc, _, _) in indexed.items() if path not in current]
+        changed = [
+            entry for entry in entries
+            if indexed.get(entry.rel_path, (None, None, None))[1:] != (entry.mtime_ns, entry.size)
+        ]
+        stale = removed + [indexed[entry.rel_path][0] for entry in changed if entry.rel_path in indexed]
+        with metrics.stage("index_update"):
+            if stale:
+                # One pass over the postings; an index on doc would slow every insert down
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS stale (doc INTEGER PRIMARY KEY)")
+                self.connection.execute("DELETE FROM stale")
+                self.connection.executemany("INSERT INTO stale VALUES (?)", ((doc,) for doc in stale))
+                self.connection.execute("DELETE FROM postings WHERE doc IN (SELECT doc FROM stale)")
+                self.connection.execute("DELETE FROM docs WHERE id IN (SELECT doc FROM stale)")
+            # Files are read like an export without budgets, on the same thread pool
+            for entry, record in zip(changed, iter_exported_files(self.repo_path, changed, options)):
+                terms = tokenize(record.text()) if record.kind == TEXT else Counter()
+                for term, count in tokenize(entry.rel_path.replace(os.sep, "/")).items():
+                    terms[term] += count * PATH_WEIGHT
+                doc = self.connection.execute(
+                    "INSERT INTO docs (path, mtime_ns, size, length) VALUES (?, ?, ?, ?)",
+                    (entry.rel_path, entry.mtime_ns, entry.size, sum(terms.values())),
+                ).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    ((term, doc, count) for term, count in terms.items()),
+                )
+            self.connection.commit()
+        metrics.count("files_indexed", len(changed))
+        if changed or removed:
+            logging.info(f"Search index: {len(changed)} files indexed, {len(removed)} removed")
+        return len(changed)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """
+        Ranks indexed files against a query with BM25.
+
+        :param query: Free text; identifiers are split like file contents.
+        :param top_k: Maximum number of results.
+        :return: (relative path, score) pairs, best first.
+        """
+        terms = list(tokenize(query))
+        if not terms:
+            return []
+        with metrics.stage("index_search"):
+            total, average = self.connection.execute(
+                "SELECT COUNT(*), AVG(length) FROM docs"
+            ).fetchone()
+            if not total:
+                return []
+            average = average or 1.0
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self.connection.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc "
+                    "WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf, length in postings:
+                    norm = tf + K1 * (1 - B + B * length / average)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+            paths = dict(self.connection.execute(
+                f"SELECT id, path FROM docs WHERE id IN ({','.join('?' * len(best))})",
+                [doc for doc, _ in best],
+            ).fetchall()) if best else {}
+        return [(paths[doc], score) for doc, score in best]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class QueryResult:
+    """The files selected by a query, with their scores for the export report."""
+
+    def __init__(self, query: str, ranked: List[Tuple[str, float]]):
+        self.query = query
+        self.ranked = ranked
+
+    def report(self) -> str:
+        lines = ["# Query results", f"Top {len(self.ranked)} files for \"{self.query}\" (BM25 score):"]
+        lines.extend(f"- {path} ({score:.2f})" for path, score in self.ranked)
+        return "\n".join(lines) + "\n\n"
+
+
+def select_relevant(
+        repo_path: str, entries: List[ManifestEntry], options: ExportOptions
+) -> Tuple[List[ManifestEntry], QueryResult]:
+    """
+    Keeps the ``options.top_k`` files most relevant to ``options.query``, in tree order.
+
+    The repository's index is updated first, so results reflect the files on disk.
+    """
+    index = SearchIndex(repo_path, options.cache_dir)
+    try:
+        index.update(entries, options)
+        ranked = index.search(options.query, options.top_k)
+    finally:
+        index.close()
+    selected = {path for path, _ in ranked}
+    logging.info(f"Query \"{options.query}\": {len(selected)} of {len(entries)} files selected")
+    return [entry for entry in entries if entry.rel_path in selected], QueryResult(options.query, ranked)
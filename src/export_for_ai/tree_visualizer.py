@@ -1,61 +1,232 @@
 import logging
-import os
-from anytree import Node, RenderTree
-from export_for_ai.ignore_parser import parse_ignore_file, should_include_item
-
-def build_tree(path, root_path, spec):
-    """
-    Recursively builds a tree structure using anytree based on the directory contents.
-    
-    :param path: Current directory path.
-    :param root_path: Root directory path for relative calculations.
-    :param spec: PathSpec object containing ignore patterns.
-    :return: The root Node of the tree.
-    """
-    basename = os.path.basename(os.path.abspath(path))
-    root_node = Node(basename + '/')
-    
-    def add_children(current_path, current_node):
-        try:
-            items = sorted(os.listdir(current_path))
-        except PermissionError:
-            logging.warning(f"Permission denied: {current_path}")
-            return
-        
-        dirs = [item for item in items if os.path.isdir(os.path.join(current_path, item))]
-        files = [item for item in items if os.path.isfile(os.path.join(current_path, item))]
-        
-        # Filter directories and files based on ignore patterns
-        dirs = [d for d in dirs if should_include_item(os.path.relpath(os.path.join(current_path, d), root_path), spec)]
-        files = [f for f in files if should_include_item(os.path.relpath(os.path.join(current_path, f), root_path), spec)]
-        
-        for d in dirs:
-            dir_path = os.path.join(current_path, d)
-            node = Node(d + '/', parent=current_node)
-            add_children(dir_path, node)
-        
-        for f in files:
-            Node(f, parent=current_node)
-    
-    add_children(path, root_node)
-    return root_node
-
-def get_tree_structure(path):
+import sys
+from array import array
+from typing import Callable, Iterator, Optional
+
+from export_for_ai.metrics import metrics
+from export_for_ai.options import ExportOptions
+from export_for_ai.scanner import Manifest, ensure_manifest
+
+# Same drawing characters as anytree's ContStyle
+VERTICAL = '│   '
+SPACE = '    '
+BRANCH = '├── '
+LAST_BRANCH = '└── '
+
+IS_DIR = 1
+IS_LAST = 2
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+
+def format_size(size: int) -> str:
+    """Formats a byte count for tree summaries, e.g. 18 MB or 1.5 KB."""
+    value = float(size)
+    for unit in SIZE_UNITS:
+        if value < 1024 or unit == SIZE_UNITS[-1]:
+            break
+        value /= 1024
+    if unit == 'B' or value >= 10:
+        return f"{value:,.0f} {unit}"
+    return f"{value:.1f} {unit}"
+
+
+def format_summary(files: int, size: int) -> str:
+    return f"({files:,} file{'' if files == 1 else 's'}, {format_size(size)})"
+
+
+class CompactTree:
+    """
+    Array-backed directory tree built from a manifest.
+
+    Node ``i`` is manifest entry ``i``; the root is implicit. Names are
+    interned and stored with a trailing '/' for directories. ``parents`` holds
+    the parent index (-1 for the root), ``ends`` the index one past the node's
+    last descendant, and ``flags`` the IS_DIR and IS_LAST (last child of its
+    parent) bits, so a subtree can be skipped or summarized by index range.
+    ``file_counts`` and ``total_sizes`` are running totals over the entries,
+    which give the file count and size of any index range in constant time.
+    """
+
+    __slots__ = (
+        'root_name', 'names', 'depths', 'parents', 'ends', 'flags', 'sizes',
+        'file_counts', 'total_sizes',
+    )
+
+    def __init__(self, root_name: str):
+        self.root_name = root_name + '/'
+        self.names = []
+        self.depths = array('i')
+        self.parents = array('i')
+        self.ends = array('i')
+        self.flags = bytearray()
+        self.sizes = array('q')
+        self.file_counts = array('q', [0])
+        self.total_sizes = array('q', [0])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def summarize(self, start: int, end: int) -> tuple:
+        """Returns the (file count, total size) of entries in [start, end)."""
+        return (
+            self.file_counts[end] - self.file_counts[start],
+            self.total_sizes[end] - self.total_sizes[start],
+        )
+
+
+def build_tree(manifest: Manifest) -> CompactTree:
+    """
+    Builds a compact tree from a scanned directory manifest.
+
+    Manifest entries are in pre-order with their depth, so parents, subtree
+    ends and last-child flags all follow from one pass over a depth stack.
+
+    :param manifest: Manifest produced by scanner.scan_directory.
+    :return: The CompactTree for the manifest.
+    """
+    tree = CompactTree(manifest.root_name)
+    count = len(manifest.entries)
+    tree.parents = array('i', [-1]) * count
+    tree.ends = array('i', [count]) * count
+    tree.flags = bytearray(count)
+    # stack[d - 1] is the index of the open node at depth d
+    stack = []
+    for index, entry in enumerate(manifest.entries):
+        depth = entry.depth
+        while len(stack) >= depth:
+            tree.ends[stack.pop()] = index
+        if stack:
+            tree.parents[index] = stack[-1]
+        stack.append(index)
+        if entry.is_dir:
+            tree.names.append(sys.intern(entry.name + '/'))
+            tree.flags[index] = IS_DIR
+        else:
+            tree.names.append(sys.intern(entry.name))
+        tree.depths.append(depth)
+        tree.sizes.append(entry.size)
+        tree.file_counts.append(tree.file_counts[-1] + (not entry.is_dir))
+        tree.total_sizes.append(tree.total_sizes[-1] + entry.size)
+
+    # A node is the last child of its parent when its subtree ends where the
+    # parent's does
+    for index in range(count):
+        parent = tree.parents[index]
+        parent_end = tree.ends[parent] if parent >= 0 else count
+        if tree.ends[index] == parent_end:
+            tree.flags[index] |= IS_LAST
+    return tree
+
+
+def iter_tree_chunks(tree: CompactTree, options: Optional[ExportOptions] = None) -> Iterator[str]:
+    """
+    Yields the rendered tree line by line, root first, with the line breaks
+    in between, so the chunks join to exactly the text of get_tree_structure.
+
+    With ``options.tree_max_depth``, directories at that depth are shown as a
+    summary of their content; with ``options.tree_collapse_files``, so are
+    directories holding more files than that. ``options.tree_max_children``
+    cuts long directory listings after that many entries with one summary line
+    for the rest. Skipped subtrees are jumped over by index range, never visited.
+
+    :param tree: The CompactTree to render.
+    :param options: Optional ExportOptions with the tree limits.
+    :return: An iterator over text chunks.
+    """
+    options = options or ExportOptions()
+    max_depth = options.tree_max_depth
+    max_children = options.tree_max_children
+    collapse_files = options.tree_collapse_files
+    summarized = max_depth is not None or collapse_files is not None
+    yield tree.root_name
+    names, depths, flags, ends = tree.names, tree.depths, tree.flags, tree.ends
+    count = len(names)
+    # prefixes[d - 1] is the full prefix of lines at depth d, and
+    # children[d - 1] the number of entries already shown at that depth
+    prefixes = ['']
+    children = [0]
+    index = 0
+    while index < count:
+        depth = depths[index]
+        del children[depth:]
+        prefix = prefixes[depth - 1]
+        if max_children is not None and children[depth - 1] >= max_children:
+            # Summarize the remaining siblings and jump to the parent's end
+            parent = tree.parents[index]
+            end = ends[parent] if parent >= 0 else count
+            remaining = 0
+            sibling = index
+            while sibling < end:
+                remaining += 1
+                sibling = ends[sibling]
+            files, size = tree.summarize(index, end)
+            yield f"\n{prefix}{LAST_BRANCH}... {remaining:,} more {format_summary(files, size)}"
+            index = end
+            continue
+        children[depth - 1] += 1
+        # A child within the limit that is last among its siblings is never
+        # followed by a summary line
+        last = flags[index] & IS_LAST
+        line = "\n" + prefix + (LAST_BRANCH if last else BRANCH) + names[index]
+        end = ends[index]
+        if summarized and flags[index] & IS_DIR and end > index + 1:
+            files, size = tree.summarize(index + 1, end)
+            if (max_depth is not None and depth >= max_depth) or (
+                    collapse_files is not None and files > collapse_files
+            ):
+                yield f"{line} {format_summary(files, size)}"
+                index = end
+                continue
+        yield line
+        if flags[index] & IS_DIR:
+            del prefixes[depth:]
+            prefixes.append(prefix + (SPACE if last else VERTICAL))
+            children.append(0)
+        index += 1
+
+
+def write_tree(
+        tree: CompactTree, write: Callable[[str], object], options: Optional[ExportOptions] = None
+) -> None:
+    """Streams the rendered tree to a writer such as ``handle.write``."""
+    for chunk in iter_tree_chunks(tree, options):
+        write(chunk)
+
+
+def iter_tree_structure(
+        path, manifest: Optional[Manifest] = None, options: Optional[ExportOptions] = None
+) -> Iterator[str]:
+    """
+    Yields the tree structure in chunks instead of building one string.
+
+    :param path: The root directory path.
+    :param manifest: Optional pre-scanned manifest to render instead of walking the directory.
+    :param options: Optional ExportOptions with the tree limits.
+    :return: An iterator over text chunks.
+    """
+    manifest = ensure_manifest(path, manifest, options)
+    logging.debug(f"Rendering tree with {len(manifest)} entries")
+    with metrics.stage("tree_build"):
+        tree = build_tree(manifest)
+    metrics.count("tree_nodes", len(tree))
+    yield from metrics.timed_iter("tree_render", iter_tree_chunks(tree, options))
+
+
+def get_tree_structure(
+        path, manifest: Optional[Manifest] = None, options: Optional[ExportOptions] = None
+):
     """
     Generate a string representation of the folder structure.
-    
+
     :param path: The root directory path.
+    :param manifest: Optional pre-scanned manifest to render instead of walking the directory.
+    :param options: Optional ExportOptions with the tree limits.
     :return: A string representing the tree structure.
     """
-    spec = parse_ignore_file(path)
-    tree = build_tree(path, path, spec)
-    tree_lines = []
-    for pre, _, node in RenderTree(tree):
-        tree_lines.append(pre + node.name)
-    return "\n".join(tree_lines)
+    return "".join(iter_tree_structure(path, manifest, options))
 
 if __name__ == "__main__":
-    import sys
     if len(sys.argv) > 1:
         print(get_tree_structure(sys.argv[1]))
     else:
@@ -0,0 +1,365 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from export_for_ai.export_cache import MemoryCache
+from export_for_ai.folder_exporter import FolderExport
+from export_for_ai.ignore_parser import EXPORTIGNORE, GITIGNORE
+from export_for_ai.options import ExportOptions
+from export_for_ai.scanner import Manifest, rescan_directories, scan_directory
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# (watched directory, entry name, mask); the directory is None for a queue overflow
+Event = Tuple[Optional[str], str, int]
+
+
+class InotifyBackend:
+    """Minimal inotify binding: one watch per included directory, events name the changed entries."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched: Dict[str, int] = {}
+        self.directories: Dict[int, str] = {}
+
+    @staticmethod
+    def available() -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+            return hasattr(libc, "inotify_init1")
+        except OSError:
+            return False
+
+    def sync(self, directories: List[str]) -> None:
+        """Adds watches for directories that are not watched yet."""
+        for directory in directories:
+            if directory in self.watched:
+                continue
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}")
+            self.watched[directory] = wd
+            self.directories[wd] = directory
+
+    def forget(self, directories: Iterable[str]) -> None:
+        """
+        Removes the watches of directories that left the tree.
+
+        A moved directory keeps its watch under its old path, so its watch is
+        dropped here and the directory is watched again under its new path.
+        """
+        for directory in directories:
+            wd = self.watched.pop(directory, None)
+            if wd is not None:
+                self.directories.pop(wd, None)
+                # Fails harmlessly if the kernel already dropped the watch
+                self._rm_watch(self.fd, wd)
+
+    def wait(self, timeout: float) -> List[Event]:
+        """Waits for events; returns those that arrived, or an empty list on timeout."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events: List[Event] = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, "", mask))
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # Deleted directories lose their watch; forget it so a recreated one is watched again
+                del self.directories[wd]
+                if self.watched.get(directory) == wd:
+                    del self.watched[directory]
+            events.append((directory, os.fsdecode(name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class RepositoryWatcher:
+    """
+    Keeps an up-to-date in-memory export model of one repository.
+
+    The model is the filtered manifest and a MemoryCache of processed file
+    blocks. Filesystem events (inotify on Linux, periodic
+    rescans elsewhere) are debounced and coalesced. With inotify each refresh
+    lists only the directories named by the events; polling rescans the
+    tree. Either way only files whose mtime or size changed are read, so an
+    export taken from the model needs no file reads at all.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            options: Optional[ExportOptions] = None,
+            on_update: Optional[Callable[["RepositoryWatcher"], None]] = None,
+            debounce: float = DEFAULT_DEBOUNCE,
+            max_delay: float = DEFAULT_MAX_DELAY,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.path = os.path.abspath(path)
+        self.options = options or ExportOptions()
+        self.on_update = on_update
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.cache = MemoryCache()
+        self.manifest: Optional[Manifest] = None
+        self.version = 0
+        self.lock = threading.RLock()
+        self._signature = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._backend: Optional[InotifyBackend] = None
+
+    def refresh(self, dirty: Optional[Iterable[str]] = None) -> bool:
+        """
+        Updates the model and re-reads changed files.
+
+        :param dirty: Directories with inotify events, relative to the root. Only
+            those are listed again; None rescans the whole tree, as polling does.
+        :return: True if the model changed, False otherwise.
+        """
+        if dirty is None or self.manifest is None:
+            return self._refresh_all()
+        update = rescan_directories(self.manifest, dirty, self.options)
+        if not update.changed and not update.removed:
+            return False
+        with self.lock:
+            self.cache.discard(update.removed)
+            self.cache.reset_stats()
+            # Warm the cache with the new and modified files only
+            changed = Manifest(self.path, [entry for entry in update.changed if not entry.is_dir])
+            for _ in FolderExport(self.path, changed, self.options, self.cache, duplicates={}):
+                pass
+            logging.info(
+                f"Watcher refreshed {self.path}: {self.cache.misses} files re-read, "
+                f"{len(update.removed)} entries removed"
+            )
+            self.manifest = update.manifest
+            # Recomputed by the next full rescan only
+            self._signature = None
+            self.version += 1
+        if self._backend is not None:
+            self._sync_watches(update.manifest)
+        return True
+
+    def _refresh_all(self) -> bool:
+        manifest = scan_directory(self.path, options=self.options)
+        signature = [(e.rel_path, e.size, e.mtime_ns) for e in manifest.entries]
+        with self.lock:
+            previous = self._signature
+            if previous is None and self.manifest is not None:
+                previous = [(e.rel_path, e.size, e.mtime_ns) for e in self.manifest.entries]
+            if signature == previous:
+                self._signature = signature
+                return False
+            self.cache.retain(entry.rel_path for entry in manifest.files)
+            self.cache.reset_stats()
+            # Warm the cache: unchanged files hit, changed files are read now
+            for _ in FolderExport(self.path, manifest, self.options, self.cache):
+                pass
+            logging.info(
+                f"Watcher refreshed {self.path}: {self.cache.misses} files re-read, "
+                f"{self.cache.hits} unchanged"
+            )
+            self.manifest = manifest
+            self._signature = signature
+            self.version += 1
+        if self._backend is not None:
+            self._sync_watches(manifest)
+        return True
+
+    @contextmanager
+    def snapshot(self) -> Iterator[Tuple[Manifest, MemoryCache]]:
+        """Yields a consistent (manifest, cache) pair; refreshes wait until it is released."""
+        with self.lock:
+            if self.manifest is None:
+                self.refresh()
+            yield self.manifest, self.cache
+
+    def start(self) -> None:
+        """Builds the initial model and starts watching in a background thread."""
+        if InotifyBackend.available():
+            try:
+                self._backend = InotifyBackend()
+            except OSError as e:
+                logging.warning(f"inotify unavailable, polling instead: {e}")
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        mode = "inotify" if self._backend is not None else f"polling every {self.poll_interval}s"
+        logging.info(f"Watching {self.path} ({mode})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+    def _sync_watches(self, manifest: Manifest) -> None:
+        directories = [self.path] + [
+            os.path.join(self.path, entry.rel_path) for entry in manifest.entries if entry.is_dir
+        ]
+        wanted = set(directories)
+        self._backend.forget([directory for directory in self._backend.watched if directory not in wanted])
+        try:
+            self._backend.sync(directories)
+        except OSError as e:
+            logging.warning(f"Falling back to polling for {self.path}: {e}")
+            self._backend.close()
+            self._backend = None
+
+    def _collect(self, events: List[Event], dirty: Set[str]) -> bool:
+        """
+        Adds the directories named by events to ``dirty``.
+
+        :return: True if the events need a full rescan: a queue overflow, a
+            changed ignore file, or a git index listing that may have changed.
+        """
+        full = self.options.use_git_index
+        ignore_names = (GITIGNORE, EXPORTIGNORE)
+        for directory, name, _ in events:
+            if directory is None or name in ignore_names:
+                full = True
+                continue
+            rel_dir = os.path.relpath(directory, self.path)
+            dirty.add("" if rel_dir == os.curdir else rel_dir)
+        return full
+
+    def _run(self) -> None:
+        first_event = None
+        last_event = None
+        dirty: Set[str] = set()
+        full = False
+        while not self._stop.is_set():
+            if self._backend is None:
+                self._stop.wait(self.poll_interval)
+                changed = not self._stop.is_set() and self._safe_refresh()
+            else:
+                now = time.monotonic()
+                events = self._backend.wait(self.debounce)
+                if events:
+                    full = self._collect(events, dirty) or full
+                    now = time.monotonic()
+                    last_event = now
+                    first_event = first_event or now
+                    # Keep coalescing a burst, but never delay longer than max_delay
+                    if now - first_event < self.max_delay:
+                        continue
+                elif first_event is None or now - last_event < self.debounce:
+                    continue
+                first_event = last_event = None
+                changed = self._safe_refresh(None if full else dirty)
+                dirty = set()
+                full = False
+            if changed and self.on_update is not None:
+                self.on_update(self)
+
+    def _safe_refresh(self, dirty: Optional[Iterable[str]] = None) -> bool:
+        try:
+            return self.refresh(dirty)
+        except Exception as e:
+            logging.error(f"Watcher refresh failed for {self.path}: {e}")
+            return False
+
+
+class WatchService:
+    """Runs one RepositoryWatcher per repository and keeps the set in sync with the config."""
+
+    def __init__(
+            self,
+            options: Optional[ExportOptions] = None,
+            on_update: Optional[Callable[[RepositoryWatcher], None]] = None,
+    ):
+        self.options = options or ExportOptions()
+        self.on_update = on_update
+        self.watchers: Dict[str, RepositoryWatcher] = {}
+        self.lock = threading.Lock()
+
+    def sync(self, repositories: List[str]) -> None:
+        """Starts watchers for new repositories and stops those no longer configured."""
+        wanted = {os.path.abspath(path) for path in repositories if os.path.isdir(path)}
+        with self.lock:
+            for path in list(self.watchers):
+                if path not in wanted:
+                    self.watchers.pop(path).stop()
+            for path in wanted:
+                if path not in self.watchers:
+                    watcher = RepositoryWatcher(path, self.options, self.on_update)
+                    watcher.start()
+                    self.watchers[path] = watcher
+
+    def add(self, repositories: List[str]) -> None:
+        """Starts watchers for repositories not watched yet, keeping the others running."""
+        with self.lock:
+            for path in repositories:
+                path = os.path.abspath(path)
+                if path not in self.watchers and os.path.isdir(path):
+                    watcher = RepositoryWatcher(path, self.options, self.on_update)
+                    watcher.start()
+                    self.watchers[path] = watcher
+
+    def get(self, repo_path: str) -> Optional[RepositoryWatcher]:
+        with self.lock:
+            return self.watchers.get(os.path.abspath(repo_path))
+
+    def stop(self) -> None:
+        with self.lock:
+            for watcher in self.watchers.values():
+                watcher.stop()
+            self.watchers.clear()
@@ -0,0 +1,359 @@
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO, Iterable, Iterator, List, Optional, TextIO, Union
+
+from export_for_ai.artifact_store import ArtifactStore
+from export_for_ai.budget import BYTES_PER_TOKEN, estimate_tokens
+from export_for_ai.file_types import get_language
+from export_for_ai.folder_exporter import FolderExport, MappedFile, render_file_block
+from export_for_ai.options import (
+    COMPRESSION_GZIP,
+    COMPRESSION_ZSTD,
+    DEFAULT_CLIPBOARD_MAX_BYTES,
+    FORMAT_JSONL,
+    FORMAT_MARKDOWN,
+)
+
+
+FORMAT_SUFFIXES = {FORMAT_MARKDOWN: ".md", FORMAT_JSONL: ".jsonl"}
+COMPRESSION_SUFFIXES = {COMPRESSION_GZIP: ".gz", COMPRESSION_ZSTD: ".zst"}
+
+# Attempts at a free temporary name before giving up, as in tempfile.mkstemp
+_TEMP_ATTEMPTS = 100
+# Text outputs translate "\n" on platforms with another line separator, so
+# bytes can only be copied into them unchanged where it is "\n"
+_COPY_BYTES = os.linesep == "\n"
+
+
+class _HashingOutput(io.BufferedIOBase):
+    """
+    Binary stream that hashes the bytes written to the file under it.
+
+    It sits below any compressor, so the digest identifies the output as it
+    is stored on disk, format and compression included.
+    """
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.raw.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+
+def write_chunk(handle: TextIO, chunk: Union[str, MappedFile]) -> None:
+    """
+    Writes one rendered chunk; a MappedFile body is copied from its memory map.
+
+    The mapped bytes go straight to the binary stream under the text
+    handle (or its compressor), so large files are never decoded.
+    """
+    if isinstance(chunk, str):
+        handle.write(chunk)
+    elif not _COPY_BYTES:
+        handle.write(chunk.read_text())
+    else:
+        with chunk.view() as data:
+            # Text buffered so far must reach the binary stream first
+            handle.flush()
+            handle.buffer.write(data)
+
+
+def output_suffix(output_format: str = FORMAT_MARKDOWN, compression: Optional[str] = None) -> str:
+    """Returns the file suffix of an output, e.g. ``.md`` or ``.jsonl.gz``."""
+    return FORMAT_SUFFIXES[output_format] + (COMPRESSION_SUFFIXES[compression] if compression else "")
+
+
+class _CompressorInput(io.BufferedIOBase):
+    """
+    Binary stream feeding a compressor that ignores flushes.
+
+    write_chunk flushes the text handle before copying bytes under it; a
+    flush reaching the compressor would end a block early and change the
+    output. The compressor is finished when it is closed.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.stream.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def _compressed_stream(raw: BinaryIO, compression: str) -> BinaryIO:
+    if compression == COMPRESSION_GZIP:
+        # A fixed mtime keeps identical exports byte-identical
+        return gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+    if compression == COMPRESSION_ZSTD:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError("zstd output requires the zstandard package (pip install zstandard)") from e
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def _create_temp(path: str) -> tuple:
+    """
+    Creates a new temporary file next to ``path`` and returns (fd, temp_path).
+
+    Unlike tempfile.mkstemp, which creates files readable by the owner only,
+    the file is created with mode 0o666 and the kernel applies the process
+    umask, so outputs get the usual mode without reading the umask.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(_TEMP_ATTEMPTS):
+        temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.urandom(6).hex()}.tmp")
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free temporary file name next to {path}")
+
+
+@contextmanager
+def atomic_output(
+        path: str, store: Optional[ArtifactStore] = None, compression: Optional[str] = None
+) -> Iterator[TextIO]:
+    """
+    Opens a text output that only replaces ``path`` once it is fully written.
+
+    The content goes to a temporary file in the same directory, which is
+    renamed over ``path`` on success and removed on any error or cancellation,
+    so readers never see a partial export. With a ``store``, the bytes written
+    to the file, after compression, are hashed on the way and the output is
+    published through the store, which leaves an identical existing output
+    untouched.
+
+    :param path: The final output path.
+    :param store: Optional ArtifactStore to publish the output through.
+    :param compression: Optional "gzip" or "zstd" to compress the output while writing.
+    :return: A context manager yielding a writable text handle.
+    """
+    fd, temp_path = _create_temp(path)
+    try:
+        with ExitStack() as stack:
+            raw = stack.enter_context(open(fd, "wb"))
+            hashing = _HashingOutput(raw) if store is not None else None
+            binary = raw if hashing is None else hashing
+            if compression:
+                stream = stack.enter_context(_compressed_stream(binary, compression))
+                binary = _CompressorInput(stream)
+            yield stack.enter_context(io.TextIOWrapper(binary, encoding="utf-8"))
+        if store is not None:
+            store.publish(temp_path, path, hashing.digest.hexdigest())
+        else:
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def write_project_md(
+        handle: TextIO,
+        header: str,
+        tree_structure: Union[str, Iterable[str]],
+        content_chunks: Iterable[Union[str, MappedFile]],
+) -> None:
+    """
+    Writes the project markdown to an open file handle chunk by chunk.
+
+    :param handle: Text file handle opened for writing.
+    :param header: The dynamic sections placed before the tree.
+    :param tree_structure: The tree structure, as a string or an iterable of chunks.
+    :param content_chunks: Iterable of folder content chunks, consumed lazily;
+        MappedFile chunks are copied with write_chunk.
+    """
+    _write_project_md_head(handle, header, tree_structure)
+    for chunk in content_chunks:
+        write_chunk(handle, chunk)
+    handle.write("\n# EntireSolution Code end \n")
+
+
+def _write_project_md_head(
+        handle: TextIO, header: str, tree_structure: Union[str, Iterable[str]], part: str = ""
+) -> None:
+    handle.write(header)
+    handle.write("\n\n# SolutionTreeView \n```\n")
+    if isinstance(tree_structure, str):
+        handle.write(tree_structure)
+    else:
+        for chunk in tree_structure:
+            handle.write(chunk)
+    handle.write("\n```\n\n")
+    handle.write(f"\n\n# Entire Solution Code start {part}\n")
+
+
+def write_jsonl(handle: TextIO, folder_export: FolderExport, summary: str = "") -> None:
+    """
+    Writes one JSON record per exported file, so files can be loaded selectively.
+
+    Each line holds ``path``, ``size`` (bytes on disk), ``language``, ``kind``
+    (text, empty, binary, error or duplicate) and ``content``; a duplicate's
+    content names the file holding its body. A budget report, if any, closes
+    the output as a record of kind ``report`` without a path; a ``summary``
+    (the change list of a diff export) opens it as a record of kind
+    ``summary``.
+
+    :param handle: Text file handle opened for writing.
+    :param folder_export: The FolderExport whose records are written.
+    :param summary: Optional text written before the file records.
+    """
+    if summary:
+        handle.write(json.dumps({"path": None, "kind": "summary", "content": summary}, ensure_ascii=False))
+        handle.write("\n")
+    for entry, record in folder_export:
+        handle.write(json.dumps({
+            "path": record.rel_path,
+            "size": entry.size,
+            "language": get_language(record.rel_path),
+            "kind": record.kind,
+            "content": record.text(),
+        }, ensure_ascii=False))
+        handle.write("\n")
+    report = folder_export.report()
+    if report:
+        handle.write(json.dumps({"path": None, "kind": "report", "content": report}, ensure_ascii=False))
+        handle.write("\n")
+
+
+def part_path(base_path: str, number: int, suffix: str) -> str:
+    return f"{base_path}.part{number:03d}{suffix}"
+
+
+def write_project_parts(
+        base_path: str,
+        header: str,
+        tree_structure: Union[str, Iterable[str]],
+        folder_export: FolderExport,
+        part_tokens: int,
+        store: Optional[ArtifactStore] = None,
+        compression: Optional[str] = None,
+) -> str:
+    """
+    Splits the project markdown into parts of about ``part_tokens`` tokens each.
+
+    Parts are cut at file boundaries and each one repeats the header and the
+    tree, which count towards its size, so any part can be handed to a model
+    on its own. A file larger than a part gets a part to itself. A JSON manifest lists every part with its
+    files and estimated size; parts left over from an earlier, longer export
+    are removed.
+
+    :param base_path: Output path without suffix, e.g. ``dest/project-name``.
+    :param header: The dynamic sections placed before the tree.
+    :param tree_structure: The tree structure, as a string or an iterable of chunks.
+    :param folder_export: The FolderExport whose files are written.
+    :param part_tokens: Estimated token budget of one part.
+    :param store: Optional ArtifactStore to publish the parts through.
+    :param compression: Optional "gzip" or "zstd" compression of the parts.
+    :return: The path of the manifest.
+    """
+    tree_structure = tree_structure if isinstance(tree_structure, str) else "".join(tree_structure)
+    suffix = output_suffix(FORMAT_MARKDOWN, compression)
+    part_chars = part_tokens * BYTES_PER_TOKEN
+    parts: List[dict] = []
+    head_chars = len(header) + len(tree_structure)
+    with ExitStack() as stack:
+        handle = None
+
+        def close_part() -> None:
+            # Closing the part's context publishes it
+            parts[-1]["estimated_tokens"] = estimate_tokens(parts[-1]["chars"])
+            handle.write("\n# EntireSolution Code end \n")
+            stack.close()
+
+        def open_part() -> TextIO:
+            number = len(parts) + 1
+            path = part_path(base_path, number, suffix)
+            part_handle = stack.enter_context(atomic_output(path, store, compression))
+            _write_project_md_head(part_handle, header, tree_structure, f"(part {number}) ")
+            parts.append({"path": os.path.basename(path), "files": [], "chars": head_chars})
+            return part_handle
+
+        def add(rel_path: Optional[str], chunks: List[Union[str, MappedFile]]) -> None:
+            nonlocal handle
+            size = sum(map(len, chunks))
+            if handle is None or (parts[-1]["chars"] + size > part_chars and parts[-1]["files"]):
+                if handle is not None:
+                    close_part()
+                handle = open_part()
+            for chunk in chunks:
+                write_chunk(handle, chunk)
+            parts[-1]["chars"] += size
+            if rel_path is not None:
+                parts[-1]["files"].append(rel_path)
+
+        for _, record in folder_export:
+            add(record.rel_path, render_file_block(record))
+        report = folder_export.report()
+        if report:
+            add(None, [report])
+        if handle is None:
+            handle = open_part()
+        close_part()
+
+    # Remove parts of an earlier export that had more of them
+    written = {part["path"] for part in parts}
+    for stale in glob.glob(glob.escape(base_path) + ".part[0-9][0-9][0-9]*"):
+        if os.path.basename(stale) not in written:
+            os.remove(stale)
+
+    manifest_path = f"{base_path}.manifest.json"
+    with atomic_output(manifest_path, store) as f:
+        json.dump({
+            "parts": parts,
+            "part_tokens": part_tokens,
+            "files": sum(len(part["files"]) for part in parts),
+        }, f, indent=2)
+    return manifest_path
+
+
+def copy_file_to_clipboard(
+        file_path: str, max_bytes: int = DEFAULT_CLIPBOARD_MAX_BYTES
+) -> bool:
+    """
+    Copies a written export to the system clipboard if it fits the size cap.
+
+    :param file_path: The file whose content should be copied.
+    :param max_bytes: Largest file size that is still copied.
+    :return: True if the content was copied, False otherwise.
+    """
+    try:
+        size = os.path.getsize(file_path)
+        if size > max_bytes:
+            logging.warning(
+                f"Skipping clipboard copy: {size} bytes exceeds the {max_bytes} byte limit"
+            )
+            return False
+        import pyperclip
+
+        with open(file_path, "r", encoding="utf-8") as f:
+            pyperclip.copy(f.read())
+        logging.info("Content successfully copied to clipboard")
+        return True
+    except Exception as e:
+        logging.warning(f"Could not copy to clipboard: {e}")
+        return False
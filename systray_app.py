@@ -1,4 +1,5 @@
 # File: systray_app.py
+import multiprocessing
 import threading
 import webbrowser
 import sys
@@ -7,25 +8,26 @@ import json
 import shutil
 import logging
 import time
-import requests
 import traceback
 from typing import Optional
 
 import pystray
 from PIL import Image, ImageDraw
 from pynput import keyboard
-import uvicorn
 
 import app_main
-from web_ui import app
+from export_for_ai.export_daemon import ExportDaemon
+from export_for_ai.options import options_from_config
 
 # --- Global Variables ---
 server_instance = None
 server_thread = None
 icon = None
+export_daemon = None
 UI_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "ui_config.json")
 LOG_FILE = os.path.join(os.path.dirname(__file__), "systray_crash.log")
 BASE_URL = "http://127.0.0.1:8000"
+SERVER_START_TIMEOUT = 5.0
 
 # --- Setup ---
 def setup_logging():
@@ -61,6 +63,8 @@ def create_icon_image():
 
 def is_server_running():
     """Checks if the web server is running and accessible."""
+    import requests
+
     try:
         response = requests.get(f"{BASE_URL}/api/config", timeout=1)
         return response.status_code == 200
@@ -73,6 +77,10 @@ def start_web_server():
         logging.info("Server is already running.")
         return
 
+    # FastAPI and uvicorn are loaded when the UI is first opened, not before the tray icon appears
+    import uvicorn
+    from web_ui import app
+
     config = uvicorn.Config(app, host="127.0.0.1", port=8000, log_level="warning")
     server_instance = uvicorn.Server(config)
     
@@ -87,8 +95,11 @@ def start_web_server():
     server_thread = threading.Thread(target=run_server)
     server_thread.daemon = True
     server_thread.start()
-    logging.info("Web server started. Giving it a moment to initialize...")
-    time.sleep(2)
+    # Wait until uvicorn is listening rather than for a fixed delay
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while not server_instance.started and server_thread.is_alive() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    logging.info("Web server started." if server_instance.started else "Web server did not start in time.")
 
 # --- UI and Export Functions ---
 def open_ui():
@@ -134,16 +145,21 @@ def run_export_and_open_folder():
         return
 
     app_main.setup_logging()
-    for repo_path in repositories:
-        logging.info(f"Processing repository: {repo_path}")
-        md_file_path = app_main.process_single_repository(repo_path)
-        if md_file_path:
-            try:
-                shutil.copy(md_file_path, export_destination)
-                logging.info(f"  -> Copied '{os.path.basename(md_file_path)}' to destination.")
-                shutil.rmtree(os.path.dirname(md_file_path))
-            except Exception as e:
-                logging.error(f"Failed to copy or clean up for '{repo_path}': {e}")
+    # The same options as a web UI job of this config
+    options = options_from_config(config)
+    if export_daemon and not options.dedupe:
+        # Exported from the daemon's warm in-memory models, shared with CLI clients;
+        # content shared across repositories is only planned by the batch engine
+        results = export_daemon.export(repositories, export_destination, options)
+    else:
+        results = list(app_main.iter_batch_export(
+            repositories, export_destination, options, max_workers=config.get("max_workers")
+        ))
+    for result in results:
+        if result.ok:
+            logging.info(f"  -> Exported '{result.repo_path}' to '{os.path.basename(result.output_path)}'.")
+        else:
+            logging.error(f"Failed to export '{result.repo_path}': {result.error}")
 
     for asset_path in assets_to_copy:
         logging.info(f"Copying asset: {asset_path}")
@@ -170,8 +186,25 @@ def on_export_activate():
     export_thread.daemon = True
     export_thread.start()
 
+def start_export_daemon():
+    """Hosts the export daemon, warming the configured repositories so hotkey exports are served from memory."""
+    global export_daemon
+    try:
+        with open(UI_CONFIG_PATH, 'r') as f:
+            config = json.load(f)
+    except Exception as e:
+        logging.warning(f"Export daemon not started, could not read ui_config.json: {e}")
+        return
+    daemon = ExportDaemon()
+    daemon.start()
+    daemon.warm(config.get("repositories", []), options_from_config(config))
+    export_daemon = daemon
+    logging.info(f"Export daemon running; {len(daemon.status()['repositories'])} repositories warm.")
+
 def on_quit(icon_instance, item):
     logging.info("Quit command received. Shutting down.")
+    if export_daemon:
+        export_daemon.shutdown()
     if server_instance:
         server_instance.should_exit = True
     if server_thread and server_thread.is_alive():
@@ -207,11 +240,17 @@ def main():
     listener_thread.daemon = True
     listener_thread.start()
 
+    daemon_thread = threading.Thread(target=start_export_daemon)
+    daemon_thread.daemon = True
+    daemon_thread.start()
+
     logging.info("Application setup complete. Running icon.")
     icon.run()
 
 
 if __name__ == "__main__":
+    # Batch exports run on a process pool; required for frozen Windows builds
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception:
@@ -3,18 +3,29 @@ import json
 import logging
 import os
 import shutil
-from typing import AsyncGenerator, List, Optional
+import threading
+import time
+import uuid
+from typing import AsyncGenerator, Dict, List, Optional
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
 import app_main
+from export_for_ai.metrics import metrics
+from export_for_ai.options import ExportOptions, options_from_config
+from export_for_ai.progress import ExportCancelled, ExportProgress
 
 # --- FastAPI App Setup ---
 app = FastAPI()
 UI_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "ui_config.json")
+# Minimum seconds between progress events of one job
+PROGRESS_INTERVAL = 0.2
+# Finished jobs kept for GET /api/jobs
+MAX_FINISHED_JOBS = 20
+FINISHED_STATUSES = frozenset({"completed", "cancelled", "failed"})
 
 
 # --- Pydantic Models ---
@@ -22,12 +33,25 @@ class Config(BaseModel):
     export_destination: str
     repositories: List[str]
     assets_to_copy: Optional[List[str]] = []
+    max_workers: Optional[int] = None
+    artifact_store: Optional[str] = None
+    dedupe: Optional[bool] = False
+    # ExportOptions fields, as written by options_to_dict
+    options: Optional[dict] = None
 
 
 # --- Helper Functions ---
 def get_config_data() -> dict:
     """Reads config, ensuring default values for all keys."""
-    defaults = {"export_destination": "", "repositories": [], "assets_to_copy": []}
+    defaults = {
+        "export_destination": "",
+        "repositories": [],
+        "assets_to_copy": [],
+        "max_workers": None,
+        "artifact_store": None,
+        "dedupe": False,
+        "options": None,
+    }
     if not os.path.exists(UI_CONFIG_PATH):
         return defaults
     try:
@@ -61,72 +85,208 @@ async def save_config(config: Config) -> dict:
         return {"status": "error", "message": str(e)}
 
 
-async def run_export_logic(config: Config) -> AsyncGenerator[str, None]:
-    """The logic for the export and copy process, yielding logs."""
-    app_main.setup_logging()
-    yield "data: Starting process...\n\n"
+# --- Export Jobs ---
+class ExportJob:
+    """
+    One export run with its own progress counters, cancellation flag and event log.
 
-    export_destination = config.export_destination
-    repositories = config.repositories
-    assets_to_copy = config.assets_to_copy or []
+    Events are appended on the event loop thread; worker threads hand them over
+    with ``call_soon_threadsafe``. Every subscriber replays the log from the
+    start, so a client can reconnect to a running job without missing events.
+    """
+
+    def __init__(self, config: Config, loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex[:12]
+        self.config = config
+        self.status = "pending"
+        self.created = time.time()
+        self.events: List[dict] = []
+        self.progress = ExportProgress(on_update=self._on_progress)
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self._last_progress = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "repositories": self.config.repositories,
+            "progress": self.progress.snapshot(),
+        }
+
+    def emit(self, event_type: str, **data) -> None:
+        """Queues an event from any thread."""
+        self._loop.call_soon_threadsafe(self._append, {"type": event_type, **data})
+
+    def log(self, message: str) -> None:
+        self.emit("log", message=message)
+
+    def _append(self, event: dict) -> None:
+        if event["type"] == "status":
+            self.status = event["status"]
+        self.events.append(event)
+        # Wake the current subscribers and hand later ones a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _on_progress(self, progress: ExportProgress) -> None:
+        # Called from the reader threads for every file; throttled to keep the
+        # stream small for repositories with many files
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL or progress.files_done == progress.files_total:
+            self._last_progress = now
+            self.emit("progress", **progress.snapshot())
+
+    async def iter_events(self) -> AsyncGenerator[dict, None]:
+        index = 0
+        while True:
+            waiter = self._changed
+            if index < len(self.events):
+                index += 1
+                yield self.events[index - 1]
+                continue
+            if self.finished:
+                return
+            await waiter.wait()
+
+
+class JobManager:
+    """Runs export jobs on worker threads so several can run without blocking the event loop."""
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS):
+        self.jobs: Dict[str, ExportJob] = {}
+        self.max_finished = max_finished
+
+    def start(self, config: Config) -> ExportJob:
+        job = ExportJob(config, asyncio.get_running_loop())
+        self.jobs[job.id] = job
+        self._prune()
+        threading.Thread(target=run_job, args=(job,), name=f"export-job-{job.id}", daemon=True).start()
+        return job
 
-    if not export_destination or not await asyncio.to_thread(
-        os.path.isdir, export_destination
+    def get(self, job_id: str) -> ExportJob:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+        return job
+
+    def cancel(self, job_id: str) -> ExportJob:
+        job = self.get(job_id)
+        if not job.finished:
+            job.progress.cancel()
+            job.log("Cancelling...")
+        return job
+
+    def _prune(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.id]
+
+
+def job_options(config: Config) -> ExportOptions:
+    """Builds the ExportOptions of a job from the config's ``options`` and its dedicated keys."""
+    return options_from_config(config.dict())
+
+
+def export_repositories(job: ExportJob) -> None:
+    """Exports the job's repositories with the batch engine, logging each result."""
+    config = job.config
+    export_destination = config.export_destination
+    options = job_options(config)
+    if options.dedupe:
+        job.log("Finding duplicate files across repositories...")
+    job.log(f"Exporting {len(config.repositories)} repositories...")
+    # Results arrive in completion order, not list order
+    for result in app_main.iter_batch_export(
+            config.repositories, export_destination, options, config.max_workers, job.progress
     ):
-        yield f"data: [ERROR] Export destination '{export_destination}' is not a valid directory.\n\n"
-        return
-
-    # Process repositories for export
-    if repositories:
-        yield "data: --- Processing repositories for export ---\n\n"
-        for repo_path in repositories:
-            try:
-                yield f"data: Processing repository: {repo_path}\n\n"
-                md_file_path = await asyncio.to_thread(
-                    app_main.process_single_repository, repo_path
-                )
-
-                if md_file_path:
-                    yield f"data: Generated export file: {os.path.basename(md_file_path)}\n\n"
-                    export_dir = os.path.dirname(md_file_path)
-                    await asyncio.to_thread(
-                        shutil.copy, md_file_path, export_destination
-                    )
-                    yield f"data: Copied '{os.path.basename(md_file_path)}' to {export_destination}\n\n"
-                    await asyncio.to_thread(shutil.rmtree, export_dir)
-                    yield "data: Cleaned up temporary directory.\n\n"
-                else:
-                    yield f"data: [ERROR] Failed to process repository: {repo_path}\n\n"
-            except Exception as e:
-                yield f"data: [ERROR] An unexpected error occurred while processing {repo_path}: {e}\n\n"
-                logging.error(f"Error processing {repo_path}", exc_info=True)
-
-    # Process assets for copying
-    if assets_to_copy:
-        yield "data: --- Copying specified assets ---\n\n"
-        for asset_path in assets_to_copy:
-            try:
-                if not await asyncio.to_thread(os.path.exists, asset_path):
-                    yield f"data: [WARN] Asset not found, skipping: {asset_path}\n\n"
-                    continue
-
-                dest_name = os.path.basename(asset_path)
-                destination_path = os.path.join(export_destination, dest_name)
-                yield f"data: Copying '{dest_name}'...\n\n"
-
-                if await asyncio.to_thread(os.path.isdir, asset_path):
-                    await asyncio.to_thread(
-                        shutil.copytree, asset_path, destination_path, dirs_exist_ok=True
-                    )
-                    yield f"data: Successfully copied directory '{dest_name}'.\n\n"
-                else:
-                    await asyncio.to_thread(shutil.copy2, asset_path, destination_path)
-                    yield f"data: Successfully copied file '{dest_name}'.\n\n"
-            except Exception as e:
-                yield f"data: [ERROR] Failed to copy asset {asset_path}: {e}\n\n"
-                logging.error(f"Error copying asset {asset_path}", exc_info=True)
-
-    yield "data: All tasks completed.\n\n"
+        if result.ok:
+            job.log(f"Exported '{result.repo_path}' -> '{os.path.basename(result.output_path)}' in {export_destination}")
+        elif result.error == "Cancelled":
+            job.log(f"[WARN] Cancelled '{result.repo_path}'")
+        else:
+            job.log(f"[ERROR] Failed to process repository {result.repo_path}: {result.error}")
+
+
+def copy_assets(job: ExportJob) -> None:
+    export_destination = job.config.export_destination
+    for asset_path in job.config.assets_to_copy or []:
+        job.progress.check()
+        try:
+            if not os.path.exists(asset_path):
+                job.log(f"[WARN] Asset not found, skipping: {asset_path}")
+                continue
+
+            dest_name = os.path.basename(asset_path)
+            destination_path = os.path.join(export_destination, dest_name)
+            job.log(f"Copying '{dest_name}'...")
+
+            if os.path.isdir(asset_path):
+                shutil.copytree(asset_path, destination_path, dirs_exist_ok=True)
+                job.log(f"Successfully copied directory '{dest_name}'.")
+            else:
+                shutil.copy2(asset_path, destination_path)
+                job.log(f"Successfully copied file '{dest_name}'.")
+        except Exception as e:
+            job.log(f"[ERROR] Failed to copy asset {asset_path}: {e}")
+            logging.error(f"Error copying asset {asset_path}", exc_info=True)
+
+
+def run_job(job: ExportJob) -> None:
+    """Runs an export job on its own thread, reporting through the job's events."""
+    job.emit("status", status="running")
+    job.log("Starting process...")
+    config = job.config
+    status = "completed"
+    try:
+        if not config.export_destination or not os.path.isdir(config.export_destination):
+            job.log(f"[ERROR] Export destination '{config.export_destination}' is not a valid directory.")
+            status = "failed"
+            return
+
+        if config.repositories:
+            job.log("--- Processing repositories for export ---")
+            export_repositories(job)
+            job.progress.check()
+
+        if config.assets_to_copy:
+            job.log("--- Copying specified assets ---")
+            copy_assets(job)
+
+        job.log("All tasks completed.")
+    except ExportCancelled:
+        status = "cancelled"
+        job.log("Export cancelled.")
+    except Exception as e:
+        status = "failed"
+        job.log(f"[ERROR] Export failed: {e}")
+        logging.error("Export job failed", exc_info=True)
+    finally:
+        if job.progress.cancelled and status == "completed":
+            status = "cancelled"
+        job.emit("progress", **job.progress.snapshot())
+        job.emit("status", status=status)
+
+
+job_manager = JobManager()
+
+
+def format_event(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def run_export_logic(config: Config) -> AsyncGenerator[str, None]:
+    """Runs an export as a job, yielding its log lines as plain SSE messages."""
+    app_main.setup_logging()
+    job = job_manager.start(config)
+    async for event in job.iter_events():
+        if event["type"] == "log":
+            yield f"data: {event['message']}\n\n"
 
 
 @app.post("/api/run-export")
@@ -134,6 +294,51 @@ async def run_export(config: Config) -> StreamingResponse:
     return StreamingResponse(run_export_logic(config), media_type="text/event-stream")
 
 
+@app.post("/api/jobs")
+async def start_job(config: Config) -> dict:
+    app_main.setup_logging()
+    return job_manager.start(config).summary()
+
+
+@app.get("/api/jobs")
+async def list_jobs() -> List[dict]:
+    return [job.summary() for job in job_manager.jobs.values()]
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str) -> dict:
+    return job_manager.get(job_id).summary()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str) -> StreamingResponse:
+    """Streams the job's log, progress and status events as JSON server-sent events."""
+    job = job_manager.get(job_id)
+
+    async def stream() -> AsyncGenerator[str, None]:
+        async for event in job.iter_events():
+            yield format_event(event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/api/metrics")
+async def get_metrics() -> dict:
+    """Returns the stage timings and counters of every export run by this server."""
+    return metrics.snapshot()
+
+
+@app.post("/api/metrics/reset")
+async def reset_metrics() -> dict:
+    metrics.reset()
+    return {"status": "success"}
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str) -> dict:
+    return job_manager.cancel(job_id).summary()
+
+
 # --- Uvicorn runner ---
 if __name__ == "__main__":
     print("Starting Export-for-AI web UI...")